@@ -1,22 +1,44 @@
 from flask import Flask, redirect, url_for, flash, render_template, request
-from config import Config
-from extensions import db, migrate, login_manager, csrf
-from flask_socketio import SocketIO
+from extensions import db, migrate, login_manager, csrf, socketio
 from flask_cors import CORS
-from models.models import User, House, ChatMessage, SupportTicket  # Added SupportTicket
+from models.models import User, House
 from flask_login import login_required, current_user
-from sqlalchemy.exc import IntegrityError
-from datetime import datetime
+import importlib
 import os
 import logging
 
-def create_app():
+# (module, attribute) of every blueprint; imported only when an app is built
+BLUEPRINTS = [
+    ('routes.auth_routes', 'auth_bp'),
+    ('routes.landlord_routes', 'landlord_bp'),
+    ('routes.tenant_routes', 'tenant_bp'),
+    ('routes.admin_routes', 'admin_bp'),
+    ('routes.service_routes', 'service_provider_bp'),
+    ('routes.house_routes', 'house_bp'),
+    ('routes.main', 'main_bp'),
+    ('routes.support_routes', 'support_bp'),
+    ('routes.notification_routes', 'notification_bp'),
+    ('routes.message_routes', 'message_bp'),
+]
+
+
+def create_app(config_object=None, pool_role='web'):
+    """
+    Build the application. Nothing is created at import time; use
+    `flask --app app ...`, `gunicorn 'app:create_app()'` or get_app().
+    pool_role picks the connection pool sizing ('web' or 'worker').
+    """
+    if config_object is None:
+        from dotenv import load_dotenv
+        load_dotenv()
+        from config import Config as config_object
+
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_object)
     
     # Ensure critical configurations are set
     app.config['SECRET_KEY'] = app.config.get('SECRET_KEY', 'your-secure-secret-key')
-    app.config['SQLALCHEMY_DATABASE_URI'] = app.config.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///app.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = app.config.get('SQLALCHEMY_DATABASE_URI') or 'sqlite:///app.db'
     app.config['UPLOAD_FOLDER'] = app.config.get('UPLOAD_FOLDER', 'static/images')
     app.config['CHAT_UPLOAD_FOLDER'] = app.config.get('CHAT_UPLOAD_FOLDER', 'static/uploads/chat')
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}  # For chat file uploads
@@ -27,21 +49,40 @@ def create_app():
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
 
-    print("Final DB URI =", app.config['SQLALCHEMY_DATABASE_URI'])
-    print("UPLOAD_FOLDER =", app.config['UPLOAD_FOLDER'])
-    print("CHAT_UPLOAD_FOLDER =", app.config['CHAT_UPLOAD_FOLDER'])
+    logger.debug(f"UPLOAD_FOLDER={app.config['UPLOAD_FOLDER']} "
+                 f"CHAT_UPLOAD_FOLDER={app.config['CHAT_UPLOAD_FOLDER']}")
 
     # Create chat upload directory
     os.makedirs(app.config['CHAT_UPLOAD_FOLDER'], exist_ok=True)
 
     # Init extensions
+    from services import database, replicas
+    database.configure(app, role=pool_role)
+    replicas.configure(app)
     db.init_app(app)
+    database.init_app(app)
+    replicas.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     csrf.init_app(app)
-    socketio = SocketIO(app, cors_allowed_origins="*")
+    # Bind the shared instance so handlers registered on extensions.socketio are live
+    socketio.init_app(app, cors_allowed_origins="*",
+                      message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
     CORS(app)
 
+    from services import assets, audit, identity, idempotency, jobs, mpesa, presence, sessions, support_queue
+    from services.passwords import hasher
+    assets.init_app(app)
+    sessions.init_app(app)
+    audit.init_app(app)
+    hasher.init_app(app)
+    identity.init_app(app)
+    idempotency.init_app(app)
+    mpesa.init_app(app)
+    presence.init_app(app)
+    support_queue.init_app(app)
+    jobs.load_handlers()
+
     # Exempt Socket.IO routes from CSRF (since chat.html uses WebSocket)
     csrf.exempt('routes.support_routes.support_bp')
 
@@ -49,86 +90,28 @@ def create_app():
     @login_manager.user_loader
     def load_user(user_id):
         try:
-            return User.query.get(int(user_id))
+            user = User.query.get(int(user_id))
+            # Deactivated accounts lose existing sessions and remember-me cookies too
+            return user if user and user.is_active else None
         except Exception as e:
             logger.error(f"Error loading user {user_id}: {str(e)}")
             return None
 
-    # Jinja filters
-    def timeago(value):
-        """Format datetime into 'time ago' string with localization (English/Swahili)."""
-        if not isinstance(value, datetime):
-            return value
-        lang = getattr(current_user, "language", "en") if current_user.is_authenticated else "en"
-        now = datetime.utcnow()
-        diff = now - value
-        seconds = diff.total_seconds()
-        minutes = divmod(seconds, 60)[0]
-        hours = divmod(seconds, 3600)[0]
-        days = divmod(seconds, 86400)[0]
-        if lang == "sw":
-            if seconds < 60:
-                return "sasa hivi"
-            elif minutes < 60:
-                return f"dakika {int(minutes)} zilizopita"
-            elif hours < 24:
-                return f"masaa {int(hours)} yaliyopita"
-            elif days == 1:
-                return "jana"
-            elif days < 7:
-                return f"siku {int(days)} zilizopita"
-            elif days < 30:
-                return f"wiki {int(days // 7)} zilizopita"
-            elif days < 365:
-                return f"miezi {int(days // 30)} iliyopita"
-            else:
-                return f"miaka {int(days // 365)} iliyopita"
-        else:
-            if seconds < 60:
-                return "just now"
-            elif minutes < 60:
-                return f"{int(minutes)} minute(s) ago"
-            elif hours < 24:
-                return f"{int(hours)} hour(s) ago"
-            elif days == 1:
-                return "yesterday"
-            elif days < 7:
-                return f"{int(days)} day(s) ago"
-            elif days < 30:
-                return f"{int(days // 7)} week(s) ago"
-            elif days < 365:
-                return f"{int(days // 30)} month(s) ago"
-            else:
-                return f"{int(days // 365)} year(s) ago"
-
-    def datetimeformat(value, format="%Y-%m-%d %H:%M"):
-        """Format datetime into a standard string (default: 2025-08-27 14:30)."""
-        if not isinstance(value, datetime):
-            return value
-        return value.strftime(format)
-
-    # Register filters
-    app.jinja_env.filters['timeago'] = timeago
-    app.jinja_env.filters['datetimeformat'] = datetimeformat
+    # Jinja filters (timeago, datetimeformat) backed by the catalogs in locales/
+    from services import localization
+    localization.init_app(app)
 
     # Blueprints
-    from routes.auth_routes import auth_bp
-    from routes.landlord_routes import landlord_bp
-    from routes.tenant_routes import tenant_bp
-    from routes.admin_routes import admin_bp
-    from routes.service_routes import service_provider_bp
-    from routes.house_routes import house_bp
-    from routes.main import main_bp
-    from routes.support_routes import support_bp
-
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(landlord_bp)
-    app.register_blueprint(tenant_bp)
-    app.register_blueprint(admin_bp)
-    app.register_blueprint(service_provider_bp)
-    app.register_blueprint(house_bp)
-    app.register_blueprint(main_bp)
-    app.register_blueprint(support_bp)
+    for module_name, attribute in BLUEPRINTS:
+        app.register_blueprint(getattr(importlib.import_module(module_name), attribute))
+
+    # CLI commands
+    from commands import register_commands
+    register_commands(app)
+
+    # Compile templates once all blueprints (and their template folders) are in
+    from services import templating
+    templating.init_app(app)
 
     # Routes
     @app.route('/')
@@ -151,7 +134,11 @@ def create_app():
         email = request.form.get("email")
         if email:
             try:
-                # TODO: save email to DB or send confirmation
+                jobs.enqueue("email.send", {
+                    "to": email,
+                    "subject": "You're subscribed to HomeHub",
+                    "body": "Thanks for subscribing! We'll keep you posted on new listings.",
+                }, idempotency_key=f"subscribe:{email.strip().lower()}")
                 logger.info(f"Subscription attempt with email: {email}")
                 flash(f"Subscribed successfully with {email}", "success")
             except Exception as e:
@@ -180,13 +167,30 @@ def create_app():
             flash("Unrecognized role. Contact system administrator.", "danger")
             return redirect(url_for('auth.logout'))
 
-    return app, socketio
+    return app
+
+
+_app = None
+
+
+def get_app():
+    """The process-wide app, built on first use."""
+    global _app
+    if _app is None:
+        _app = create_app()
+    return _app
+
+
+def __getattr__(name):
+    # Keeps `from app import app` working without building the app on import
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Create app and socketio
-app, socketio = create_app()
 
 # Run
 if __name__ == '__main__':
+    app = get_app()
     with app.app_context():
         try:
             db.create_all()  # Create tables if needed
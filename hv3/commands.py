@@ -0,0 +1,162 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+# ---------------- flask import-houses ----------------
+@click.command('import-houses')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--owner-id', type=int, default=None, help='Landlord user id to assign to every imported house.')
+@click.option('--chunk-size', type=int, default=None, help='Rows per bulk insert (default IMPORT_CHUNK_SIZE).')
+@click.option('--workers', type=int, default=None, help='Image worker threads (default IMPORT_IMAGE_WORKERS).')
+@click.option('--restart', is_flag=True, help='Ignore a previous checkpoint and start from the first row.')
+@with_appcontext
+def import_houses_command(path, owner_id, chunk_size, workers, restart):
+    """Bulk-import houses from a CSV or JSON-lines file; image paths are read from IMPORT_FOLDER."""
+    from services.house_import import import_houses
+
+    report = import_houses(
+        path,
+        upload_folder=current_app.config['UPLOAD_FOLDER'],
+        image_root=current_app.config['IMPORT_FOLDER'],
+        image_hosts=current_app.config['IMPORT_IMAGE_HOSTS'],
+        owner_id=owner_id,
+        chunk_size=chunk_size or current_app.config['IMPORT_CHUNK_SIZE'],
+        image_workers=workers or current_app.config['IMPORT_IMAGE_WORKERS'],
+        resume=not restart,
+    )
+    click.echo(f"Inserted {report.inserted}, rejected {report.rejected}, "
+               f"skipped {report.skipped} already-imported row(s).")
+    if report.rejected:
+        click.echo(f"Rejected rows written to {report.rejects_path}")
+
+
+# ---------------- flask backfill-identifiers ----------------
+@click.command('backfill-identifiers')
+@click.option('--batch-size', type=int, default=1000)
+@with_appcontext
+def backfill_identifiers_command(batch_size):
+    """Create normalized login identifiers for existing users."""
+    from services.identity import backfill_identifiers
+
+    count = backfill_identifiers(batch_size=batch_size)
+    click.echo(f"Synced identifiers for {count} user(s).")
+
+
+# ---------------- flask backfill-conversations ----------------
+@click.command('backfill-conversations')
+@click.option('--batch-size', type=int, default=1000)
+@with_appcontext
+def backfill_conversations_command(batch_size):
+    """Group existing direct messages into conversations."""
+    from services.conversations import backfill
+
+    count = backfill(batch_size=batch_size)
+    click.echo(f"Attached {count} message(s) to conversations.")
+
+
+# ---------------- flask backfill-pending-slots ----------------
+@click.command('backfill-pending-slots')
+@click.option('--batch-size', type=int, default=1000)
+@with_appcontext
+def backfill_pending_slots_command(batch_size):
+    """Mark existing pending bookings so one pending request per tenant and house is enforced."""
+    from services.availability import backfill_pending_slots
+
+    slotted, duplicates = backfill_pending_slots(batch_size=batch_size)
+    click.echo(f"Marked {slotted} pending booking(s).")
+    if duplicates:
+        click.echo(f"Left {duplicates} duplicate pending request(s) unmarked; review them by hand.")
+
+
+# ---------------- flask worker ----------------
+def _run_worker(job_types):
+    import signal
+    from app import create_app
+    from services.jobs import Worker
+
+    # A fresh app per worker process: its own engine sized by DB_WORKER_* and
+    # no connections inherited from the parent
+    app = create_app(pool_role='worker')
+    worker = Worker(
+        app,
+        job_types=job_types,
+        poll_interval=app.config['JOB_POLL_INTERVAL'],
+        batch_size=app.config['JOB_BATCH_SIZE'],
+        lock_timeout=app.config['JOB_LOCK_TIMEOUT'],
+    )
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+@click.command('worker')
+@click.option('--processes', '-p', type=int, default=1, help='Worker processes to start.')
+@click.option('--types', default='', help='Comma-separated job types to run (default: all).')
+@with_appcontext
+def worker_command(processes, types):
+    """Run background job workers until interrupted."""
+    import multiprocessing
+    from extensions import db
+
+    job_types = [t.strip() for t in types.split(',') if t.strip()] or None
+    # The CLI's own app only loaded the command; release anything it opened
+    db.engine.dispose()
+    if processes <= 1:
+        _run_worker(job_types)
+        return
+
+    context = multiprocessing.get_context('fork')
+    children = [context.Process(target=_run_worker, args=(job_types,), name=f"worker-{i}")
+                for i in range(processes)]
+    for child in children:
+        child.start()
+    click.echo(f"Started {processes} job worker(s).")
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.join()
+
+
+# ---------------- flask build-assets ----------------
+@click.command('build-assets')
+@click.option('--no-minify', is_flag=True, help='Fingerprint and compress without minifying.')
+@with_appcontext
+def build_assets_command(no_minify):
+    """Write fingerprinted, precompressed CSS/JS bundles and their manifest."""
+    from services.assets import build_assets
+
+    manifest = build_assets(current_app.static_folder, current_app.config['ASSETS_DIST'],
+                            minify=not no_minify)
+    for source, built in sorted(manifest.items()):
+        click.echo(f"{source} -> {built}")
+    click.echo("Restart the web processes to pick up the new manifest.")
+
+
+# ---------------- flask compile-templates ----------------
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+    """Compile every template into the shared bytecode cache."""
+    from services.templating import compile_templates
+
+    compiled, errors = compile_templates(current_app)
+    for name, error in sorted(errors.items()):
+        click.echo(f"{name}: {error}", err=True)
+    click.echo(f"Compiled {compiled} template(s) into {current_app.config['TEMPLATE_CACHE_DIR']}.")
+    if errors:
+        raise SystemExit(1)
+
+
+def register_commands(app):
+    app.cli.add_command(import_houses_command)
+    app.cli.add_command(backfill_identifiers_command)
+    app.cli.add_command(backfill_conversations_command)
+    app.cli.add_command(backfill_pending_slots_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(compile_templates_command)
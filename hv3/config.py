@@ -1,19 +1,174 @@
 # config.py
 import os
-from dotenv import load_dotenv
+from datetime import timedelta
 
-# Load environment variables from .env file
-load_dotenv()
+# Values are read from the environment when this module is imported. create_app
+# loads .env first; nothing here should print or touch the network.
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pools (services/database.py). Job workers get their own, smaller pool.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_WORKER_POOL_SIZE = int(os.environ.get('DB_WORKER_POOL_SIZE', 2))
+    DB_WORKER_MAX_OVERFLOW = int(os.environ.get('DB_WORKER_MAX_OVERFLOW', 2))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # below MySQL wait_timeout
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_SATURATION_WARN = float(os.environ.get('DB_SATURATION_WARN', 0.9))
+
+    # Read replica (services/replicas.py) for @read_only views. DB_REPLICA_MODE=sqlite
+    # keeps a periodically refreshed copy of a SQLite primary for local testing.
+    DB_REPLICA_URL = os.environ.get('DB_REPLICA_URL')
+    DB_REPLICA_MODE = os.environ.get('DB_REPLICA_MODE', '')
+    DB_REPLICA_SQLITE_PATH = os.environ.get(
+        'DB_REPLICA_SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'instance', 'replica.db')
+    )
+    DB_REPLICA_SYNC_INTERVAL = float(os.environ.get('DB_REPLICA_SYNC_INTERVAL', 5))
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+
+    # Seconds between full rebuilds of the in-memory booking availability index
+    AVAILABILITY_REFRESH = int(os.environ.get('AVAILABILITY_REFRESH', 60))
+
+    # Idempotent POSTs (services/idempotency.py)
+    IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+    IDEMPOTENCY_WINDOW = int(os.environ.get('IDEMPOTENCY_WINDOW', 30))  # derived keys
+    IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 5))
+
+    # Rent ledger (services/ledger.py): charges are posted this many days ahead,
+    # for this many leases per job
+    LEDGER_HORIZON_DAYS = int(os.environ.get('LEDGER_HORIZON_DAYS', 31))
+    LEDGER_BATCH_SIZE = int(os.environ.get('LEDGER_BATCH_SIZE', 500))
+
+    # M-Pesa (services/mpesa.py). Point MPESA_BASE_URL at mpesa_simulator.py to run offline.
+    MPESA_BASE_URL = os.environ.get('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
+    MPESA_CONSUMER_KEY = os.environ.get('MPESA_CONSUMER_KEY')
+    MPESA_CONSUMER_SECRET = os.environ.get('MPESA_CONSUMER_SECRET')
+    MPESA_SHORTCODE = os.environ.get('MPESA_SHORTCODE')
+    MPESA_PASSKEY = os.environ.get('MPESA_PASSKEY')
+    # Public URL Daraja posts results to: <host>/payments/mpesa/callback/<MPESA_CALLBACK_TOKEN>
+    MPESA_CALLBACK_URL = os.environ.get('MPESA_CALLBACK_URL')
+    MPESA_CALLBACK_TOKEN = os.environ.get('MPESA_CALLBACK_TOKEN')
+    MPESA_ACK_TIMEOUT = float(os.environ.get('MPESA_ACK_TIMEOUT', 5))
+    MPESA_INBOX_QUEUE_SIZE = int(os.environ.get('MPESA_INBOX_QUEUE_SIZE', 20000))
+    MPESA_INBOX_BATCH_SIZE = int(os.environ.get('MPESA_INBOX_BATCH_SIZE', 500))
+    MPESA_RECONCILE_BATCH_SIZE = int(os.environ.get('MPESA_RECONCILE_BATCH_SIZE', 1000))
+    # Callbacks still unmatched after this long are given up on
+    MPESA_ORPHAN_TTL = int(os.environ.get('MPESA_ORPHAN_TTL', 3600))
+
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'images')
 
-    # Debug print statements
-    print("Loaded DB URI:", os.getenv("DATABASE_URL"))
-    print("Loaded UPLOAD_FOLDER:", UPLOAD_FOLDER)
+    # Bulk house import (flask import-houses / admin upload)
+    IMPORT_FOLDER = os.path.join(os.path.dirname(__file__), 'instance', 'imports')
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+    IMPORT_IMAGE_WORKERS = int(os.environ.get('IMPORT_IMAGE_WORKERS', 4))
+    # Image paths in import files are read from under IMPORT_FOLDER; image URLs are
+    # fetched (https only) from these comma-separated hosts, none by default
+    IMPORT_IMAGE_HOSTS = [h.strip() for h in os.environ.get('IMPORT_IMAGE_HOSTS', '').split(',') if h.strip()]
+
+    # Background XLSX exports (admin.export_reports?format=xlsx)
+    EXPORT_FOLDER = os.path.join(os.path.dirname(__file__), 'instance', 'exports')
+
+    # Audit log writer (services/audit.py)
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0))
+
+    # Landlord reports (services/reports.py)
+    REPORTS_WINDOW_MONTHS = int(os.environ.get('REPORTS_WINDOW_MONTHS', 12))
+    # Also how long a payment confirmed by the job worker can take to show up
+    REPORTS_CACHE_TTL = int(os.environ.get('REPORTS_CACHE_TTL', 60))
+    REPORTS_EXPORT_MAX_YEARS = int(os.environ.get('REPORTS_EXPORT_MAX_YEARS', 10))
+    # Sidebar numbers on every landlord page; this process's own writes refresh them at once
+    LANDLORD_STATS_TTL = int(os.environ.get('LANDLORD_STATS_TTL', 60))
+
+    # Password hashing (services/passwords.py). Algorithm is 'argon2id' (needs
+    # argon2-cffi) or a werkzeug method string such as 'scrypt' or
+    # 'pbkdf2:sha256:600000'. Changing it rehashes each user on next login.
+    PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt')
+    PASSWORD_HASH_PARAMS = {
+        'time_cost': int(os.environ.get('ARGON2_TIME_COST', 3)),
+        'memory_cost': int(os.environ.get('ARGON2_MEMORY_COST', 65536)),
+        'parallelism': int(os.environ.get('ARGON2_PARALLELISM', 4)),
+    }
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+    # Login identifier lookups (services/identity.py)
+    IDENTITY_NEGATIVE_CACHE_SIZE = int(os.environ.get('IDENTITY_NEGATIVE_CACHE_SIZE', 50000))
+    IDENTITY_NEGATIVE_CACHE_TTL = int(os.environ.get('IDENTITY_NEGATIVE_CACHE_TTL', 300))
+
+    # Background jobs (services/jobs.py, run with `flask worker`)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+    JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', 10))
+    JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))
+    # Finished jobs are purged hourly; periodic ones add ~17k rows a day
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 3))
+    JOB_DEAD_RETENTION_DAYS = int(os.environ.get('JOB_DEAD_RETENTION_DAYS', 30))
+
+    # Outgoing mail/SMS. 'stub' writes messages to OUTBOX_FOLDER instead of sending.
+    MAIL_BACKEND = os.environ.get('MAIL_BACKEND', 'stub')  # stub, smtp
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'localhost')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 25))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'false').lower() == 'true'
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'no-reply@homehub.africa')
+    SMS_BACKEND = os.environ.get('SMS_BACKEND', 'stub')
+    SUPPORT_EMAIL = os.environ.get('SUPPORT_EMAIL', 'support@homehub.africa')
+    OUTBOX_FOLDER = os.path.join(os.path.dirname(__file__), 'instance', 'outbox')
+
+    # Socket.IO. A message queue (e.g. redis://localhost:6379/0) lets job workers
+    # and multiple web processes emit to the same connected clients.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+
+    # Support chat queue (services/support_queue.py). Capacity is the most open
+    # conversations one agent is given; urgent chats jump that many seconds ahead.
+    SUPPORT_AGENT_CAPACITY = int(os.environ.get('SUPPORT_AGENT_CAPACITY', 5))
+    SUPPORT_URGENT_HEADSTART = int(os.environ.get('SUPPORT_URGENT_HEADSTART', 600))
+    SUPPORT_QUEUE_SHARDS = int(os.environ.get('SUPPORT_QUEUE_SHARDS', 8))
+    SUPPORT_QUEUE_REFRESH = int(os.environ.get('SUPPORT_QUEUE_REFRESH', 10))
+
+    # Presence (services/presence.py). Pages that send heartbeats are dropped after
+    # PRESENCE_TIMEOUT seconds of silence; changes go out every PRESENCE_FLUSH_INTERVAL.
+    PRESENCE_HEARTBEAT_INTERVAL = int(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL', 25))
+    PRESENCE_TIMEOUT = int(os.environ.get('PRESENCE_TIMEOUT', 75))
+    PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL', 2.0))
+    PRESENCE_SNAPSHOT_INTERVAL = int(os.environ.get('PRESENCE_SNAPSHOT_INTERVAL', 30))
+    PRESENCE_CHANNEL = os.environ.get('PRESENCE_CHANNEL', 'homehub-presence')
+
+    # Announcement fan-out (services/announcements.py)
+    ANNOUNCEMENT_CHUNK_SIZE = int(os.environ.get('ANNOUNCEMENT_CHUNK_SIZE', 1000))
+
+    # Server-side sessions (services/sessions.py): cookie, memory, sqlite or redis
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+    SESSION_SQLITE_PATH = os.environ.get(
+        'SESSION_SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'instance', 'sessions.db')
+    )
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/1')
+    SESSION_MEMORY_SIZE = int(os.environ.get('SESSION_MEMORY_SIZE', 10000))
+    SESSION_TOUCH_BATCH = int(os.environ.get('SESSION_TOUCH_BATCH', 100))
+    SESSION_TOUCH_INTERVAL = int(os.environ.get('SESSION_TOUCH_INTERVAL', 30))
+    PERMANENT_SESSION_LIFETIME = timedelta(days=int(os.environ.get('SESSION_LIFETIME_DAYS', 7)))
+
+    # Static asset pipeline (services/assets.py); built by `flask build-assets`
+    ASSETS_DIST = 'dist'
+    ASSETS_DEBUG = os.environ.get('ASSETS_DEBUG', 'false').lower() == 'true'
+
+    # Templates (services/templating.py). Compiled bytecode is shared by workers;
+    # warmup compiles every template at startup when not in debug.
+    TEMPLATE_CACHE_DIR = os.environ.get(
+        'TEMPLATE_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'instance', 'jinja_cache')
+    )
+    TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', 'true').lower() == 'true'
+
+    # Localization (services/localization.py): one JSON catalog per language
+    LOCALE_FOLDER = os.path.join(os.path.dirname(__file__), 'locales')
+    DEFAULT_LOCALE = os.environ.get('DEFAULT_LOCALE', 'en')
 
 # Commented-out version 1
 #import os
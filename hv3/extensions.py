@@ -4,8 +4,10 @@ from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 from flask_socketio import SocketIO   # 👈 add this
 
-# Database
-db = SQLAlchemy()
+from services.replicas import RoutingSession
+
+# Database; RoutingSession sends @read_only views to the replica bind when one is configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Migrations
 migrate = Migrate()
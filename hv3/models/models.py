@@ -1,7 +1,8 @@
 from extensions import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from services.passwords import hasher
 from datetime import datetime
+from sqlalchemy import event
 
 
 class User(db.Model, UserMixin):
@@ -16,6 +17,10 @@ class User(db.Model, UserMixin):
     mpesa_details = db.Column(db.String(50), nullable=True)
     profile_picture = db.Column(db.String(255), nullable=True)
     language = db.Column(db.String(10), default='en')
+    # Overrides UserMixin.is_active so admins can deactivate accounts
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default='1')
+    # Counter cache maintained by services/notifications.py
+    unread_notification_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     houses = db.relationship('House', backref='owner', lazy=True)
@@ -56,12 +61,35 @@ class User(db.Model, UserMixin):
     # Support tickets
     support_tickets = db.relationship('SupportTicket', back_populates='user', lazy=True)
 
-    # Password utils
+    # Normalized login identifiers (kept in sync by services/identity.py)
+    identifiers = db.relationship(
+        'UserIdentifier',
+        backref='user',
+        lazy=True,
+        cascade="all, delete-orphan"
+    )
+
+    # Password utils (hashing runs on the services.passwords process pool)
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+
+    def rehash_password_if_needed(self, password):
+        """Upgrade the stored hash after a successful login; returns True if changed."""
+        if hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+            return True
+        return False
+
+
+class UserIdentifier(db.Model):
+    """Lower-cased email or E.164 phone number that resolves to one user."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # email, phone
+    value = db.Column(db.String(100), unique=True, nullable=False)
 
 
 class House(db.Model):
@@ -149,7 +177,24 @@ class Booking(db.Model):
     house_id = db.Column(db.Integer, db.ForeignKey('house.id'))
     status = db.Column(db.String(50))
     lease_start_date = db.Column(db.Date)
-    lease_end_date = db.Column(db.Date)
+    lease_end_date = db.Column(db.Date)  # exclusive: a new lease may start on this day
+    # 1 while the booking is pending, otherwise NULL. NULLs never collide, so the
+    # unique constraint below allows one pending request per tenant and house
+    # (a portable stand-in for a partial index WHERE status = 'pending').
+    pending_slot = db.Column(db.SmallInteger, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'house_id', 'pending_slot', name='uq_booking_one_pending'),
+        # Overlap checks for one house: house/status narrow it, then a range scan on the dates
+        db.Index('ix_booking_house_status_dates', 'house_id', 'status', 'lease_start_date', 'lease_end_date'),
+        # Rebuilding the availability index reads current and future leases only
+        db.Index('ix_booking_end_date', 'lease_end_date'),
+    )
+
+@event.listens_for(Booking.status, 'set')
+def _track_pending(booking, value, oldvalue, initiator):
+    booking.pending_slot = 1 if value == 'pending' else None
+
 
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -158,13 +203,53 @@ class Document(db.Model):
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class Conversation(db.Model):
+    """
+    A direct-message thread between two users, stored once per pair with the
+    lower user id first. The latest message and each side's unread count are
+    copied here so an inbox never has to look at the messages.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    last_message_preview = db.Column(db.String(200), nullable=True)
+    last_sender_id = db.Column(db.Integer, nullable=True)
+    unread_low = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    unread_high = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_pair'),
+        # An inbox is a range scan on each side's index, newest first
+        db.Index('ix_conversation_low_last', 'user_low_id', 'last_message_at'),
+        db.Index('ix_conversation_high_last', 'user_high_id', 'last_message_at'),
+    )
+
+    def other_id(self, user_id):
+        return self.user_high_id if user_id == self.user_low_id else self.user_low_id
+
+    def unread_for(self, user_id):
+        return self.unread_low if user_id == self.user_low_id else self.unread_high
+
+    def has_member(self, user_id):
+        return user_id in (self.user_low_id, self.user_high_id)
+
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     content = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
 
+    __table_args__ = (
+        # Thread pages: keyset pagination on id within one conversation
+        db.Index('ix_message_conversation_id', 'conversation_id', 'id'),
+    )
+
 
 class ServiceProvider(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -181,18 +266,45 @@ class ServiceProvider(db.Model):
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tenant_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    amount = db.Column(db.Float, nullable=False)
+    house_id = db.Column(db.Integer, db.ForeignKey('house.id'), nullable=True)
+    amount = db.Column(db.Numeric(12, 2), nullable=False)  # exact; read back as Decimal
     date = db.Column(db.Date, nullable=False)
     due_date = db.Column(db.Date)
-    status = db.Column(db.String(20), default='Pending')
+    status = db.Column(db.String(20), default='Pending')  # Pending, Paid, Failed
+    # M-Pesa CheckoutRequestID; callbacks are matched to payments on it
+    reference = db.Column(db.String(64), unique=True, nullable=True)
+    receipt = db.Column(db.String(32), unique=True, nullable=True)  # MpesaReceiptNumber
+    confirmed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_payment_tenant_status_due', 'tenant_id', 'status', 'due_date'),
+        # Landlord reports: collected rent per house and month
+        db.Index('ix_payment_house_status_date', 'house_id', 'status', 'date'),
+    )
 
 
 class MaintenanceRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tenant_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    house_id = db.Column(db.Integer, db.ForeignKey('house.id'), nullable=True)
     issue = db.Column(db.String(200), nullable=False)
     status = db.Column(db.String(20), default='Open')
     date_submitted = db.Column(db.DateTime, default=db.func.current_timestamp())
+    resolved_at = db.Column(db.DateTime, nullable=True)  # set when the status becomes resolved
+
+    __table_args__ = (
+        db.Index('ix_maintenance_house_submitted', 'house_id', 'date_submitted'),
+    )
+
+# Statuses that close a request; turnaround is date_submitted to resolved_at
+RESOLVED_STATUSES = ('resolved', 'closed', 'completed')
+
+@event.listens_for(MaintenanceRequest.status, 'set')
+def _track_resolved(maintenance_request, value, oldvalue, initiator):
+    if (value or '').lower() in RESOLVED_STATUSES:
+        maintenance_request.resolved_at = maintenance_request.resolved_at or datetime.utcnow()
+    else:
+        maintenance_request.resolved_at = None
 
 
 class Notification(db.Model):
@@ -200,6 +312,32 @@ class Notification(db.Model):
     tenant_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     message = db.Column(db.Text, nullable=False)
     date = db.Column(db.DateTime, default=db.func.current_timestamp())
+    announcement_id = db.Column(db.Integer, db.ForeignKey('announcement.id'), nullable=True)
+    is_read = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+
+    __table_args__ = (
+        # One copy of an announcement per user, even if a fan-out chunk is retried
+        db.UniqueConstraint('announcement_id', 'tenant_id', name='uq_notification_announcement_user'),
+        db.Index('ix_notification_tenant_date', 'tenant_id', 'date'),
+        db.Index('ix_notification_tenant_unread', 'tenant_id', 'is_read'),
+    )
+
+
+class Announcement(db.Model):
+    """A message stored once and fanned out to its audience (see services/announcements.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    message = db.Column(db.Text, nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    # Targeting; any combination, all empty means everyone
+    audience_role = db.Column(db.String(20), nullable=True)
+    audience_city = db.Column(db.String(100), nullable=True)
+    audience_house_id = db.Column(db.Integer, db.ForeignKey('house.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, delivering, done
+    total_recipients = db.Column(db.Integer, nullable=True)
+    delivered_count = db.Column(db.Integer, nullable=False, default=0)
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)  # fan-out cursor
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
 
 
 class Event(db.Model):
@@ -217,6 +355,15 @@ class ChatMessage(db.Model):
     message = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
     is_read = db.Column(db.Boolean, default=False)
+    # Replies are stored on the user's chat (user_id) and written by support_agent_id
+    from_agent = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+
+    __table_args__ = (
+        # A user's history and the chat rate limit
+        db.Index('ix_chat_message_user_time', 'user_id', 'timestamp'),
+        # Open conversations for the support queue (services/support_queue.py)
+        db.Index('ix_chat_message_open', 'is_read', 'user_id', 'support_agent_id'),
+    )
 
     # Relationships (use back_populates to avoid conflicts)
     user = db.relationship('User', foreign_keys=[user_id], back_populates='sent_chat_messages')
@@ -239,3 +386,143 @@ class SupportTicket(db.Model):
 
     # Relationship
     user = db.relationship('User', back_populates='support_tickets')
+
+
+# ----------------- AuditEvent -----------------
+class AuditEvent(db.Model):
+    """Append-only audit trail. Rows are only ever inserted (see services/audit.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    # YYYYMM bucket so old months can be archived/dropped as a unit
+    partition = db.Column(db.String(6), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # No foreign key: events must outlive the users they mention
+    actor_id = db.Column(db.Integer, nullable=True, index=True)
+    action = db.Column(db.String(64), nullable=False, index=True)
+    target_type = db.Column(db.String(32), nullable=True)
+    target_id = db.Column(db.String(64), nullable=True)
+    ip_address = db.Column(db.String(45), nullable=True)
+    detail = db.Column(db.Text, nullable=True)  # JSON
+
+    __table_args__ = (
+        db.Index('ix_audit_event_partition_created', 'partition', 'created_at'),
+        db.Index('ix_audit_event_target', 'target_type', 'target_id'),
+    )
+
+
+# ----------------- Job -----------------
+class Job(db.Model):
+    """Durable background job (see services/jobs.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(64), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=True)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    idempotency_key = db.Column(db.String(128), unique=True, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+
+class JobTypeLock(db.Model):
+    """
+    One row per job type with a concurrency limit. Workers update it before
+    counting running jobs of that type, so their claims are serialized.
+    """
+    job_type = db.Column(db.String(64), primary_key=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+
+
+# ----------------- IdempotencyKey -----------------
+class IdempotencyKey(db.Model):
+    """A mutating request seen recently, with the response to replay (see services/idempotency.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    key_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of scope, user and key
+    scope = db.Column(db.String(64), nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, done
+    response_status = db.Column(db.Integer, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    response_location = db.Column(db.String(500), nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# ----------------- Ledger -----------------
+class LedgerEntry(db.Model):
+    """
+    One movement on a tenant's account for a house (see services/ledger.py).
+    Append-only: corrections are new 'adjustment' entries, never edits.
+    Positive amounts are owed by the tenant, negative amounts are credits.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    house_id = db.Column(db.Integer, db.ForeignKey('house.id'), nullable=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payment.id'), nullable=True)
+    kind = db.Column(db.String(20), nullable=False)  # charge, payment, adjustment
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+    balance_after_cents = db.Column(db.BigInteger, nullable=False)
+    due_date = db.Column(db.Date, nullable=True)  # charges only
+    description = db.Column(db.String(200), nullable=True)
+    # e.g. rent:<booking>:<YYYY-MM>; makes re-running the scheduler harmless
+    reference = db.Column(db.String(100), unique=True, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        # Statement and next-due lookups for one tenant
+        db.Index('ix_ledger_tenant_due', 'tenant_id', 'due_date'),
+        db.Index('ix_ledger_kind_due', 'kind', 'due_date'),
+        db.Index('ix_ledger_house_kind_due', 'house_id', 'kind', 'due_date'),
+    )
+
+    @property
+    def amount(self):
+        from services.ledger import from_cents
+        return from_cents(self.amount_cents)
+
+
+class LedgerBalance(db.Model):
+    """Running balance per tenant and house, updated with every LedgerEntry."""
+    tenant_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    # 0 for entries not tied to a house; a key column cannot be NULL
+    house_key = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    balance_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    last_entry_id = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def balance(self):
+        from services.ledger import from_cents
+        return from_cents(self.balance_cents)
+
+
+# ----------------- M-Pesa -----------------
+class MpesaCallback(db.Model):
+    """A Daraja callback as received, waiting to be reconciled (see services/mpesa.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    reference = db.Column(db.String(64), nullable=True, index=True)  # CheckoutRequestID
+    receipt = db.Column(db.String(32), nullable=True)
+    result_code = db.Column(db.Integer, nullable=True)
+    amount = db.Column(db.Numeric(12, 2), nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # queued, then applied, duplicate, stale, mismatch, conflict or orphaned
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # When the reconciler may next look at it; pushed back while its payment is missing
+    retry_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # The reconciler's work queue: queued rows that are due, oldest first
+        db.Index('ix_mpesa_callback_queue', 'status', 'retry_at', 'id'),
+    )
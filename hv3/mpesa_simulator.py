@@ -0,0 +1,198 @@
+"""
+Local stand-in for Safaricom's Daraja API, for development and load tests.
+
+    python mpesa_simulator.py serve [--port 8089] [--delay 2] [--failure-rate 0.1]
+                                    [--duplicate-rate 0.05]
+        Fake Daraja: OAuth and STK push endpoints. Each push is answered at
+        once and its callback posted to the request's CallBackURL after a
+        random delay, so callbacks arrive out of order and some twice. Run
+        the app with MPESA_BASE_URL=http://127.0.0.1:8089 and any consumer
+        key, shortcode and callback URL.
+
+    python mpesa_simulator.py load [--count 10000] [--threads 16] [--url URL]
+                                   [--failure-rate 0.1] [--duplicate-rate 0.05] [--reconcile]
+        Seed `count` pending payments, fire one callback for each (shuffled,
+        some repeated) at the callback endpoint and report throughput. Without
+        --url the callbacks go through the app in-process, so no network is
+        needed. --reconcile then runs the reconciler and reports its outcomes.
+"""
+import argparse
+import json
+import random
+import statistics
+import string
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def checkout_id():
+    return f"ws_CO_{datetime.now():%d%m%Y%H%M%S}{uuid.uuid4().hex[:10]}"
+
+
+def receipt_number():
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+def stk_callback(reference, amount, phone='254708374149', failed=False):
+    """Callback body in the shape Daraja sends for an STK push result."""
+    callback = {
+        'MerchantRequestID': uuid.uuid4().hex[:20],
+        'CheckoutRequestID': reference,
+        'ResultCode': 1032 if failed else 0,
+        'ResultDesc': 'Request cancelled by user' if failed else 'The service request is processed successfully.',
+    }
+    if not failed:
+        callback['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': amount},
+            {'Name': 'MpesaReceiptNumber', 'Value': receipt_number()},
+            {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+            {'Name': 'PhoneNumber', 'Value': int(phone)},
+        ]}
+    return {'Body': {'stkCallback': callback}}
+
+
+def post_json(url, body, timeout=10):
+    req = urllib.request.Request(url, data=json.dumps(body).encode('utf-8'), method='POST',
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return response.status
+
+
+# ---------------- Fake Daraja ----------------
+def serve(port, delay, failure_rate, duplicate_rate):
+    def deliver(url, body):
+        time.sleep(random.uniform(0, delay))
+        copies = 2 if random.random() < duplicate_rate else 1
+        for _ in range(copies):
+            try:
+                post_json(url, body)
+            except OSError as e:
+                print(f"callback to {url} failed: {e}")
+
+    class Daraja(BaseHTTPRequestHandler):
+        def _reply(self, body, status=200):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.startswith('/oauth/v1/generate'):
+                return self._reply({'access_token': uuid.uuid4().hex, 'expires_in': '3599'})
+            self._reply({'errorMessage': 'Not found'}, 404)
+
+        def do_POST(self):
+            if self.path != '/mpesa/stkpush/v1/processrequest':
+                return self._reply({'errorMessage': 'Not found'}, 404)
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            reference = checkout_id()
+            body = stk_callback(reference, request.get('Amount'), str(request.get('PhoneNumber')),
+                                failed=random.random() < failure_rate)
+            threading.Thread(target=deliver, args=(request['CallBackURL'], body), daemon=True).start()
+            self._reply({
+                'MerchantRequestID': body['Body']['stkCallback']['MerchantRequestID'],
+                'CheckoutRequestID': reference,
+                'ResponseCode': '0',
+                'ResponseDescription': 'Success. Request accepted for processing',
+                'CustomerMessage': 'Success. Request accepted for processing',
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Daraja)
+    print(f"Fake Daraja on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
+# ---------------- Load test ----------------
+def seed_payments(app, count):
+    """Pending payments with known references, owned by one throwaway tenant."""
+    from extensions import db
+    from models.models import Payment, User
+
+    with app.app_context():
+        db.create_all()
+        tenant = User(name='Load Test', email=f"loadtest-{uuid.uuid4().hex[:8]}@example.com",
+                      password_hash='!', role='tenant')
+        db.session.add(tenant)
+        db.session.flush()
+        payments = [{'tenant_id': tenant.id, 'amount': 1000 + i % 50, 'date': datetime.utcnow().date(),
+                     'status': 'Pending', 'reference': checkout_id()} for i in range(count)]
+        db.session.bulk_insert_mappings(Payment, payments)
+        db.session.commit()
+        return [(p['reference'], p['amount']) for p in payments]
+
+
+def load(count, threads, url, failure_rate, duplicate_rate, reconcile):
+    from app import create_app
+    app = create_app()
+    token = app.config['MPESA_CALLBACK_TOKEN'] or 'loadtest'
+    app.config['MPESA_CALLBACK_TOKEN'] = token
+
+    bodies = [stk_callback(ref, amount, failed=random.random() < failure_rate)
+              for ref, amount in seed_payments(app, count)]
+    bodies += random.sample(bodies, int(len(bodies) * duplicate_rate))
+    random.shuffle(bodies)
+
+    local = threading.local()
+
+    def send(body):
+        start = time.perf_counter()
+        if url:
+            status = post_json(url, body)
+        else:
+            if not hasattr(local, 'client'):
+                local.client = app.test_client()
+            status = local.client.post(f"/payments/mpesa/callback/{token}", json=body).status_code
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(send, bodies))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in results)
+    failed = sum(1 for status, _ in results if status != 200)
+    print(f"{len(bodies)} callbacks in {elapsed:.2f}s: {len(bodies) / elapsed:,.0f}/s, {failed} not acknowledged")
+    print(f"ack latency  p50 {statistics.median(latencies) * 1000:.1f} ms"
+          f"  p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms"
+          f"  max {latencies[-1] * 1000:.1f} ms")
+
+    if reconcile:
+        from services import mpesa
+        with app.app_context():
+            start = time.perf_counter()
+            outcomes = mpesa.reconcile()
+            elapsed = time.perf_counter() - start
+        print(f"reconciled in {elapsed:.2f}s: {outcomes}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_serve = sub.add_parser('serve')
+    p_serve.add_argument('--port', type=int, default=8089)
+    p_serve.add_argument('--delay', type=float, default=2.0, help='max seconds before a callback is sent')
+    p_serve.add_argument('--failure-rate', type=float, default=0.1)
+    p_serve.add_argument('--duplicate-rate', type=float, default=0.05)
+    p_load = sub.add_parser('load')
+    p_load.add_argument('--count', type=int, default=10000)
+    p_load.add_argument('--threads', type=int, default=16)
+    p_load.add_argument('--url', help='callback URL of a running app; in-process when omitted')
+    p_load.add_argument('--failure-rate', type=float, default=0.1)
+    p_load.add_argument('--duplicate-rate', type=float, default=0.05)
+    p_load.add_argument('--reconcile', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.port, args.delay, args.failure_rate, args.duplicate_rate)
+    else:
+        load(args.count, args.threads, args.url, args.failure_rate, args.duplicate_rate, args.reconcile)
@@ -1,7 +1,20 @@
-from flask import Blueprint, render_template, redirect, request, url_for, flash
+from flask import (
+    Blueprint, render_template, redirect, request, url_for, flash, current_app,
+    Response, stream_with_context, send_from_directory, jsonify
+)
 from flask_login import login_required, current_user
-from models.models import User, House
+from werkzeug.utils import secure_filename
+from models.models import User, House, Announcement
 from extensions import db
+from services.house_import import import_houses as run_house_import
+from services import exports, audit, announcements
+from services.audit import audited
+from services.passwords import hasher
+from services.sessions import revoke_user_sessions
+from services.replicas import read_only
+import hashlib
+import os
+from datetime import datetime
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -36,6 +49,7 @@ def get_stats():
 # --- Dashboard ---
 @admin_bp.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
     users = User.query.all()
     houses = House.query.all()
@@ -52,10 +66,12 @@ def manage_users():
 
 @admin_bp.route('/delete_user/<int:user_id>', methods=['POST'])
 @login_required
+@audited('admin.delete_user', 'user', target_arg='user_id')
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    revoke_user_sessions(user_id)
     flash("User deleted.")
     return redirect(url_for('admin.dashboard'))
 
@@ -69,6 +85,7 @@ def manage_properties():
 
 @admin_bp.route('/delete_property/<int:house_id>', methods=['POST'])
 @login_required
+@audited('admin.delete_property', 'house', target_arg='house_id')
 def delete_property(house_id):
     house = House.query.get_or_404(house_id)
     db.session.delete(house)
@@ -76,6 +93,55 @@ def delete_property(house_id):
     flash("Property removed.")
     return redirect(url_for('admin.dashboard'))
 
+# --- Bulk Property Import ---
+@admin_bp.route('/import_houses', methods=['POST'])
+@login_required
+@audited('admin.import_houses', form_fields=('owner_id',))
+def import_houses():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash("Choose a CSV or JSON-lines file to import.", "danger")
+        return redirect(url_for('admin.manage_properties'))
+
+    ext = os.path.splitext(secure_filename(upload.filename))[1].lower()
+    if ext not in ('.csv', '.jsonl', '.ndjson', '.json'):
+        flash("Only .csv and .jsonl files can be imported.", "danger")
+        return redirect(url_for('admin.manage_properties'))
+
+    # Store by content hash so re-uploading the same file resumes its checkpoint
+    import_folder = current_app.config['IMPORT_FOLDER']
+    os.makedirs(import_folder, exist_ok=True)
+    digest = hashlib.sha1()
+    tmp_path = os.path.join(import_folder, f"upload-{current_user.id}.part")
+    with open(tmp_path, 'wb') as out:
+        for block in iter(lambda: upload.stream.read(64 * 1024), b''):
+            digest.update(block)
+            out.write(block)
+    path = os.path.join(import_folder, f"{digest.hexdigest()}{ext}")
+    os.replace(tmp_path, path)
+
+    owner_id = request.form.get('owner_id', type=int)
+    try:
+        report = run_house_import(
+            path,
+            upload_folder=current_app.config['UPLOAD_FOLDER'],
+            image_root=import_folder,
+            image_hosts=current_app.config['IMPORT_IMAGE_HOSTS'],
+            owner_id=owner_id,
+            chunk_size=current_app.config['IMPORT_CHUNK_SIZE'],
+            image_workers=current_app.config['IMPORT_IMAGE_WORKERS'],
+        )
+    except Exception as e:
+        current_app.logger.error(f"House import failed for {path}: {e}", exc_info=True)
+        flash("Import stopped part-way. Upload the same file again to resume.", "danger")
+        return redirect(url_for('admin.manage_properties'))
+
+    flash(f"Imported {report.inserted} property(ies); {report.rejected} row(s) rejected.",
+          "warning" if report.rejected else "success")
+    if report.rejected:
+        flash(f"Rejected rows saved to {os.path.basename(report.rejects_path)}.", "warning")
+    return redirect(url_for('admin.manage_properties'))
+
 # --- Reports ---
 @admin_bp.route('/view_reports')
 @login_required
@@ -97,6 +163,7 @@ def platform_settings():
 # --- Language Settings ---
 @admin_bp.route('/set_language', methods=['POST'])
 @login_required
+@audited('admin.set_language', form_fields=('language',))
 def set_language():
     new_language = request.form.get("language", "English")
     current_user.language = new_language
@@ -107,19 +174,34 @@ def set_language():
 # --- Announcements ---
 @admin_bp.route('/send_announcement', methods=['POST'])
 @login_required
+@audited('admin.send_announcement')
 def send_announcement():
-    message = request.form.get("message")
+    # The dashboard form names the field "announcement"
+    message = request.form.get("message") or request.form.get("announcement")
     if not message:
         flash("Announcement message cannot be empty.", "danger")
         return redirect(url_for('admin.dashboard'))
 
-    # Placeholder logic — later you can extend this to send emails/SMS/notifications
-    flash(f"Announcement sent: {message}", "success")
+    announcement = announcements.create_announcement(
+        message,
+        author_id=current_user.id,
+        role=request.form.get("audience_role"),
+        city=request.form.get("audience_city"),
+        house_id=request.form.get("audience_house_id", type=int),
+    )
+    flash(f"Announcement #{announcement.id} queued for delivery: {message}", "success")
     return redirect(url_for('admin.dashboard'))
 
+@admin_bp.route('/announcements/<int:announcement_id>')
+@login_required
+def announcement_status(announcement_id):
+    announcement = Announcement.query.get_or_404(announcement_id)
+    return jsonify(announcements.progress(announcement))
+
 # --- Bulk User/Property Actions ---
 @admin_bp.route('/bulk_action', methods=['POST'])
 @login_required
+@audited('admin.bulk_action', form_fields=('action', 'ids'))
 def bulk_action():
     action = request.form.get("action")
     ids = request.form.getlist("ids")  # Expecting checkboxes named "ids" in your template
@@ -152,6 +234,7 @@ def bulk_action():
 # --- Single User Actions ---
 @admin_bp.route('/user_action/<int:user_id>', methods=['POST'])
 @login_required
+@audited('admin.user_action', 'user', target_arg='user_id', form_fields=('action',))
 def user_action(user_id):
     action = request.form.get("action")
     user = User.query.get_or_404(user_id)
@@ -159,17 +242,19 @@ def user_action(user_id):
     if action == "delete":
         db.session.delete(user)
         db.session.commit()
-        flash(f"User {user.username} deleted.", "success")
+        revoke_user_sessions(user_id)
+        flash(f"User {user.name} deleted.", "success")
 
-    elif action == "deactivate":
+    elif action in ("deactivate", "suspend"):
         user.is_active = False
         db.session.commit()
-        flash(f"User {user.username} deactivated.", "warning")
+        revoked = revoke_user_sessions(user.id)
+        flash(f"User {user.name} deactivated; {revoked} session(s) signed out.", "warning")
 
-    elif action == "activate":
+    elif action in ("activate", "reactivate"):
         user.is_active = True
         db.session.commit()
-        flash(f"User {user.username} activated.", "success")
+        flash(f"User {user.name} activated.", "success")
 
     else:
         flash("Invalid user action.", "danger")
@@ -177,18 +262,95 @@ def user_action(user_id):
     return redirect(url_for('admin.manage_users'))
 
 # --- Export Reports ---
+def _csv_response(name, filename):
+    """Stream an export as CSV, gzip-compressed when the client asks with ?gzip=1."""
+    compress = request.args.get('gzip') == '1'
+    headers = {'Content-Disposition': f'attachment; filename="{filename}.csv{".gz" if compress else ""}"'}
+    return Response(
+        stream_with_context(exports.stream_csv(name, compress=compress)),
+        mimetype='application/gzip' if compress else 'text/csv',
+        headers=headers,
+    )
+
 @admin_bp.route('/export_reports')
 @login_required
 def export_reports():
-    # Placeholder: Later you can generate CSV, Excel, or PDF
-    flash("Reports exported successfully (placeholder).", "success")
+    name = request.args.get('type', 'users')
+    fmt = request.args.get('format', 'csv')
+    if name not in exports.EXPORTS:
+        flash(f"Unknown export '{name}'.", "danger")
+        return redirect(url_for('admin.view_reports'))
+
+    filename = f"{name}-{datetime.utcnow():%Y%m%d}"
+    if fmt == 'csv':
+        return _csv_response(name, filename)
+
+    if fmt == 'xlsx':
+        try:
+            token = exports.start_xlsx_export(
+                current_app._get_current_object(), name, current_app.config['EXPORT_FOLDER']
+            )
+        except ImportError:
+            flash("XLSX export needs openpyxl installed; download CSV instead.", "danger")
+            return redirect(url_for('admin.view_reports'))
+        flash(f"XLSX export started. Download it from "
+              f"{url_for('admin.download_export', token=token, _external=True)} once ready.", "success")
+        return redirect(url_for('admin.view_reports'))
+
+    flash("Export format must be csv or xlsx.", "danger")
     return redirect(url_for('admin.view_reports'))
 
+@admin_bp.route('/exports/<token>')
+@login_required
+def download_export(token):
+    folder = current_app.config['EXPORT_FOLDER']
+    status = exports.export_status(folder, secure_filename(token))
+    if status == 'ready':
+        return send_from_directory(folder, f"{secure_filename(token)}.xlsx", as_attachment=True)
+    if status == 'pending':
+        flash("Export is still being generated. Try again shortly.", "warning")
+    elif status == 'failed':
+        flash("Export failed. Check the server log and try again.", "danger")
+    else:
+        flash("Export not found.", "danger")
+    return redirect(url_for('admin.view_reports'))
+
+# --- Audit Events API ---
+@admin_bp.route('/audit_events')
+@login_required
+def audit_events():
+    def parse_date(value):
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+    try:
+        events = audit.query_events(
+            actor_id=request.args.get('actor_id', type=int),
+            action=request.args.get('action'),
+            target_type=request.args.get('target_type'),
+            target_id=request.args.get('target_id'),
+            since=parse_date(request.args.get('since')),
+            until=parse_date(request.args.get('until')),
+            before_id=request.args.get('before_id', type=int),
+            limit=request.args.get('limit', 100, type=int),
+        )
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    return jsonify({
+        'events': [audit.event_to_dict(e) for e in events],
+        'next_before_id': events[-1].id if events else None,
+    })
+
+# --- Metrics ---
+@admin_bp.route('/metrics/password_hashing')
+@login_required
+def password_hashing_metrics():
+    return jsonify(hasher.metrics())
+
 # --- Download Audit Log ---
 @admin_bp.route('/download_audit_log')
 @login_required
 def download_audit_log():
-    # Placeholder: later we can stream a CSV/Excel/JSON file
-    flash("Audit log downloaded successfully (placeholder).", "success")
-    return redirect(url_for('admin.dashboard'))
-
+    if 'audit' not in exports.EXPORTS:
+        flash("No audit events are being recorded yet.", "warning")
+        return redirect(url_for('admin.dashboard'))
+    return _csv_response('audit', f"audit-log-{datetime.utcnow():%Y%m%d}")
@@ -2,14 +2,18 @@ from flask import (
     Blueprint, render_template, redirect, request,
     url_for, flash, current_app as app
 )
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
 from models.models import User
 from extensions import db
+from services import audit
+from services.identity import resolve_user
+from services import jobs
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from services.passwords import HashingBusy
 from sqlalchemy.exc import IntegrityError
 import re
+import time
 import logging
-import pyotp
 from werkzeug.utils import secure_filename
 import os
 
@@ -19,6 +23,9 @@ logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint("auth", __name__)
 
+PASSWORD_RE = r"^(?=.*[a-zA-Z])(?=.*\d)(?=.*[!@#$%^&*()_+\-=\\[\]{};':\"|,.<>/?]).{8,}$"
+RESET_TOKEN_MAX_AGE = 3600  # seconds
+
 
 # ------------------- LOGIN -------------------
 @auth_bp.route("/login", methods=["GET", "POST"])
@@ -34,16 +41,15 @@ def login():
                 flash("Email/phone and password are required.", "danger")
                 return render_template("login.html")
 
-            # Query user by email or phone
-            user = User.query.filter(
-                (User.email == identifier) | (User.phone_number == identifier)
-            ).first()
+            # Resolve email or phone through the normalized identifier index
+            user = resolve_user(identifier)
 
             if not user:
                 flash("Email or phone number not recognized.", "danger")
                 return render_template("login.html")
 
             if not user.check_password(password):
+                audit.record("auth.login_failed", "user", user.id, actor_id=user.id)
                 flash("Incorrect password.", "danger")
                 return render_template("login.html")
 
@@ -56,7 +62,12 @@ def login():
                     flash("Invalid 2FA code.", "danger")
                     return render_template("login.html")
 
+            if user.rehash_password_if_needed(password):
+                db.session.commit()
+                logger.debug(f"Upgraded password hash for user {user.id}")
+
             login_user(user, remember=remember_me)
+            audit.record("auth.login", "user", user.id, actor_id=user.id, remember=remember_me)
             flash("Login successful.", "success")
             logger.debug(f"User {identifier} logged in.")
 
@@ -72,7 +83,11 @@ def login():
             else:
                 return redirect(url_for("portal"))
 
+        except HashingBusy:
+            flash("We're handling a lot of sign-ins right now. Try again in a moment.", "warning")
+            return render_template("login.html")
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Login error: {str(e)}", exc_info=True)
             flash("An error occurred during login. Try again.", "danger")
             return render_template("login.html")
@@ -116,10 +131,7 @@ def signup():
                 return redirect(url_for("auth.signup"))
 
             # Password validation
-            if not re.match(
-                r"^(?=.*[a-zA-Z])(?=.*\d)(?=.*[!@#$%^&*()_+\-=\\[\]{};':\"|,.<>/?]).{8,}$",
-                password,
-            ):
+            if not re.match(PASSWORD_RE, password):
                 flash("Password too weak (min 8 chars, digit, special char).", "danger")
                 return redirect(url_for("auth.signup"))
 
@@ -150,6 +162,7 @@ def signup():
 
             db.session.add(user)
             db.session.commit()
+            audit.record("auth.signup", "user", user.id, actor_id=user.id, role=role)
             flash("Account created. Please login.", "success")
             logger.debug(f"User {email} created.")
             return redirect(url_for("auth.login"))
@@ -158,6 +171,10 @@ def signup():
             db.session.rollback()
             flash("Email or phone already registered.", "danger")
             return redirect(url_for("auth.signup"))
+        except HashingBusy:
+            db.session.rollback()
+            flash("We're handling a lot of sign-ups right now. Try again in a moment.", "warning")
+            return redirect(url_for("auth.signup"))
         except Exception as e:
             db.session.rollback()
             logger.error(f"Signup error: {str(e)}", exc_info=True)
@@ -182,15 +199,19 @@ def forgot_password():
             flash("Provide email or phone number.", "danger")
             return render_template("forgot_password.html")
 
-        user = User.query.filter(
-            (User.email == identifier) | (User.phone_number == identifier)
-        ).first()
+        user = resolve_user(identifier)
 
         if not user:
             flash("Email/phone not found.", "danger")
             return render_template("forgot_password.html")
 
-        # TODO: Send real reset link (email/SMS)
+        reset_url = url_for("auth.reset_password", token=make_reset_token(user), _external=True)
+        # One reset message per user per 15 minutes, however often the form is submitted
+        jobs.enqueue(
+            "auth.password_reset",
+            {"email": user.email, "phone_number": user.phone_number, "reset_url": reset_url},
+            idempotency_key=f"password_reset:{user.id}:{int(time.time() // 900)}",
+        )
         flash("Password reset link sent.", "success")
         logger.debug(f"Password reset requested for {identifier}")
         return redirect(url_for("auth.login"))
@@ -198,6 +219,50 @@ def forgot_password():
     return render_template("forgot_password.html")
 
 
+# ------------------- RESET PASSWORD -------------------
+def _reset_serializer():
+    return URLSafeTimedSerializer(app.config["SECRET_KEY"], salt="password-reset")
+
+
+def make_reset_token(user):
+    # Embedding part of the current hash makes the link single-use
+    return _reset_serializer().dumps({"id": user.id, "h": user.password_hash[-16:]})
+
+
+@auth_bp.route("/reset_password/<token>", methods=["GET", "POST"])
+def reset_password(token):
+    try:
+        data = _reset_serializer().loads(token, max_age=RESET_TOKEN_MAX_AGE)
+    except (BadSignature, SignatureExpired):
+        flash("Reset link is invalid or has expired.", "danger")
+        return redirect(url_for("auth.forgot_password"))
+
+    user = User.query.get(data.get("id"))
+    if not user or user.password_hash[-16:] != data.get("h"):
+        flash("Reset link has already been used.", "danger")
+        return redirect(url_for("auth.forgot_password"))
+
+    if request.method == "POST":
+        password = request.form.get("password") or ""
+        if not re.match(PASSWORD_RE, password):
+            flash("Password too weak (min 8 chars, digit, special char).", "danger")
+            return render_template("reset_password.html", token=token)
+        if password != request.form.get("confirm_password"):
+            flash("Passwords do not match.", "danger")
+            return render_template("reset_password.html", token=token)
+        try:
+            user.set_password(password)
+        except HashingBusy:
+            flash("We're handling a lot of requests right now. Try again in a moment.", "warning")
+            return render_template("reset_password.html", token=token)
+        db.session.commit()
+        audit.record("auth.password_reset", "user", user.id, actor_id=user.id)
+        flash("Password updated. Please login.", "success")
+        return redirect(url_for("auth.login"))
+
+    return render_template("reset_password.html", token=token)
+
+
 # ------------------- SUPPORT -------------------
 @auth_bp.route("/support", methods=["GET", "POST"])
 def support():
@@ -211,7 +276,11 @@ def support():
                 flash("Fill in all required fields.", "danger")
                 return redirect(url_for("auth.support"))
 
-            # TODO: Save to DB or email admin
+            jobs.enqueue("email.send", {
+                "to": app.config["SUPPORT_EMAIL"],
+                "subject": f"Support request from {name}",
+                "body": f"From: {name} <{email}>\n\n{message}",
+            })
             flash("Support request submitted. We'll contact you.", "success")
             logger.debug(f"Support request from {email}")
             return redirect(url_for("auth.support"))
@@ -228,6 +297,7 @@ def support():
 @auth_bp.route("/logout")
 @login_required
 def logout():
+    audit.record("auth.logout", "user", current_user.id)
     logout_user()
     flash("Logged out successfully.", "info")
     return redirect(url_for("auth.login"))
@@ -282,5 +352,6 @@ def update_profile():
 def verify_2fa_code(user, code):
     if not user.two_factor_secret:
         return False
+    import pyotp
     totp = pyotp.TOTP(user.two_factor_secret)
     return totp.verify(code)
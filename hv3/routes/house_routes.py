@@ -1,31 +1,40 @@
-from flask import Blueprint, render_template, abort, request, redirect, url_for
+from flask import Blueprint, render_template, abort, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from models.models import House, Booking
+from models.models import House
 from extensions import db
+from services import notifications
+from services.replicas import read_only
+from services.availability import BookingConflict, parse_date, reserve
+from services.idempotency import idempotent
 
 house_bp = Blueprint('house', __name__, url_prefix='/houses')
 
 @house_bp.route('/rentals')
+@read_only
 def rentals():
     houses = House.query.filter_by(category='Rental').all()
     return render_template('rentals.html', houses=houses)
 
 @house_bp.route('/hotels')
+@read_only
 def hotels():
     houses = House.query.filter_by(category='Hotel').all()
     return render_template('hotel.html', houses=houses)
 
 @house_bp.route('/bnb')
+@read_only
 def bnb():
     houses = House.query.filter_by(category='BNB').all()
     return render_template('bnb.html', houses=houses)
 
 @house_bp.route('/real_estates')
+@read_only
 def real_estates():
     houses = House.query.filter_by(category='RealEstate').all()
     return render_template('real_estates.html', houses=houses)
 
 @house_bp.route('/')
+@read_only
 def index():
     houses = House.query.all()  # Adjust query as needed
     print("Houses data:", houses)  # Debug output
@@ -33,6 +42,7 @@ def index():
 
 @house_bp.route('/view/<int:property_id>')
 @login_required
+@read_only
 def view_property(property_id):
     """
     View details of a specific property.
@@ -53,6 +63,7 @@ def edit_property(property_id):
 
 @house_bp.route('/request_rental/<int:property_id>', methods=['POST'])
 @login_required
+@idempotent('house.request_rental')
 def request_rental(property_id):
     """
     Handle rental request from a tenant for a specific property.
@@ -60,9 +71,14 @@ def request_rental(property_id):
     if current_user.role.lower() != 'tenant':
         abort(403)  # Forbidden if not a tenant
     house = House.query.get_or_404(property_id)
-    if house:
-        booking = Booking(tenant_id=current_user.id, house_id=property_id, status='pending')
-        db.session.add(booking)
-        db.session.commit()
-        return redirect(url_for('tenant.dashboard'))
-    return "Property not found", 404
\ No newline at end of file
+    try:
+        reserve(current_user.id, house.id,
+                start=parse_date(request.form.get('lease_start_date')),
+                end=parse_date(request.form.get('lease_end_date')))
+    except BookingConflict as e:
+        db.session.rollback()
+        flash(str(e), "warning")
+        return redirect(url_for('house.view_property', property_id=property_id))
+    notifications.notify(house.owner_id, f"{current_user.name} requested to rent {house.title}.", commit=False)
+    db.session.commit()
+    return redirect(url_for('tenant.dashboard'))
@@ -1,11 +1,14 @@
 import os
 import logging
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask import (Blueprint, Response, render_template, request, redirect, url_for, flash, jsonify,
+                   current_app, stream_with_context)
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from extensions import db, csrf
 from models.models import User, House, Booking, Payment, MaintenanceRequest, ServiceProvider
+from services.replicas import read_only
+from services import conversations, reports as report_engine
 
 # Logging setup
 logging.basicConfig(level=logging.DEBUG)
@@ -14,9 +17,18 @@ logger = logging.getLogger(__name__)
 # Blueprint setup
 landlord_bp = Blueprint("landlord", __name__, url_prefix="/landlord")
 
+
+@landlord_bp.context_processor
+def inject_stats():
+    # Lazy: only pages that actually show the numbers run the query
+    if current_user.is_authenticated and current_user.role == "landlord":
+        return {"stats": report_engine.LandlordStats(current_user.id)}
+    return {"stats": {}}
+
 # ---------------- Landlord Dashboard ----------------
 @landlord_bp.route("/dashboard")
 @login_required
+@read_only
 def dashboard():
     if current_user.role != "landlord":
         flash("Access denied.", "danger")
@@ -30,7 +42,7 @@ def dashboard():
         .filter(User.role == "tenant", House.owner_id == current_user.id)
         .all()
     )
-    return render_template("landlord/dashboard.html", houses=houses, tenants=tenants, stats={})
+    return render_template("landlord/dashboard.html", houses=houses, tenants=tenants)
 
 
 # ---------------- Manage Properties ----------------
@@ -42,7 +54,7 @@ def properties():
         return redirect(url_for("main.index"))
 
     properties = House.query.filter_by(owner_id=current_user.id).all()
-    return render_template("landlord/properties.html", properties=properties, stats={})
+    return render_template("landlord/properties.html", properties=properties)
 
 
 # ---------------- Add Property ----------------
@@ -72,7 +84,7 @@ def add_property():
         flash("Property added successfully!", "success")
         return redirect(url_for("landlord.properties"))
 
-    return render_template("landlord/add_property.html", stats={})
+    return render_template("landlord/add_property.html")
 
 
 # ---------------- Manage Tenants ----------------
@@ -90,7 +102,7 @@ def tenants():
         .filter(User.role == "tenant", House.owner_id == current_user.id)
         .all()
     )
-    return render_template("landlord/tenants.html", tenants=tenants, stats={})
+    return render_template("landlord/tenants.html", tenants=tenants)
 
 
 # ---------------- Payments ----------------
@@ -109,7 +121,7 @@ def payments():
         .filter(House.owner_id == current_user.id)
         .all()
     )
-    return render_template("landlord/payments.html", payments=payments, stats={})
+    return render_template("landlord/payments.html", payments=payments)
 
 
 # ---------------- Maintenance Requests ----------------
@@ -128,7 +140,7 @@ def maintenance():
         .filter(House.owner_id == current_user.id)
         .all()
     )
-    return render_template("landlord/maintenance.html", requests=requests, stats={})
+    return render_template("landlord/maintenance.html", requests=requests)
 
 
 # ---------------- Service Providers ----------------
@@ -140,17 +152,37 @@ def service_providers():
         return redirect(url_for("main.index"))
 
     providers = ServiceProvider.query.all()
-    return render_template("landlord/service_providers.html", providers=providers, stats={})
+    return render_template("landlord/service_providers.html", providers=providers)
 
 
 # ---------------- Reports ----------------
 @landlord_bp.route("/reports")
 @login_required
+@read_only
 def reports():
     if current_user.role != "landlord":
         flash("Access denied.", "danger")
         return redirect(url_for("main.index"))
-    return render_template("landlord/reports.html", stats={})
+
+    report = report_engine.landlord_report(current_user.id)
+    return render_template("landlord/reports.html", report=report)
+
+
+@landlord_bp.route("/reports/export.csv")
+@login_required
+@read_only
+def export_report():
+    if current_user.role != "landlord":
+        flash("Access denied.", "danger")
+        return redirect(url_for("main.index"))
+
+    years = max(1, min(request.args.get("years", 3, type=int), current_app.config["REPORTS_EXPORT_MAX_YEARS"]))
+    filename = f"homehub-report-{datetime.utcnow():%Y%m%d}-{years}y.csv"
+    return Response(
+        stream_with_context(report_engine.monthly_export(current_user.id, years)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 # ---------------- Edit Property ----------------
@@ -173,7 +205,7 @@ def edit_property(property_id):
         flash("Property updated successfully!", "success")
         return redirect(url_for("landlord.properties"))
 
-    return render_template("landlord/edit_property.html", house=house, stats={})
+    return render_template("landlord/edit_property.html", house=house)
 
 
 
@@ -190,7 +222,7 @@ def settings():
         flash("Settings updated successfully!", "success")
         return redirect(url_for("landlord.settings"))
 
-    return render_template("landlord/settings.html", stats={})
+    return render_template("landlord/settings.html")
 
 
 # ---------------- Messages ----------------
@@ -201,8 +233,20 @@ def messages():
         flash("Access denied.", "danger")
         return redirect(url_for("main.index"))
 
-    # TODO: Load landlord messages
-    return render_template("landlord/messages.html", stats={})
+    # Inbox: one UNION ALL over the two per-side conversation indexes
+    inbox = conversations.inbox(current_user.id, limit=30)
+    other = conversation = None
+    thread_messages = []
+    other_id = request.args.get("user", type=int)
+    if other_id:
+        other = db.session.get(User, other_id)
+        conversation = conversations.find(current_user.id, other_id) if other else None
+        if conversation is not None:
+            thread_messages = conversations.thread(conversation)
+            conversations.mark_read(conversation, current_user.id)
+            db.session.commit()
+    return render_template("landlord/messages.html", inbox=inbox, other=other, conversation=conversation,
+                           thread_messages=thread_messages)
 
 
 # ---------------- Profile ----------------
@@ -230,4 +274,4 @@ def profile():
         flash("Profile updated successfully!", "success")
         return redirect(url_for("landlord.profile"))
 
-    return render_template("landlord/profile.html", stats={})
+    return render_template("landlord/profile.html")
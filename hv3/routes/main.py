@@ -1,10 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from models.models import House
+from services import jobs
+from services.replicas import read_only
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 @main_bp.route('/index')
+@read_only
 def index():
     houses = House.query.all()
     return render_template('index.html', houses=houses)
@@ -42,6 +45,11 @@ def help():
 def subscribe_post():
     email = request.form.get('email')
     if email:
+        jobs.enqueue('email.send', {
+            'to': email,
+            'subject': "You're subscribed to HomeHub",
+            'body': "Thanks for subscribing! We'll keep you posted on new listings.",
+        }, idempotency_key=f"subscribe:{email.strip().lower()}")
         flash(f'Subscribed successfully with {email}', 'success')
     else:
         flash('No email provided', 'danger')
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from flask import Blueprint, abort, jsonify, request
+from flask_login import login_required, current_user
+
+from extensions import db
+from models.models import Conversation
+from services import conversations
+from services.idempotency import idempotent
+
+message_bp = Blueprint('messages', __name__, url_prefix='/messages')
+
+
+def _conversation_for(conversation_id):
+    conversation = db.session.get(Conversation, conversation_id)
+    if conversation is None or not conversation.has_member(current_user.id):
+        abort(404)
+    return conversation
+
+
+@message_bp.route('/conversations')
+@login_required
+def inbox():
+    before = request.args.get('before')
+    try:
+        before = datetime.fromisoformat(before) if before else None
+    except ValueError:
+        return jsonify({'error': 'before must be an ISO timestamp'}), 400
+    items = conversations.inbox(current_user.id, limit=request.args.get('limit', 20, type=int), before=before)
+    for item in items:
+        item['last_message_at'] = item['last_message_at'].isoformat() if item['last_message_at'] else None
+    return jsonify({
+        'conversations': items,
+        'next_before': items[-1]['last_message_at'] if items else None,
+    })
+
+
+@message_bp.route('/<int:conversation_id>')
+@login_required
+def thread(conversation_id):
+    conversation = _conversation_for(conversation_id)
+    before_id = request.args.get('before_id', type=int)
+    page = conversations.thread(conversation, before_id=before_id,
+                                limit=request.args.get('limit', 50, type=int))
+    if before_id is None:
+        # Opening the latest page counts as reading the conversation
+        conversations.mark_read(conversation, current_user.id)
+        db.session.commit()
+    return jsonify({
+        'messages': [conversations.to_dict(m) for m in page],
+        'next_before_id': page[0].id if page else None,
+    })
+
+
+@message_bp.route('/<int:conversation_id>/read', methods=['POST'])
+@login_required
+def mark_read(conversation_id):
+    conversations.mark_read(_conversation_for(conversation_id), current_user.id)
+    db.session.commit()
+    return jsonify({'ok': True})
+
+
+@message_bp.route('/send/<int:user_id>', methods=['POST'])
+@login_required
+@idempotent('messages.send', derive=False)
+def send(user_id):
+    data = request.get_json(silent=True) or request.form
+    try:
+        message = conversations.send(current_user.id, user_id, data.get('content'))
+    except conversations.MessagingError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    return jsonify(conversations.to_dict(message)), 201
@@ -0,0 +1,38 @@
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+from services import notifications
+
+notification_bp = Blueprint('notifications', __name__, url_prefix='/notifications')
+
+
+@notification_bp.route('/')
+@login_required
+def list_notifications():
+    items = notifications.recent(
+        current_user.id,
+        limit=min(request.args.get('limit', 20, type=int), 100),
+        before_id=request.args.get('before_id', type=int),
+    )
+    return jsonify({
+        'notifications': [notifications.to_dict(n) for n in items],
+        'unread': notifications.unread_count(current_user),
+        'next_before_id': items[-1].id if items else None,
+    })
+
+
+@notification_bp.route('/unread_count')
+@login_required
+def unread_count():
+    return jsonify({'unread': notifications.unread_count(current_user)})
+
+
+@notification_bp.route('/mark_read', methods=['POST'])
+@login_required
+def mark_read():
+    data = request.get_json(silent=True) or {}
+    if data.get('all'):
+        changed = notifications.mark_read(current_user.id)
+    else:
+        ids = [int(i) for i in data.get('ids', []) if str(i).isdigit()]
+        changed = notifications.mark_read(current_user.id, ids)
+    return jsonify({'updated': changed, 'unread': notifications.unread_count(current_user)})
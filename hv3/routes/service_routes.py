@@ -2,16 +2,18 @@ from flask import Blueprint, current_app, render_template, request, redirect, ur
 from flask_login import login_required, current_user
 from models.models import ServiceProvider, ServiceRequest, Appointment, Review, User
 from extensions import db
+from services.passwords import HashingBusy
+from services.replicas import read_only
 from sqlalchemy import func, extract
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
 
 service_provider_bp = Blueprint('service_provider', __name__, url_prefix='/service_provider')
 
 @service_provider_bp.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
     # Get service provider profile
     provider = ServiceProvider.query.filter_by(user_id=current_user.id).first()
@@ -157,18 +159,22 @@ def change_password():
     new_password = request.form.get('new_password')
     confirm_password = request.form.get('confirm_password')
     
-    # Verify current password
-    if not check_password_hash(current_user.password_hash, current_password):
-        flash('Current password is incorrect', 'danger')
-        return redirect(url_for('service_provider.profile'))
-    
-    # Verify new passwords match
-    if new_password != confirm_password:
-        flash('New passwords do not match', 'danger')
+    try:
+        # Verify current password
+        if not current_user.check_password(current_password):
+            flash('Current password is incorrect', 'danger')
+            return redirect(url_for('service_provider.profile'))
+
+        # Verify new passwords match
+        if new_password != confirm_password:
+            flash('New passwords do not match', 'danger')
+            return redirect(url_for('service_provider.profile'))
+
+        # Update password
+        current_user.set_password(new_password)
+    except HashingBusy:
+        flash("We're handling a lot of requests right now. Try again in a moment.", 'warning')
         return redirect(url_for('service_provider.profile'))
-    
-    # Update password
-    current_user.password_hash = generate_password_hash(new_password)
     db.session.commit()
     
     flash('Password updated successfully!', 'success')
@@ -1,7 +1,11 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
 from flask_login import login_required, current_user
-from flask_socketio import emit
+from flask_socketio import emit, join_room
 from extensions import db, socketio
+from services.idempotency import claim
+from services import realtime
+from services.presence import presence
+from services.support_queue import support_queue
 from models.models import User, ChatMessage
 from datetime import datetime
 import os
@@ -37,9 +41,9 @@ def get_messages():
     return jsonify([{
         'id': msg.id,
         'message': msg.message,
-        'name': User.query.get(msg.user_id).name if msg.user_id else 'System',
+        'name': User.query.get(msg.support_agent_id if msg.from_agent else msg.user_id).name if msg.user_id else 'System',
         'timestamp': msg.timestamp.isoformat(),
-        'is_sent': msg.user_id == current_user.id
+        'is_sent': msg.from_agent if msg.user_id != current_user.id else not msg.from_agent
     } for msg in messages])
 
 
@@ -64,83 +68,170 @@ def upload_file():
     return jsonify({'error': 'Invalid file type'}), 400
 
 
-# Socket.IO events
+# Socket.IO events. Handlers trust only the SocketContext bound at connect,
+# never user ids or names from the payload.
 @socketio.on('connect')
-def handle_connect():
-    print('Client connected')
+def handle_connect(auth=None):
+    if not current_user.is_authenticated:
+        raise ConnectionRefusedError('unauthorized')
+    ctx = realtime.bind(current_user, request.sid)
+    presence.connect(ctx.user_id, ctx.sid)
+    if ctx.is_agent:
+        support_queue.agent_connected(ctx.user_id, ctx.sid)
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    realtime.release(request.sid)
+    presence.disconnect(request.sid)
+
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    presence.heartbeat(request.sid)
+
+
+@socketio.on('watch_presence')
+@realtime.authenticated
+def watch_presence(ctx, data):
+    """Subscribe to online/offline changes of up to 50 users and get their current state."""
+    user_ids = {int(u) for u in (data.get('user_ids') or [])[:50] if str(u).isdigit()}
+    for user_id in user_ids:
+        join_room(f"presence_{user_id}")
+    online = presence.online_among(user_ids)
+    for user_id in user_ids:
+        emit('presence', {'user_id': user_id, 'online': user_id in online})
+
+
+def _post(ctx, text):
+    """Store a message in the sender's support chat and send it to the chat and its agent."""
+    agent_id = support_queue.agent_for(ctx.user_id)
+    chat_msg = ChatMessage(
+        user_id=ctx.user_id,
+        support_agent_id=agent_id,
+        message=text,
+        timestamp=datetime.utcnow()
+    )
+    db.session.add(chat_msg)
+    db.session.commit()
+    ctx.last_message_at = chat_msg.timestamp
+    if agent_id is None:
+        agent_id = support_queue.enqueue(ctx.user_id, text, since=chat_msg.timestamp)
+
+    payload = {
+        'user_id': ctx.user_id,
+        'name': ctx.name,
+        'message': text,
+        'timestamp': chat_msg.timestamp.isoformat(),
+        'role': ctx.role
+    }
+    emit('message', payload, room=ctx.chat_room)
+    if agent_id is not None:
+        emit('message', payload, room=f"user_{agent_id}")
+    return chat_msg
 
 
 @socketio.on('message')
-def handle_message(data):
-    last_msg = ChatMessage.query.filter_by(user_id=data['user_id']).order_by(ChatMessage.timestamp.desc()).first()
-    if last_msg and (datetime.utcnow() - last_msg.timestamp).total_seconds() < 5:
+@realtime.authenticated
+def handle_message(ctx, data):
+    if not ctx.is_agent and ctx.last_message_at and (datetime.utcnow() - ctx.last_message_at).total_seconds() < 5:
         emit('rate_limit')
         return
 
-    message = data['message'].strip()[:500]
+    message = (data.get('message') or '').strip()[:500]
+    if not message:
+        return
+
+    # Reconnects and client retries resend the same client_id; store it once
+    client_id = data.get('client_id')
+    if client_id and claim('chat.message', ctx.user_id, str(client_id)[:64]) is not None:
+        return
+
+    # Agents answer on the chat of a user assigned to them
+    target = data.get('user_id')
+    if ctx.is_agent and str(target).isdigit() and int(target) != ctx.user_id:
+        _reply(ctx, int(target), message)
+        return
+
+    _post(ctx, message)
+
 
+def _reply(ctx, user_id, text):
+    if support_queue.agent_for(user_id) != ctx.user_id:
+        emit('reply_error', {'user_id': user_id, 'error': 'This conversation is not assigned to you.'})
+        return None
     chat_msg = ChatMessage(
-        user_id=data['user_id'],
-        support_agent_id=data.get('agent_id'),
-        message=message,
+        user_id=user_id,
+        support_agent_id=ctx.user_id,
+        from_agent=True,
+        message=text,
         timestamp=datetime.utcnow()
     )
     db.session.add(chat_msg)
     db.session.commit()
 
-    emit('message', {
-        'name': data['name'],
-        'message': message,
+    payload = {
+        'user_id': user_id,
+        'name': ctx.name,
+        'message': text,
         'timestamp': chat_msg.timestamp.isoformat(),
-        'role': data.get('role', 'user')
-    }, room=f"chat_{data['user_id']}")
+        'role': ctx.role
+    }
+    emit('message', payload, room=f"chat_{user_id}")
+    emit('message', payload, room=f"user_{ctx.user_id}")
+    return chat_msg
 
 
 @socketio.on('file_upload')
-def handle_file_upload(data):
+@realtime.authenticated
+def handle_file_upload(ctx, data):
+    if not allowed_file(data.get('fileName', '')):
+        emit('upload_error', {'error': 'Invalid file type'})
+        return
     file_data = base64.b64decode(data['fileData'])
     filename = secure_filename(data['fileName'])
-    filepath = os.path.join(UPLOAD_FOLDER, f"{data['user_id']}_{filename}")
+    filepath = os.path.join(UPLOAD_FOLDER, f"{ctx.user_id}_{filename}")
 
     with open(filepath, 'wb') as f:
         f.write(file_data)
 
-    file_url = url_for('static', filename=f"uploads/chat/{data['user_id']}_{filename}")
-
-    chat_msg = ChatMessage(
-        user_id=data['user_id'],
-        message=f"File uploaded: {data['fileName']} ({file_url})",
-        timestamp=datetime.utcnow()
-    )
-    db.session.add(chat_msg)
-    db.session.commit()
-
-    emit('message', {
-        'name': data['name'],
-        'message': chat_msg.message,
-        'timestamp': chat_msg.timestamp.isoformat()
-    }, room=f"chat_{data['user_id']}")
+    file_url = url_for('static', filename=f"uploads/chat/{ctx.user_id}_{filename}")
+    _post(ctx, f"File uploaded: {filename} ({file_url})")
 
 
 @socketio.on('load_history')
-def load_history(data):
-    messages = ChatMessage.query.filter_by(user_id=data['user_id']).order_by(ChatMessage.timestamp.asc()).all()
+@realtime.authenticated
+def load_history(ctx, data=None):
+    # Agents may open any user's chat; everyone else only their own
+    user_id, name = ctx.user_id, ctx.name
+    requested = (data or {}).get('user_id')
+    if ctx.is_agent and str(requested).isdigit() and int(requested) != ctx.user_id:
+        user = db.session.get(User, int(requested))
+        if user is None:
+            return
+        user_id, name = user.id, user.name
+
+    messages = ChatMessage.query.filter_by(user_id=user_id).order_by(ChatMessage.timestamp.asc()).all()
+    agent_ids = {msg.support_agent_id for msg in messages if msg.from_agent}
+    agents = dict(db.session.query(User.id, User.name).filter(User.id.in_(agent_ids)).all()) if agent_ids else {}
     emit('chat_history', [{
-        'name': User.query.get(msg.user_id).name if msg.user_id else 'System',
+        'name': agents.get(msg.support_agent_id, 'Support') if msg.from_agent else name,
         'message': msg.message,
         'timestamp': msg.timestamp.isoformat(),
-        'is_sent': msg.user_id == data['user_id']
+        'is_sent': msg.from_agent == (user_id != ctx.user_id)
     } for msg in messages])
 
 
 @socketio.on('agent_status')
-def agent_status(data):
-    emit('agent_status', {'online': data['online']}, broadcast=True)
+@realtime.authenticated
+def agent_status(ctx, data):
+    if not ctx.is_agent:
+        return
+    if data.get('online'):
+        support_queue.agent_online(ctx.user_id, ctx.name, ctx.sid, data.get('capacity'))
+    else:
+        # Going offline on purpose hands their open chats back to the queue
+        support_queue.agent_offline(ctx.user_id, release=data.get('release', True))
 
 
 @support_bp.route('/admin')
@@ -150,5 +241,35 @@ def admin_dashboard():
         flash('Access denied.', 'danger')
         return redirect(url_for('main.index'))
 
-    open_chats = ChatMessage.query.filter_by(is_read=False).all()
-    return render_template('support/admin.html', chats=open_chats)
+    support_queue.ensure_fresh()
+    waiting = support_queue.waiting()
+    assigned = support_queue.assigned()
+    names = dict(db.session.query(User.id, User.name).filter(
+        User.id.in_({w['user_id'] for w in waiting} | set(assigned) | set(assigned.values()))
+    ).all()) if waiting or assigned else {}
+    return render_template('support/admin.html', waiting=waiting, assigned=assigned, names=names,
+                           agents=support_queue.agents(), me=support_queue.agent(current_user.id),
+                           metrics=support_queue.metrics())
+
+
+@support_bp.route('/admin/queue')
+@login_required
+def queue_status():
+    if current_user.role.lower() != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    support_queue.ensure_fresh()
+    waiting = support_queue.waiting()
+    for item in waiting:
+        item['since'] = item['since'].isoformat()
+    return jsonify({'metrics': support_queue.metrics(), 'waiting': waiting, 'agents': support_queue.agents()})
+
+
+@support_bp.route('/admin/chats/<int:user_id>/resolve', methods=['POST'])
+@login_required
+def resolve_chat(user_id):
+    if current_user.role.lower() != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.index'))
+    if support_queue.resolve(user_id):
+        flash('Conversation resolved.', 'success')
+    return redirect(url_for('support.admin_dashboard'))
@@ -1,4 +1,3 @@
-from asyncio import Event
 import base64
 from datetime import datetime
 from io import BytesIO
@@ -6,10 +5,15 @@ import os
 from models.models import Document
 from flask import Blueprint, current_app, flash, render_template, request, redirect, url_for
 from flask_login import login_required, current_user
-import pyotp
-from models.models import Booking, MaintenanceRequest, Message, House, Notification, Payment, User
+from models.models import Booking, MaintenanceRequest, House, Payment, User
 from extensions import db
 from models.models import Event
+from services.audit import audited
+from services import conversations, ledger, mpesa, notifications
+from services.replicas import read_only
+from services.availability import BookingConflict, available_between, parse_date, reserve
+from services.idempotency import idempotent
+from services.presence import presence
 from werkzeug.utils import secure_filename
 
 
@@ -18,6 +22,7 @@ tenant_bp = Blueprint('tenant', __name__, url_prefix='/tenant')
 
 @tenant_bp.route('/dashboard')
 @login_required
+@read_only
 def tenant_dashboard():
     # Ensure the user is a tenant
     if current_user.role != 'tenant':
@@ -46,9 +51,7 @@ def tenant_dashboard():
     maintenance_requests = MaintenanceRequest.query.filter_by(
         tenant_id=current_user.id
     ).order_by(MaintenanceRequest.date_submitted.desc()).all()
-    notifications = Notification.query.filter_by(
-        tenant_id=current_user.id
-    ).order_by(Notification.date.desc()).all()
+    recent_notifications = notifications.recent(current_user.id, limit=10)
     events = Event.query.filter_by(tenant_id=current_user.id).all()
 
     open_requests_count = len([
@@ -56,14 +59,13 @@ def tenant_dashboard():
         if req.status.lower() in ['open', 'in progress']
     ])
 
-    # Next payment
-    next_payment = Payment.query.filter_by(
-        tenant_id=current_user.id, status='Pending'
-    ).order_by(Payment.due_date.asc()).first()
+    # Next rent charge and the running balance, both precomputed by the ledger
+    next_payment = ledger.next_charge(current_user.id)
+    balance = ledger.balance_for(current_user.id)
 
     # Payment chart data
     payment_labels = [p.date.strftime('%b %Y') for p in payments]
-    payment_data = [p.amount for p in payments]
+    payment_data = [float(p.amount) for p in payments]
 
     return render_template(
         'tenant.html',
@@ -71,39 +73,70 @@ def tenant_dashboard():
         bookings=bookings,
         payments=payments,
         maintenance_requests=maintenance_requests,
-        notifications=notifications,
+        notifications=recent_notifications,
+        unread_count=notifications.unread_count(current_user),
         landlord=landlord,            # ✅ always available in template (or None)
+        landlord_online=bool(landlord) and presence.is_online(landlord.id),
         events=events,
         open_requests_count=open_requests_count,
         next_payment=next_payment,
+        balance=balance,
         payment_labels=payment_labels,
         payment_data=payment_data
     )
 
 
+def landlord_id_for(tenant_id):
+    """Owner of the house the tenant is actively renting, if any."""
+    row = (
+        db.session.query(House.owner_id)
+        .join(Booking, Booking.house_id == House.id)
+        .filter(Booking.tenant_id == tenant_id, Booking.status == 'active')
+        .first()
+    )
+    return row[0] if row else None
+
+
 # Make a booking for a house
-@tenant_bp.route('/bookings/<int:house_id>')
+@tenant_bp.route('/bookings/<int:house_id>', methods=['POST'])
 @login_required
+@idempotent('tenant.bookings')
 def bookings(house_id):
-    booking = Booking(tenant_id=current_user.id, house_id=house_id, status='pending')
-    db.session.add(booking)
+    try:
+        reserve(current_user.id, house_id)
+    except BookingConflict as e:
+        db.session.rollback()
+        flash(str(e), "warning")
+        return redirect(url_for('tenant.properties'))
+    house = House.query.get(house_id)
+    notifications.notify(house.owner_id, f"{current_user.name} requested to book {house.title}.", commit=False)
     db.session.commit()
     return redirect(url_for('tenant.dashboard'))
 
 @tenant_bp.route("/properties", methods=['GET'])
+@read_only
 def properties():
     query = request.args.get('query', '')
     is_guest = not current_user.is_authenticated
-    print(f"Search query: {query}, Guest: {is_guest}")
-    if query:
+    try:
+        start = parse_date(request.args.get('start'))
+        end = parse_date(request.args.get('end'))
+    except BookingConflict as e:
+        flash(str(e), "warning")
+        start = end = None
+    if start or end:
+        # Free for the whole range, optionally narrowed by category and place
+        houses = available_between(start, end, category=request.args.get('category'),
+                                   city=request.args.get('city'), location=query or None)
+    elif query:
         houses = House.query.filter(
             (House.location.ilike(f'%{query}%')) |
             (House.title.ilike(f'%{query}%'))
         ).all()
     else:
         houses = House.query.all()
-    print(f"Found houses: {len(houses)}")
-    return render_template('index.html', houses=houses, query=query, is_guest=is_guest)
+    return render_template('index.html', houses=houses, query=query, is_guest=is_guest,
+                           start=start, end=end)
 
 
 @tenant_bp.route('/upload_document', methods=['GET', 'POST'])
@@ -151,6 +184,7 @@ def announcements():
 
 @tenant_bp.route('/submit_request', methods=['GET', 'POST'])
 @login_required
+@idempotent('tenant.submit_request')
 def submit_request():
     if request.method == 'POST':
         issue = request.form.get('issue')
@@ -158,13 +192,20 @@ def submit_request():
             flash("Please describe the issue before submitting.", "danger")
             return redirect(url_for('tenant.submit_request'))
 
+        active_booking = Booking.query.filter_by(tenant_id=current_user.id, status='active').first()
         request_obj = MaintenanceRequest(
             tenant_id=current_user.id,
+            house_id=active_booking.house_id if active_booking else None,
             issue=issue,
             status="Open",
             date_submitted=datetime.utcnow()
         )
         db.session.add(request_obj)
+        notifications.notify(
+            landlord_id_for(current_user.id),
+            f"New maintenance request from {current_user.name}: {issue}",
+            commit=False,
+        )
         db.session.commit()
 
         flash("Maintenance request submitted successfully!", "success")
@@ -174,18 +215,43 @@ def submit_request():
 
 @tenant_bp.route('/pay_rent', methods=['GET', 'POST'])
 @login_required
+@idempotent('tenant.pay_rent')
+@audited('tenant.pay_rent', form_fields=('amount',))
 def pay_rent():
     if request.method == 'POST':
-        amount = request.form.get('amount')
+        try:
+            amount = ledger.to_decimal(request.form.get('amount'))
+        except ledger.InvalidAmount as e:
+            flash(str(e), "warning")
+            return redirect(url_for('tenant.dashboard'))
+        active_booking = Booking.query.filter_by(tenant_id=current_user.id, status='active').first()
+        charge = ledger.next_charge(current_user.id)
         payment = Payment(
             tenant_id=current_user.id,
+            house_id=active_booking.house_id if active_booking else None,
             amount=amount,
             date=datetime.utcnow(),
+            due_date=charge.due_date if charge else None,
             status='Pending'
         )
         db.session.add(payment)
+        notifications.notify(current_user.id, f"Your rent payment of KES {amount} is pending confirmation.",
+                             commit=False)
         db.session.commit()
-        flash("Rent payment submitted!", "success")
+        if mpesa.enabled():
+            # After the commit: the callback must find the payment, and no
+            # transaction is held open across the call to Daraja
+            try:
+                mpesa.request_payment(payment, request.form.get('phone') or current_user.phone_number)
+            except mpesa.MpesaError as e:
+                db.session.rollback()
+                payment.status = 'Failed'
+                db.session.commit()
+                flash(str(e), "warning")
+                return redirect(url_for('tenant.dashboard'))
+            flash("Approve the M-Pesa prompt on your phone to complete the payment.", "success")
+        else:
+            flash("Rent payment submitted!", "success")
         return redirect(url_for('tenant.dashboard'))
 
     return render_template('pay_rent.html')
@@ -213,6 +279,8 @@ def feedback():
 @tenant_bp.route('/2fa_setup', methods=['GET', 'POST'])
 @login_required
 def twofa_setup():
+    import pyotp  # only needed on this page; kept off the import path of the blueprint
+
     # Ensure the user is a tenant
     if current_user.role != 'tenant':
         flash('Access restricted to tenants.', category='error')
@@ -263,9 +331,14 @@ def twofa_setup():
 
 @tenant_bp.route('/move_out/<int:booking_id>', methods=['POST'])
 @login_required
+@audited('tenant.move_out', 'booking', target_arg='booking_id')
 def move_out(booking_id):
     booking = Booking.query.filter_by(id=booking_id, tenant_id=current_user.id).first_or_404()
     booking.status = 'move_out_requested'
+    house = House.query.get(booking.house_id)
+    if house:
+        notifications.notify(house.owner_id, f"{current_user.name} requested to move out of {house.title}.",
+                             commit=False)
     db.session.commit()
     return redirect(url_for('tenant.dashboard'))
 
@@ -299,22 +372,24 @@ def contact_providers():
 @tenant_bp.route('/chat/<int:landlord_id>', methods=['GET', 'POST'])
 @login_required
 def chat(landlord_id):
+    landlord = db.get_or_404(User, landlord_id)
     if request.method == 'POST':
-        message = Message(
-            sender_id=current_user.id,
-            receiver_id=landlord_id,
-            content=request.form['message']
-        )
-        db.session.add(message)
+        try:
+            conversations.send(current_user.id, landlord_id, request.form.get('message'))
+        except conversations.MessagingError as e:
+            db.session.rollback()
+            flash(str(e), "warning")
+        return redirect(url_for('tenant.chat', landlord_id=landlord_id))
+
+    # Latest page only; older messages load from messages.thread as the user scrolls
+    conversation = conversations.find(current_user.id, landlord_id)
+    thread_messages = []
+    if conversation is not None:
+        thread_messages = conversations.thread(conversation)
+        conversations.mark_read(conversation, current_user.id)
         db.session.commit()
-
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == landlord_id)) |
-        ((Message.sender_id == landlord_id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.timestamp.asc()).all()
-
-    landlord = User.query.get(landlord_id)
-    return render_template('chat.html', messages=messages, user=landlord)
+    return render_template('messages/chat.html', other=landlord, conversation=conversation,
+                           thread_messages=thread_messages)
 
 
 # routes/tenant_routes.py
@@ -338,6 +413,11 @@ def settings():
 
 
 @tenant_bp.route('/notifications')
+@login_required
 def view_notifications():
-    # Fetch notifications
-    return render_template('tenant/notifications.html')
\ No newline at end of file
+    items = notifications.recent(current_user.id, limit=50, before_id=request.args.get('before_id', type=int))
+    return render_template(
+        'tenant/notifications.html',
+        notifications=items,
+        unread_count=notifications.unread_count(current_user),
+    )
\ No newline at end of file
@@ -0,0 +1,153 @@
+import logging
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import exists, or_
+
+from extensions import db, socketio
+from models.models import Announcement, Booking, House, Notification, User
+from services import jobs
+from services.notifications import increment_unread
+from services.messaging import deliver_email
+
+logger = logging.getLogger(__name__)
+
+
+def create_announcement(message, author_id=None, role=None, city=None, house_id=None):
+    """Store the announcement once and queue its fan-out; returns immediately."""
+    announcement = Announcement(
+        message=message,
+        author_id=author_id,
+        audience_role=role or None,
+        audience_city=city or None,
+        audience_house_id=house_id or None,
+    )
+    db.session.add(announcement)
+    db.session.flush()
+    jobs.enqueue('announcement.fanout', {'announcement_id': announcement.id},
+                 idempotency_key=f"announcement:{announcement.id}", commit=False)
+    db.session.commit()
+    return announcement
+
+
+def audience_query(announcement):
+    """Query of User.id for everyone the announcement targets."""
+    query = db.session.query(User.id)
+    if announcement.audience_role:
+        query = query.filter(User.role == announcement.audience_role)
+
+    house_filters = []
+    if announcement.audience_house_id:
+        house_filters.append(House.id == announcement.audience_house_id)
+    if announcement.audience_city:
+        house_filters.append(House.city == announcement.audience_city)
+    if house_filters:
+        # Tenants with an active booking there, plus the owning landlords
+        tenant_of = exists().where(
+            Booking.tenant_id == User.id, Booking.house_id == House.id,
+            Booking.status == 'active', *house_filters
+        )
+        owner_of = exists().where(House.owner_id == User.id, *house_filters)
+        query = query.filter(or_(tenant_of, owner_of))
+    return query
+
+
+def _payload(announcement):
+    return {
+        'id': announcement.id,
+        'message': announcement.message,
+        'created_at': announcement.created_at.isoformat() if announcement.created_at else None,
+    }
+
+
+def push_broadcast(announcement):
+    """Role-wide and platform-wide announcements reach online users with one emit."""
+    if announcement.audience_role:
+        socketio.emit('announcement', _payload(announcement), room=f"role_{announcement.audience_role}")
+    else:
+        socketio.emit('announcement', _payload(announcement))
+
+
+def push_to_users(announcement, user_ids):
+    payload = _payload(announcement)
+    for user_id in user_ids:
+        socketio.emit('announcement', payload, room=f"user_{user_id}")
+
+
+def progress(announcement):
+    return {
+        'id': announcement.id,
+        'status': announcement.status,
+        'delivered': announcement.delivered_count,
+        'total': announcement.total_recipients,
+        'completed_at': announcement.completed_at.isoformat() if announcement.completed_at else None,
+    }
+
+
+# ---------------- Jobs ----------------
+@jobs.job('announcement.fanout', max_attempts=10, concurrency=2, backoff=10)
+def fan_out(announcement_id):
+    """
+    Insert one Notification per recipient in chunks, walking users by id.
+
+    The chunk's rows and the announcement's cursor commit together, so a
+    retried job resumes after the last delivered chunk instead of starting over.
+    """
+    announcement = db.session.get(Announcement, announcement_id)
+    if announcement is None or announcement.status == 'done':
+        return
+    chunk_size = current_app.config['ANNOUNCEMENT_CHUNK_SIZE']
+    targeted = bool(announcement.audience_city or announcement.audience_house_id)
+
+    if announcement.total_recipients is None:
+        announcement.total_recipients = audience_query(announcement).count()
+        announcement.status = 'delivering'
+        db.session.commit()
+        if not targeted:
+            push_broadcast(announcement)
+
+    while True:
+        user_ids = [
+            row[0] for row in audience_query(announcement)
+            .filter(User.id > announcement.last_user_id)
+            .order_by(User.id)
+            .limit(chunk_size)
+            .all()
+        ]
+        if not user_ids:
+            break
+
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(Notification, [
+            {'tenant_id': user_id, 'message': announcement.message, 'date': now,
+             'announcement_id': announcement.id}
+            for user_id in user_ids
+        ])
+        increment_unread(user_ids)
+        announcement.last_user_id = user_ids[-1]
+        announcement.delivered_count += len(user_ids)
+        jobs.enqueue('announcement.email_batch',
+                     {'announcement_id': announcement.id, 'user_ids': user_ids},
+                     idempotency_key=f"announcement:{announcement.id}:email:{user_ids[0]}",
+                     commit=False)
+        db.session.commit()
+
+        if targeted:
+            push_to_users(announcement, user_ids)
+        logger.info(f"Announcement {announcement.id}: {announcement.delivered_count}/"
+                    f"{announcement.total_recipients} delivered")
+
+    announcement.status = 'done'
+    announcement.completed_at = datetime.utcnow()
+    db.session.commit()
+
+
+@jobs.job('announcement.email_batch', max_attempts=6, concurrency=4)
+def email_batch(announcement_id, user_ids):
+    announcement = db.session.get(Announcement, announcement_id)
+    if announcement is None:
+        return
+    emails = db.session.query(User.email).filter(User.id.in_(user_ids)).all()
+    for (email,) in emails:
+        if email:
+            deliver_email(email, "HomeHub announcement", announcement.message)
@@ -0,0 +1,200 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import request, send_from_directory, url_for
+
+logger = logging.getLogger(__name__)
+
+# Static sources that get a fingerprinted, minified copy under static/<ASSETS_DIST>/.
+# Templates reference them by source path through asset_url().
+ASSETS = [
+    'CSS/styles.css',
+    'CSS/index.css',
+    'Javascript/main.js',
+    'Javascript/index.js',
+]
+
+HASH_LENGTH = 10
+ONE_YEAR = 365 * 24 * 3600
+MANIFEST = 'manifest.json'
+
+_manifest = {}
+_dist = 'dist'
+_directory = None
+
+
+# ---------------- Minification ----------------
+def minify_css(text):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(text)
+    except ImportError:
+        pass
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """
+    Use rjsmin when installed. The fallback only trims indentation, blank lines
+    and whole-line // comments, which is safe without a real JS tokenizer.
+    """
+    try:
+        import rjsmin
+        return rjsmin.jsmin(text)
+    except ImportError:
+        pass
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+?)\1\s*\)""")
+
+
+def rebase_css_urls(text, source, built):
+    """
+    Rewrite relative url() references in a stylesheet moved from `source` to
+    `built` (both relative to the static folder) so they still point at the
+    original files. Absolute, root-relative and data: URLs are left alone.
+    """
+    source_dir = posixpath.dirname(source)
+    built_dir = posixpath.dirname(built)
+
+    def rebase(match):
+        quote, target = match.groups()
+        if re.match(r'^([a-z][a-z0-9+.-]*:|/|#)', target, re.I):
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(source_dir, target))
+        return f"url({quote}{posixpath.relpath(path, built_dir)}{quote})"
+
+    return CSS_URL_RE.sub(rebase, text)
+
+
+# ---------------- Build ----------------
+def _write_compressed(path, data):
+    with gzip.open(path + '.gz', 'wb', compresslevel=9) as fh:
+        fh.write(data)
+    try:
+        import brotli
+    except ImportError:
+        return
+    with open(path + '.br', 'wb') as fh:
+        fh.write(brotli.compress(data, quality=11))
+
+
+def build_assets(static_folder, dist='dist', minify=True):
+    """
+    Minify every entry in ASSETS, write it as name.<hash>.ext with .gz/.br
+    siblings, and record source -> built path in dist/manifest.json.
+    Outputs from earlier builds are removed once the new manifest is written.
+    """
+    out_dir = os.path.join(static_folder, dist)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for source in ASSETS:
+        src_path = os.path.join(static_folder, source)
+        with open(src_path, encoding='utf-8') as fh:
+            text = fh.read()
+        base, ext = os.path.splitext(source)
+        if ext == '.css':
+            # The built copy lives under dist/; its hash-named path is unknown
+            # yet, but only its directory matters here
+            text = rebase_css_urls(text, source, posixpath.join(dist, source))
+        if minify and ext in MINIFIERS:
+            text = MINIFIERS[ext](text)
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+        built = f"{base}.{digest}{ext}"
+        out_path = os.path.join(out_dir, built)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        if not os.path.exists(out_path):
+            with open(out_path, 'wb') as fh:
+                fh.write(data)
+            _write_compressed(out_path, data)
+        manifest[source] = built
+
+    tmp_path = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST))
+
+    keep = {os.path.normpath(os.path.join(out_dir, b)) for b in manifest.values()}
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            path = os.path.normpath(os.path.join(root, name))
+            if name == MANIFEST or path in keep or path[:-3] in keep:
+                continue
+            os.remove(path)
+    return manifest
+
+
+def load_manifest(static_folder, dist='dist'):
+    path = os.path.join(static_folder, dist, MANIFEST)
+    try:
+        with open(path, encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+# ---------------- Serving ----------------
+def asset_url(filename, **values):
+    """
+    Drop-in for url_for('static', filename=...): returns the fingerprinted
+    build when one exists, otherwise the plain static file.
+    """
+    built = _manifest.get(filename)
+    if built:
+        return url_for('assets', filename=built, **values)
+    return url_for('static', filename=filename, **values)
+
+
+def serve_asset(filename):
+    """Serve a built file, preferring a precompressed copy the client accepts."""
+    accepted = request.accept_encodings
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] and os.path.isfile(os.path.join(_directory, filename + suffix)):
+            encoding = candidate
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if mimetype.startswith('text/') or mimetype.endswith('javascript'):
+        mimetype += '; charset=utf-8'
+    served = filename + ('.br' if encoding == 'br' else '.gz' if encoding else '')
+    response = send_from_directory(_directory, served, mimetype=mimetype, max_age=ONE_YEAR)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """
+    Register asset_url for templates and the far-future route for built files.
+
+    Built files are used unless ASSETS_DEBUG is on; run `flask build-assets`
+    after changing anything listed in ASSETS.
+    """
+    global _manifest, _dist, _directory
+    _dist = app.config['ASSETS_DIST']
+    _directory = os.path.join(app.static_folder, _dist)
+    _manifest = {} if app.config['ASSETS_DEBUG'] else load_manifest(app.static_folder, _dist)
+    if not _manifest and not app.config['ASSETS_DEBUG']:
+        logger.info("No asset manifest found; serving unminified static files")
+
+    app.add_url_rule(f"{app.static_url_path}/{_dist}/<path:filename>", 'assets', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
@@ -0,0 +1,213 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+from functools import wraps
+
+from flask import has_request_context, request, session
+from flask_login import current_user
+
+from extensions import db
+from models.models import AuditEvent
+from services import exports
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """
+    Buffers audit events in memory and writes them from one background thread.
+
+    Views call record(), which only enqueues a dict; the writer drains the queue
+    and inserts up to AUDIT_BATCH_SIZE rows per commit, so auditing adds no
+    commit to the request that triggered it.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self.batch_size = 200
+        self.flush_interval = 1.0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.dropped = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config['AUDIT_BATCH_SIZE']
+        self.flush_interval = app.config['AUDIT_FLUSH_INTERVAL']
+        self.queue = queue.Queue(maxsize=app.config['AUDIT_QUEUE_SIZE'])
+        app.extensions['audit'] = self
+        atexit.register(self.stop)
+
+    def _ensure_thread(self):
+        # Started on first use so CLI commands and migrations never spawn it
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def put(self, event):
+        if self.queue is None:
+            return
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Audit queue full; dropped {event['action']} (total dropped {self.dropped})")
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                db.session.bulk_insert_mappings(AuditEvent, batch)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to write {len(batch)} audit event(s): {e}", exc_info=True)
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._write(self._drain(first))
+
+    def flush(self):
+        """Write everything queued so far from the calling thread."""
+        while True:
+            try:
+                first = self.queue.get_nowait()
+            except (queue.Empty, AttributeError):
+                return
+            self._write(self._drain(first))
+
+    def stop(self):
+        self._stopping.set()
+        if self.app is not None:
+            self.flush()
+
+
+writer = AuditWriter()
+
+
+def init_app(app):
+    writer.init_app(app)
+    exports.register_export(
+        'audit',
+        [AuditEvent.id, AuditEvent.created_at, AuditEvent.actor_id, AuditEvent.action,
+         AuditEvent.target_type, AuditEvent.target_id, AuditEvent.ip_address, AuditEvent.detail],
+        AuditEvent.id,
+    )
+
+
+def record(action, target_type=None, target_id=None, /, actor_id=None, **detail):
+    """
+    Queue one audit event. Never raises and never touches the request's session.
+    The first three are positional-only so detail may use their names as keys.
+    """
+    try:
+        now = datetime.utcnow()
+        if actor_id is None and has_request_context() and current_user.is_authenticated:
+            actor_id = current_user.id
+        writer.put({
+            'partition': now.strftime('%Y%m'),
+            'created_at': now,
+            'actor_id': actor_id,
+            'action': action,
+            'target_type': target_type,
+            'target_id': str(target_id) if target_id is not None else None,
+            'ip_address': request.remote_addr if has_request_context() else None,
+            'detail': json.dumps(detail, default=str) if detail else None,
+        })
+    except Exception as e:
+        logger.error(f"Could not record audit event {action}: {e}", exc_info=True)
+
+
+def _flashed_error(before):
+    # Validation failures in this app are a flash('...', 'danger') and a redirect
+    return any(category == 'danger' for category, _ in session.get('_flashes', ())[before:])
+
+
+def audited(action, target_type=None, target_arg=None, form_fields=(), methods=('POST',)):
+    """
+    Record an audit event after the wrapped view returns without raising.
+
+    target_arg names the URL argument holding the target id; form_fields lists
+    request.form keys kept under "form" in the event detail. Views that reject
+    the request by flashing a "danger" message record nothing.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            flashed = len(session.get('_flashes', ()))
+            response = view(*args, **kwargs)
+            if request.method in methods and not _flashed_error(flashed):
+                form = {}
+                for field in form_fields:
+                    values = request.form.getlist(field)
+                    if values:
+                        form[field] = values if len(values) > 1 else values[0]
+                detail = {'form': form} if form else {}
+                record(action, target_type, kwargs.get(target_arg) if target_arg else None, **detail)
+            return response
+        return wrapper
+    return decorator
+
+
+def query_events(actor_id=None, action=None, target_type=None, target_id=None,
+                 since=None, until=None, before_id=None, limit=100):
+    """
+    Newest-first audit events, paginated by id (pass the last id as before_id).
+
+    Every filter maps onto an indexed column; since/until also narrow the
+    partition range so large tables are only scanned month by month.
+    """
+    query = AuditEvent.query
+    if actor_id is not None:
+        query = query.filter(AuditEvent.actor_id == actor_id)
+    if action:
+        query = query.filter(AuditEvent.action == action)
+    if target_type:
+        query = query.filter(AuditEvent.target_type == target_type)
+        if target_id is not None:
+            query = query.filter(AuditEvent.target_id == str(target_id))
+    if since:
+        query = query.filter(AuditEvent.partition >= since.strftime('%Y%m'),
+                             AuditEvent.created_at >= since)
+    if until:
+        query = query.filter(AuditEvent.partition <= until.strftime('%Y%m'),
+                             AuditEvent.created_at < until)
+    if before_id:
+        query = query.filter(AuditEvent.id < before_id)
+    return query.order_by(AuditEvent.id.desc()).limit(max(1, min(limit, 1000))).all()
+
+
+def event_to_dict(event):
+    return {
+        'id': event.id,
+        'created_at': event.created_at.isoformat(),
+        'actor_id': event.actor_id,
+        'action': event.action,
+        'target_type': event.target_type,
+        'target_id': event.target_id,
+        'ip_address': event.ip_address,
+        'detail': json.loads(event.detail) if event.detail else None,
+    }
@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import event, exists, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models.models import Booking, House
+
+logger = logging.getLogger(__name__)
+
+# Bookings in these states occupy the house for their date range
+BLOCKING_STATUSES = ('active', 'approved', 'move_out_requested')
+
+# Open-ended leases: no start means "since forever", no end means "until further notice"
+OPEN_START = date.min
+OPEN_END = date.max
+
+
+class BookingConflict(Exception):
+    """The house is unavailable or already leased for part of the requested dates."""
+
+
+def parse_date(value):
+    """YYYY-MM-DD from a form or query string; blank means open-ended."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise BookingConflict(f"{value!r} is not a valid date (use YYYY-MM-DD).")
+
+
+def _bounds(start, end):
+    return start or OPEN_START, end or OPEN_END
+
+
+# ---------------- Interval index ----------------
+class IntervalIndex:
+    """
+    Half-open [start, end) intervals for one house, sorted by start, with a
+    running maximum of end dates. An overlap query is one bisect plus one
+    lookup, and stays correct even if stored leases overlap each other.
+    """
+
+    def __init__(self):
+        self._items = []    # (start, end, booking_id), sorted
+        self._max_end = []  # _max_end[i] = max end over _items[:i + 1]
+
+    def __len__(self):
+        return len(self._items)
+
+    def _recompute_from(self, i):
+        running = self._max_end[i - 1] if i > 0 else OPEN_START
+        del self._max_end[i:]
+        for _, end, _ in self._items[i:]:
+            running = max(running, end)
+            self._max_end.append(running)
+
+    def add(self, start, end, booking_id):
+        item = (start, end, booking_id)
+        insort(self._items, item)
+        self._recompute_from(self._items.index(item))
+
+    def remove(self, booking_id):
+        for i, item in enumerate(self._items):
+            if item[2] == booking_id:
+                del self._items[i]
+                self._recompute_from(i)
+                return True
+        return False
+
+    def overlaps(self, start, end):
+        # Intervals starting before `end` are _items[:i]; one of them overlaps
+        # exactly when the largest end among them is after `start`.
+        i = bisect_left(self._items, (end,))
+        return i > 0 and self._max_end[i - 1] > start
+
+
+class AvailabilityIndex:
+    """
+    In-memory interval indexes for every house with current or future leases.
+
+    Bookings committed by this process are applied as they commit; a full
+    rebuild every AVAILABILITY_REFRESH seconds picks up other processes'
+    writes. Searches may therefore lag by that long, so booking itself always
+    re-checks against the database (see reserve()).
+    """
+
+    def __init__(self):
+        self._houses = {}
+        self._booking_house = {}
+        self._lock = threading.Lock()
+        self._built_at = None
+
+    def rebuild(self):
+        today = date.today()
+        rows = (
+            db.session.query(Booking.id, Booking.house_id, Booking.lease_start_date, Booking.lease_end_date)
+            .filter(Booking.status.in_(BLOCKING_STATUSES))
+            .filter(or_(Booking.lease_end_date.is_(None), Booking.lease_end_date > today))
+            .all()
+        )
+        houses, booking_house = {}, {}
+        for booking_id, house_id, start, end in rows:
+            houses.setdefault(house_id, IntervalIndex()).add(*_bounds(start, end), booking_id)
+            booking_house[booking_id] = house_id
+        with self._lock:
+            self._houses, self._booking_house = houses, booking_house
+            self._built_at = time.monotonic()
+        logger.info(f"Availability index rebuilt: {len(rows)} lease(s) over {len(houses)} house(s)")
+
+    def ensure_fresh(self):
+        max_age = current_app.config['AVAILABILITY_REFRESH']
+        if self._built_at is None or time.monotonic() - self._built_at > max_age:
+            self.rebuild()
+
+    def apply(self, booking_id, house_id, status, start, end):
+        """Reflect one committed booking change."""
+        with self._lock:
+            old_house = self._booking_house.pop(booking_id, None)
+            if old_house is not None and old_house in self._houses:
+                self._houses[old_house].remove(booking_id)
+            if house_id is not None and status in BLOCKING_STATUSES:
+                self._houses.setdefault(house_id, IntervalIndex()).add(*_bounds(start, end), booking_id)
+                self._booking_house[booking_id] = house_id
+
+    def is_free(self, house_id, start, end):
+        index = self._houses.get(house_id)
+        return index is None or not index.overlaps(*_bounds(start, end))
+
+
+availability = AvailabilityIndex()
+
+
+# Keep the index in step with this process's own commits
+@event.listens_for(Session, 'after_flush')
+def _collect_booking_changes(session, flush_context):
+    changed = session.info.setdefault('booking_changes', {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Booking):
+            changed[obj.id] = (obj.house_id, obj.status, obj.lease_start_date, obj.lease_end_date)
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            changed[obj.id] = (None, None, None, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_booking_changes(session):
+    changed = session.info.pop('booking_changes', None)
+    if changed and availability._built_at is not None:
+        for booking_id, values in changed.items():
+            availability.apply(booking_id, *values)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_booking_changes(session):
+    session.info.pop('booking_changes', None)
+
+
+# ---------------- Queries ----------------
+def overlap_clause(start, end):
+    """Blocking bookings whose [start, end) intersects the given range."""
+    clauses = [Booking.status.in_(BLOCKING_STATUSES)]
+    if end:
+        clauses.append(or_(Booking.lease_start_date.is_(None), Booking.lease_start_date < end))
+    if start:
+        clauses.append(or_(Booking.lease_end_date.is_(None), Booking.lease_end_date > start))
+    return clauses
+
+
+def available_between(start, end, category=None, city=None, location=None):
+    """
+    Houses that are listed as available and have no lease intersecting
+    [start, end). Category and location narrow the candidates in SQL; the date
+    check runs against the in-memory index.
+    """
+    availability.ensure_fresh()
+    query = House.query.filter(House.available.is_(True))
+    if category:
+        query = query.filter(House.category == category)
+    if city:
+        query = query.filter(House.city == city)
+    if location:
+        query = query.filter(House.location.ilike(f"%{location}%"))
+    if start:
+        query = query.filter(or_(House.availability_date.is_(None), House.availability_date <= start))
+    return [house for house in query.all() if availability.is_free(house.id, start, end)]
+
+
+def reserve(tenant_id, house_id, start=None, end=None, status='pending'):
+    """
+    Create a booking after checking, under a lock on the house row, that the
+    house is available and no lease overlaps the requested dates. Raises
+    BookingConflict; the caller commits.
+    """
+    if start and end and end <= start:
+        raise BookingConflict("The lease must end after it starts.")
+
+    # FOR UPDATE serializes concurrent bookings of the same house (a no-op on SQLite,
+    # which already serializes writers)
+    house = House.query.filter_by(id=house_id).with_for_update().first()
+    if house is None:
+        raise BookingConflict("This property no longer exists.")
+    if house.available is False:
+        raise BookingConflict("This property is not accepting bookings.")
+    if start and house.availability_date and start < house.availability_date:
+        raise BookingConflict(f"This property is available from {house.availability_date:%Y-%m-%d}.")
+
+    taken = db.session.query(exists().where(Booking.house_id == house_id, *overlap_clause(start, end))).scalar()
+    if taken:
+        raise BookingConflict("This property is already leased for part of those dates.")
+
+    booking = Booking(tenant_id=tenant_id, house_id=house_id, status=status,
+                      lease_start_date=start, lease_end_date=end)
+    try:
+        with db.session.begin_nested():
+            db.session.add(booking)
+    except IntegrityError:
+        # uq_booking_one_pending: this tenant already has a pending request here
+        raise BookingConflict("You already have a pending request for this property.")
+    return booking
+
+
+def backfill_pending_slots(batch_size=1000):
+    """
+    Set pending_slot on pending bookings stored before the column existed, so
+    uq_booking_one_pending covers them. Where a tenant already has several
+    pending requests for one house only the oldest takes the slot. Returns
+    (slotted, duplicates).
+    """
+    slotted = duplicates = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(Booking.id, Booking.tenant_id, Booking.house_id)
+            .filter(Booking.status == 'pending', Booking.pending_slot.is_(None), Booking.id > last_id)
+            .order_by(Booking.id).limit(batch_size).all()
+        )
+        if not rows:
+            return slotted, duplicates
+        taken = set(
+            db.session.query(Booking.tenant_id, Booking.house_id)
+            .filter(Booking.pending_slot == 1, Booking.house_id.in_({row.house_id for row in rows}))
+            .all()
+        )
+        ids = []
+        for row in rows:
+            pair = (row.tenant_id, row.house_id)
+            if pair in taken:
+                duplicates += 1
+            else:
+                taken.add(pair)
+                ids.append(row.id)
+        if ids:
+            Booking.query.filter(Booking.id.in_(ids)).update({Booking.pending_slot: 1}, synchronize_session=False)
+        db.session.commit()
+        slotted += len(ids)
+        last_id = rows[-1].id
@@ -0,0 +1,175 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import literal, select, union_all
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models.models import Conversation, Message, User
+from services.notifications import queue_push
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 200
+MAX_PAGE = 100
+
+
+class MessagingError(Exception):
+    """A message that cannot be sent or a thread the user may not read."""
+
+
+def pair(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+def find(user_a, user_b):
+    low, high = pair(user_a, user_b)
+    return Conversation.query.filter_by(user_low_id=low, user_high_id=high).first()
+
+
+def get_or_create(user_a, user_b):
+    """The pair's conversation, created on first contact. Does not commit."""
+    if user_a == user_b:
+        raise MessagingError("You cannot message yourself.")
+    conversation = find(user_a, user_b)
+    if conversation is not None:
+        return conversation
+    low, high = pair(user_a, user_b)
+    try:
+        with db.session.begin_nested():
+            conversation = Conversation(user_low_id=low, user_high_id=high)
+            db.session.add(conversation)
+    except IntegrityError:
+        # uq_conversation_pair: the other side started it at the same moment
+        conversation = find(user_a, user_b)
+    return conversation
+
+
+def to_dict(message):
+    return {
+        'id': message.id,
+        'conversation_id': message.conversation_id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'content': message.content,
+        'timestamp': message.timestamp.isoformat() if message.timestamp else None,
+    }
+
+
+def send(sender_id, receiver_id, content, commit=True):
+    """
+    Store a message, move the conversation's last-message fields and the
+    receiver's unread count in one UPDATE, and push it to both users' rooms
+    once committed.
+    """
+    content = (content or '').strip()
+    if not content:
+        raise MessagingError("Type a message first.")
+    if db.session.get(User, receiver_id) is None:
+        raise MessagingError("That user no longer exists.")
+
+    conversation = get_or_create(sender_id, receiver_id)
+    message = Message(conversation_id=conversation.id, sender_id=sender_id, receiver_id=receiver_id,
+                      content=content, timestamp=datetime.utcnow())
+    db.session.add(message)
+    db.session.flush()
+
+    unread = Conversation.unread_low if receiver_id == conversation.user_low_id else Conversation.unread_high
+    Conversation.query.filter_by(id=conversation.id).update({
+        Conversation.last_message_id: message.id,
+        Conversation.last_message_at: message.timestamp,
+        Conversation.last_message_preview: content[:PREVIEW_LENGTH],
+        Conversation.last_sender_id: sender_id,
+        unread: unread + 1,
+    }, synchronize_session=False)
+
+    payload = to_dict(message)
+    for user_id in (receiver_id, sender_id):
+        queue_push(f"user_{user_id}", 'direct_message', payload)
+    if commit:
+        db.session.commit()
+    return message
+
+
+def _page_size(limit):
+    # A negative LIMIT means "no limit" on SQLite
+    return max(1, min(limit, MAX_PAGE))
+
+
+def thread(conversation, before_id=None, limit=50):
+    """
+    One page of a conversation, oldest first: the `limit` messages before
+    before_id (or the latest ones). Served by ix_message_conversation_id.
+    """
+    query = Message.query.filter(Message.conversation_id == conversation.id)
+    if before_id:
+        query = query.filter(Message.id < before_id)
+    page = query.order_by(Message.id.desc()).limit(_page_size(limit)).all()
+    page.reverse()
+    return page
+
+
+def mark_read(conversation, user_id):
+    """Zero the user's unread count on this conversation. Does not commit."""
+    column = Conversation.unread_low if user_id == conversation.user_low_id else Conversation.unread_high
+    Conversation.query.filter(Conversation.id == conversation.id, column > 0).update(
+        {column: 0}, synchronize_session=False)
+
+
+def inbox(user_id, limit=20, before=None):
+    """
+    The user's conversations, most recent first, as dicts. The user may be
+    either side of a pair, so this is a UNION ALL of two range scans (one per
+    side's index) rather than an OR that no single index can serve.
+    """
+    limit = _page_size(limit)
+
+    def side(own, other, unread):
+        query = (
+            select(Conversation.id.label('id'), other.label('other_id'), User.name.label('other_name'),
+                   unread.label('unread'), Conversation.last_message_at.label('last_message_at'),
+                   Conversation.last_message_preview.label('preview'),
+                   (Conversation.last_sender_id == literal(user_id)).label('sent_by_me'))
+            .join(User, User.id == other)
+            .where(own == user_id, Conversation.last_message_at.isnot(None))
+        )
+        if before is not None:
+            query = query.where(Conversation.last_message_at < before)
+        return query.order_by(Conversation.last_message_at.desc()).limit(limit)
+
+    both = union_all(
+        side(Conversation.user_low_id, Conversation.user_high_id, Conversation.unread_low).subquery().select(),
+        side(Conversation.user_high_id, Conversation.user_low_id, Conversation.unread_high).subquery().select(),
+    ).subquery()
+    rows = db.session.execute(
+        select(both).order_by(both.c.last_message_at.desc()).limit(limit)
+    ).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def backfill(batch_size=1000):
+    """Attach messages written before conversations existed; returns how many were moved."""
+    moved = 0
+    while True:
+        messages = (
+            Message.query.filter(Message.conversation_id.is_(None),
+                                 Message.sender_id.isnot(None), Message.receiver_id.isnot(None),
+                                 Message.sender_id != Message.receiver_id)
+            .order_by(Message.id).limit(batch_size).all()
+        )
+        if not messages:
+            return moved
+        conversations = {}
+        for message in messages:
+            key = pair(message.sender_id, message.receiver_id)
+            if key not in conversations:
+                conversations[key] = get_or_create(*key)
+            conversation = conversations[key]
+            message.conversation_id = conversation.id
+            if conversation.last_message_id is None or message.id > conversation.last_message_id:
+                conversation.last_message_id = message.id
+                conversation.last_message_at = message.timestamp
+                conversation.last_message_preview = (message.content or '')[:PREVIEW_LENGTH]
+                conversation.last_sender_id = message.sender_id
+        db.session.commit()
+        moved += len(messages)
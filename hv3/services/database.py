@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+
+from flask import current_app, jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+from extensions import db
+from services.replicas import REPLICA_BIND
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------- Checkout metrics ----------------
+class PoolMetrics:
+    """How long requests wait for a pooled connection, and how often they give up."""
+
+    SLOW_CHECKOUT = 0.1  # seconds
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.slow_checkouts = 0
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if waited >= self.SLOW_CHECKOUT:
+                self.slow_checkouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'slow_checkouts': self.slow_checkouts,
+                'avg_wait_ms': round(1000 * self.total_wait / self.checkouts, 2) if self.checkouts else 0,
+                'max_wait_ms': round(1000 * self.max_wait, 2),
+            }
+
+
+metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times every checkout, including the wait for a free slot."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        metrics.record(time.perf_counter() - start)
+        return connection
+
+
+# ---------------- Engine options ----------------
+def engine_options(config, role='web'):
+    """
+    Pool settings for the primary engine. Web processes and job workers size
+    their pools separately: a worker runs a handful of jobs at a time and
+    should not hold the connections web requests need.
+    """
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if uri.startswith('sqlite'):
+        # SQLite picks its own pool class; sizing options do not apply
+        return options
+    prefix = 'DB_WORKER_' if role == 'worker' else 'DB_'
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=config[f'{prefix}POOL_SIZE'],
+        max_overflow=config[f'{prefix}MAX_OVERFLOW'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+    )
+    return options
+
+
+def configure(app, role='web'):
+    """Set SQLALCHEMY_ENGINE_OPTIONS before db.init_app; explicit settings win."""
+    options = engine_options(app.config, role)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app.config['DB_POOL_ROLE'] = role
+
+
+# ---------------- Health ----------------
+def pool_status(engine):
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + pool._max_overflow
+        checked_out = pool.checkedout()
+        status.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            checked_out=checked_out,
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            saturation=round(checked_out / capacity, 3) if capacity > 0 else 0,
+        )
+    return status
+
+
+def healthz():
+    """Liveness plus pool saturation; 503 when the database cannot be reached."""
+    body = {'role': current_app.config['DB_POOL_ROLE']}
+    try:
+        start = time.perf_counter()
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        body['database'] = 'ok'
+        body['ping_ms'] = round(1000 * (time.perf_counter() - start), 2)
+        code = 200
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        body['database'] = 'unreachable'
+        code = 503
+
+    body.update(pool_status(db.engine))
+    body['checkout'] = metrics.snapshot()
+    if REPLICA_BIND in db.engines:
+        try:
+            with db.engines[REPLICA_BIND].connect() as connection:
+                connection.execute(text('SELECT 1'))
+            body['replica'] = 'ok'
+        except Exception as e:
+            # A lost replica slows read-only pages; it does not take the service down
+            logger.error(f"Replica health check failed: {e}")
+            body['replica'] = 'unreachable'
+    threshold = current_app.config['DB_SATURATION_WARN']
+    body['saturated'] = body.get('saturation', 0) >= threshold
+    body['status'] = 'ok' if code == 200 and not body['saturated'] else ('degraded' if code == 200 else 'down')
+    return jsonify(body), code
+
+
+def init_app(app):
+    app.add_url_rule('/healthz', 'healthz', healthz)
@@ -0,0 +1,161 @@
+import csv
+import logging
+import os
+import threading
+import uuid
+import zlib
+from datetime import datetime
+
+from extensions import db
+from models.models import User, House, Payment, Booking
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip; the driver streams results instead of buffering them
+YIELD_PER = 1000
+# Bytes of CSV gathered before a chunk is handed to the response / compressor
+FLUSH_BYTES = 64 * 1024
+
+# name -> (columns, order_by). Only plain columns are selected so rows come back
+# as tuples rather than ORM objects, and secrets like password_hash never leave.
+EXPORTS = {
+    'users': (
+        [User.id, User.name, User.email, User.phone_number, User.role, User.language],
+        User.id,
+    ),
+    'houses': (
+        [House.id, House.title, House.category, House.location, House.city, House.country,
+         House.rent_amount, House.bedrooms, House.bathrooms, House.available, House.owner_id],
+        House.id,
+    ),
+    'payments': (
+        [Payment.id, Payment.tenant_id, Payment.amount, Payment.date, Payment.due_date, Payment.status],
+        Payment.id,
+    ),
+    'bookings': (
+        [Booking.id, Booking.tenant_id, Booking.house_id, Booking.status,
+         Booking.lease_start_date, Booking.lease_end_date],
+        Booking.id,
+    ),
+}
+
+
+def register_export(name, columns, order_by):
+    """Make another table available to export_reports/stream_csv."""
+    EXPORTS[name] = (columns, order_by)
+
+
+def header(name):
+    columns, _ = EXPORTS[name]
+    return [c.key for c in columns]
+
+
+def iter_rows(name, filters=()):
+    """Yield export rows as tuples using a server-side cursor."""
+    columns, order_by = EXPORTS[name]
+    query = db.session.query(*columns).filter(*filters).order_by(order_by)
+    for row in query.yield_per(YIELD_PER):
+        yield tuple(row)
+
+
+class _LineBuffer:
+    """File-like sink that lets csv.writer build output without a StringIO per row."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, value):
+        self.parts.append(value)
+        self.size += len(value)
+
+    def drain(self):
+        data = ''.join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        return data.encode('utf-8')
+
+
+def stream_csv(name, compress=False, filters=()):
+    """Generator of CSV bytes for a Response; gzip-compresses on the fly if asked."""
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # 31 = gzip container
+
+    def emit(data):
+        if compressor is None:
+            return data
+        return compressor.compress(data)
+
+    writer.writerow(header(name))
+    for row in iter_rows(name, filters):
+        writer.writerow(row)
+        if buffer.size >= FLUSH_BYTES:
+            chunk = emit(buffer.drain())
+            if chunk:
+                yield chunk
+
+    chunk = emit(buffer.drain())
+    if chunk:
+        yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+
+# ---------------- Background XLSX ----------------
+def export_path(folder, token):
+    return os.path.join(folder, f"{token}.xlsx")
+
+
+def _write_xlsx(app, name, path, filters):
+    from openpyxl import Workbook
+
+    tmp_path = f"{path}.part"
+    try:
+        with app.app_context():
+            # write_only keeps a single row in memory at a time
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet(title=name[:31])
+            sheet.append(header(name))
+            for row in iter_rows(name, filters):
+                sheet.append(list(row))
+            workbook.save(tmp_path)
+            db.session.remove()
+        os.replace(tmp_path, path)
+        logger.info(f"XLSX export {name} written to {path}")
+    except Exception as e:
+        logger.error(f"XLSX export {name} failed: {e}", exc_info=True)
+        with open(f"{path}.failed", 'w') as fh:
+            fh.write(str(e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def start_xlsx_export(app, name, folder, filters=()):
+    """Generate an XLSX export in a background thread and return its download token."""
+    import openpyxl  # noqa: F401  fail in the request if the optional dependency is missing
+
+    os.makedirs(folder, exist_ok=True)
+    token = f"{name}-{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    # Mark the export pending before the thread starts so the status check never races it
+    open(f"{export_path(folder, token)}.part", 'wb').close()
+    thread = threading.Thread(
+        target=_write_xlsx,
+        args=(app, name, export_path(folder, token), filters),
+        name=f"xlsx-export-{token}",
+        daemon=True,
+    )
+    thread.start()
+    return token
+
+
+def export_status(folder, token):
+    """Return 'ready', 'pending', 'failed' or 'missing' for a background export."""
+    path = export_path(folder, token)
+    if os.path.exists(path):
+        return 'ready'
+    if os.path.exists(f"{path}.failed"):
+        return 'failed'
+    if os.path.exists(f"{path}.part"):
+        return 'pending'
+    return 'missing'
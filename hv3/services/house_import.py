@@ -0,0 +1,378 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from werkzeug.utils import secure_filename
+
+from extensions import db
+from models.models import House
+
+logger = logging.getLogger(__name__)
+
+# Categories used by the listing pages in routes/house_routes.py
+HOUSE_CATEGORIES = {'Rental', 'Hotel', 'BNB', 'RealEstate'}
+
+# Columns an import file may never set directly
+PROTECTED_COLUMNS = {'id'}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off', ''}
+
+# Common spellings seen in agency spreadsheets -> canonical country name
+COUNTRY_ALIASES = {
+    'ke': 'Kenya', 'ken': 'Kenya', 'kenya': 'Kenya',
+    'ug': 'Uganda', 'uga': 'Uganda', 'uganda': 'Uganda',
+    'tz': 'Tanzania', 'tza': 'Tanzania', 'tanzania': 'Tanzania',
+    'rw': 'Rwanda', 'rwa': 'Rwanda', 'rwanda': 'Rwanda',
+    'et': 'Ethiopia', 'eth': 'Ethiopia', 'ethiopia': 'Ethiopia',
+}
+
+CITY_ALIASES = {
+    'nbi': 'Nairobi', 'nrb': 'Nairobi',
+    'msa': 'Mombasa',
+    'ksm': 'Kisumu',
+}
+
+
+class RowError(ValueError):
+    """Raised when an import row does not fit the House schema."""
+
+
+class ImportReport:
+    """Running totals for one import run."""
+
+    def __init__(self, source, rejects_path):
+        self.source = source
+        self.rejects_path = rejects_path
+        self.inserted = 0
+        self.rejected = 0
+        self.skipped = 0  # rows already imported by a previous run
+
+    def to_dict(self):
+        return {
+            'source': self.source,
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'skipped': self.skipped,
+            'rejects_path': self.rejects_path if self.rejected else None,
+        }
+
+
+# ---------------- Reading ----------------
+def iter_rows(path):
+    """Yield (line_number, row_dict) from a CSV or JSON-lines file without loading it."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8-sig') as fh:
+        if ext in ('.jsonl', '.ndjson', '.json'):
+            for line_number, line in enumerate(fh, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, RowError(f"invalid JSON: {e}")
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, RowError("expected a JSON object per line")
+                    continue
+                yield line_number, row
+        else:
+            reader = csv.DictReader(fh)
+            for row in reader:
+                # DictReader counts the header, so line_num is the real file line
+                yield reader.line_num, row
+
+
+# ---------------- Validation ----------------
+def normalize_country(value):
+    if not value:
+        return None
+    key = value.strip().lower()
+    return COUNTRY_ALIASES.get(key, value.strip().title())
+
+
+def normalize_city(value):
+    if not value:
+        return None
+    key = value.strip().lower()
+    return CITY_ALIASES.get(key, ' '.join(value.split()).title())
+
+
+def _coerce(column, raw):
+    """Convert a raw cell to the Python type of a House column."""
+    if raw is None or (isinstance(raw, str) and raw.strip() == ''):
+        return None
+    python_type = column.type.python_type
+
+    if python_type is bool:
+        if isinstance(raw, bool):
+            return raw
+        text = str(raw).strip().lower()
+        if text in TRUE_VALUES:
+            return True
+        if text in FALSE_VALUES:
+            return False
+        raise RowError(f"{column.name}: not a boolean ({raw!r})")
+
+    if python_type is int:
+        try:
+            return int(str(raw).strip())
+        except ValueError:
+            raise RowError(f"{column.name}: not an integer ({raw!r})")
+
+    if python_type is float:
+        try:
+            return float(str(raw).replace(',', '').strip())
+        except ValueError:
+            raise RowError(f"{column.name}: not a number ({raw!r})")
+
+    if python_type is date:
+        if isinstance(raw, date):
+            return raw
+        try:
+            return datetime.strptime(str(raw).strip()[:10], '%Y-%m-%d').date()
+        except ValueError:
+            raise RowError(f"{column.name}: expected YYYY-MM-DD ({raw!r})")
+
+    value = str(raw).strip()
+    length = getattr(column.type, 'length', None)
+    if length and len(value) > length:
+        raise RowError(f"{column.name}: longer than {length} characters")
+    return value
+
+
+def validate_row(row, owner_id=None):
+    """Return a House mapping for bulk_insert_mappings or raise RowError."""
+    columns = House.__table__.columns
+    mapping = {}
+    for key, raw in row.items():
+        if key is None:
+            raise RowError("row has more cells than the header")
+        name = key.strip()
+        if name in PROTECTED_COLUMNS or name not in columns:
+            continue
+        if isinstance(raw, list):
+            raw = ','.join(str(v) for v in raw)
+        mapping[name] = _coerce(columns[name], raw)
+
+    if not mapping.get('title'):
+        raise RowError("title is required")
+    if mapping.get('rent_amount') is not None and mapping['rent_amount'] < 0:
+        raise RowError("rent_amount cannot be negative")
+    if mapping.get('category') and mapping['category'] not in HOUSE_CATEGORIES:
+        raise RowError(f"category must be one of {', '.join(sorted(HOUSE_CATEGORIES))}")
+    if mapping.get('lat') is not None and not -90 <= mapping['lat'] <= 90:
+        raise RowError("lat out of range")
+    if mapping.get('lng') is not None and not -180 <= mapping['lng'] <= 180:
+        raise RowError("lng out of range")
+
+    mapping['city'] = normalize_city(mapping.get('city'))
+    mapping['country'] = normalize_country(mapping.get('country'))
+    if not mapping.get('location'):
+        mapping['location'] = ', '.join(p for p in (mapping['city'], mapping['country']) if p) or None
+    if mapping.get('available') is None:
+        mapping['available'] = True
+    if owner_id is not None:
+        mapping['owner_id'] = owner_id
+    return mapping
+
+
+# ---------------- Images ----------------
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+
+class _AllowedHostRedirects(urllib.request.HTTPRedirectHandler):
+    """Follow redirects only to https URLs on the allowed hosts."""
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not _allowed_url(newurl, self.hosts):
+            raise ValueError(f"redirect to {newurl!r} is not allowed")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def _allowed_url(url, hosts):
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme == 'https' and (parts.hostname or '').lower() in hosts
+
+
+class _HashingWriter:
+    def __init__(self, out, digest):
+        self.out = out
+        self.digest = digest
+
+    def write(self, block):
+        self.digest.update(block)
+        self.out.write(block)
+
+
+def _copy_limited(src, out):
+    size = 0
+    for block in iter(lambda: src.read(64 * 1024), b''):
+        size += len(block)
+        if size > MAX_IMAGE_BYTES:
+            raise ValueError(f"image is larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB")
+        out.write(block)
+
+
+def _store_image(source, upload_folder, image_root, image_hosts):
+    """
+    Copy or download one image into UPLOAD_FOLDER and return the stored basename.
+
+    Local files must resolve inside image_root (IMPORT_FOLDER); remote images
+    are fetched over https from image_hosts only. The stored name is a hash of
+    the content, so two listings never share a file unless it is the same image.
+    """
+    ext = os.path.splitext(secure_filename(os.path.basename(source.split('?', 1)[0])))[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        raise ValueError(f"{source!r} is not a {', '.join(sorted(IMAGE_EXTENSIONS))} image")
+
+    if '://' in source:
+        if not _allowed_url(source, image_hosts):
+            raise ValueError(f"{source!r} is not an https URL on an allowed image host")
+        opener = urllib.request.build_opener(_AllowedHostRedirects(image_hosts))
+        open_source = lambda: opener.open(source, timeout=15)
+    else:
+        root = os.path.realpath(image_root)
+        local = os.path.realpath(os.path.join(root, source))
+        if os.path.commonpath([root, local]) != root or not os.path.isfile(local):
+            raise ValueError(f"{source!r} is not a file under the import folder")
+        open_source = lambda: open(local, 'rb')
+
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=upload_folder, suffix='.part')
+    try:
+        with open_source() as src, os.fdopen(fd, 'wb') as out:
+            hashing = _HashingWriter(out, digest)
+            _copy_limited(src, hashing)
+        filename = f"{digest.hexdigest()[:32]}{ext}"
+        os.replace(tmp, os.path.join(upload_folder, filename))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return filename
+
+
+def process_images(mappings, pool, upload_folder, image_root, image_hosts=frozenset()):
+    """Run the images of a whole chunk through the pool and rewrite image_urls in place."""
+    jobs = []
+    for mapping in mappings:
+        sources = [s.strip() for s in (mapping.get('image_urls') or '').split(',') if s.strip()]
+        jobs.append([pool.submit(_store_image, s, upload_folder, image_root, image_hosts) for s in sources])
+
+    for mapping, futures in zip(mappings, jobs):
+        if not futures:
+            continue
+        stored = []
+        for future in futures:
+            try:
+                stored.append(future.result())
+            except Exception as e:
+                logger.warning(f"Skipping image for '{mapping.get('title')}': {e}")
+        mapping['image_urls'] = ','.join(stored) or None
+
+
+# ---------------- Checkpointing ----------------
+def _progress_path(path):
+    return f"{path}.progress"
+
+
+def _read_checkpoint(path):
+    try:
+        with open(_progress_path(path)) as fh:
+            return int(fh.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_checkpoint(path, line_number):
+    tmp = f"{_progress_path(path)}.tmp"
+    with open(tmp, 'w') as fh:
+        fh.write(str(line_number))
+    os.replace(tmp, _progress_path(path))
+
+
+# ---------------- Import ----------------
+def import_houses(path, upload_folder, image_root, image_hosts=(), owner_id=None, chunk_size=500,
+                  image_workers=4, resume=True):
+    """
+    Stream a CSV/JSON-lines file into the house table.
+
+    Image paths in the file are read from under image_root (IMPORT_FOLDER) and
+    image URLs fetched only from image_hosts; see _store_image.
+
+    Rows are validated and inserted in chunks with bulk_insert_mappings; each
+    chunk is its own transaction and advances a checkpoint file next to the
+    source, so a re-run after a failure picks up after the last good chunk.
+    Rejected rows are appended to <path>.rejects.csv with the reason once
+their chunk has committed, so a resumed run does not list them twice.
+    """
+    rejects_path = f"{path}.rejects.csv"
+    report = ImportReport(path, rejects_path)
+    done_through = _read_checkpoint(path) if resume else 0
+    if not resume and os.path.exists(rejects_path):
+        os.remove(rejects_path)
+
+    os.makedirs(upload_folder, exist_ok=True)
+    image_hosts = frozenset(host.lower() for host in image_hosts)
+
+    rejects_fh = open(rejects_path, 'a', newline='', encoding='utf-8')
+    rejects = csv.writer(rejects_fh)
+    chunk, chunk_rejects, last_line = [], [], done_through
+
+    def flush():
+        if not chunk and not chunk_rejects:
+            return
+        if chunk:
+            process_images(chunk, pool, upload_folder, image_root, image_hosts)
+            try:
+                db.session.bulk_insert_mappings(House, chunk)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            report.inserted += len(chunk)
+            logger.info(f"Imported {report.inserted} houses from {path} (through line {last_line})")
+        rejects.writerows(chunk_rejects)
+        rejects_fh.flush()
+        _write_checkpoint(path, last_line)
+        chunk.clear()
+        chunk_rejects.clear()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, image_workers)) as pool:
+            for line_number, row in iter_rows(path):
+                if line_number <= done_through:
+                    report.skipped += 1
+                    continue
+                try:
+                    if isinstance(row, RowError):
+                        raise row
+                    chunk.append(validate_row(row, owner_id=owner_id))
+                except RowError as e:
+                    report.rejected += 1
+                    chunk_rejects.append([line_number, str(e), json.dumps(row if isinstance(row, dict) else None)])
+                last_line = line_number
+                if len(chunk) + len(chunk_rejects) >= chunk_size:
+                    flush()
+            flush()
+    finally:
+        rejects_fh.close()
+
+    if os.path.exists(_progress_path(path)):
+        os.remove(_progress_path(path))
+    if not report.rejected and os.path.exists(rejects_path) and os.path.getsize(rejects_path) == 0:
+        os.remove(rejects_path)
+    return report
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, make_response, request
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db, socketio
+from models.models import IdempotencyKey
+from services import jobs
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+# Form fields that differ between otherwise identical submissions
+IGNORED_FIELDS = {'csrf_token', FORM_FIELD}
+# Larger bodies are not stored; a duplicate then gets 409 instead of a replay
+MAX_STORED_BODY = 64 * 1024
+
+
+class DuplicateRequest(Exception):
+    """Same key as a request that is still running or could not be replayed."""
+
+
+def new_key():
+    """Fresh key for a rendered form; a double-submit of that form reuses it."""
+    return uuid.uuid4().hex
+
+
+def _hash(scope, user_id, key):
+    return hashlib.sha256(f"{scope}\0{user_id}\0{key}".encode('utf-8')).hexdigest()
+
+
+def derived_key():
+    """
+    Key from the request's own content: endpoint arguments and form fields,
+    bucketed by IDEMPOTENCY_WINDOW so identical submissions a few seconds
+    apart collapse while a deliberate repeat later goes through.
+    """
+    window = current_app.config['IDEMPOTENCY_WINDOW']
+    fields = sorted((k, v) for k, v in request.form.items(multi=True) if k not in IGNORED_FIELDS)
+    return f"{sorted((request.view_args or {}).items())}|{fields}|{int(time.time() // window)}"
+
+
+def client_key():
+    return request.headers.get(HEADER) or request.form.get(FORM_FIELD) or None
+
+
+# ---------------- Store ----------------
+def claim(scope, user_id, key, ttl=None):
+    """
+    Record that (scope, user_id, key) is being handled. Returns None for the
+    first caller, otherwise the existing IdempotencyKey row. Commits.
+    """
+    ttl = ttl or current_app.config['IDEMPOTENCY_TTL']
+    now = datetime.utcnow()
+    key_hash = _hash(scope, user_id, key)
+    record = IdempotencyKey(key_hash=key_hash, scope=scope, user_id=user_id,
+                            expires_at=now + timedelta(seconds=ttl))
+    db.session.add(record)
+    try:
+        db.session.commit()
+        return None
+    except IntegrityError:
+        db.session.rollback()
+
+    existing = IdempotencyKey.query.filter_by(key_hash=key_hash).first()
+    if existing is not None and existing.expires_at <= now:
+        # Expired but not purged yet: take it over
+        IdempotencyKey.query.filter_by(id=existing.id).delete()
+        db.session.commit()
+        return claim(scope, user_id, key, ttl)
+    return existing
+
+
+def _finish(key_hash, response):
+    record = IdempotencyKey.query.filter_by(key_hash=key_hash).first()
+    if record is None:
+        return
+    body = None
+    if not response.direct_passthrough and not response.is_streamed:
+        data = response.get_data(as_text=True)
+        if len(data) <= MAX_STORED_BODY:
+            body = data
+    record.status = 'done'
+    record.response_status = response.status_code
+    record.response_mimetype = response.mimetype
+    record.response_location = response.headers.get('Location')
+    record.response_body = body
+    db.session.commit()
+
+
+def _release(key_hash):
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(key_hash=key_hash).delete()
+    db.session.commit()
+
+
+def _replay(record):
+    if record.response_body is None and not record.response_location:
+        raise DuplicateRequest("This request was already processed.")
+    response = Response(record.response_body or '', status=record.response_status,
+                        mimetype=record.response_mimetype)
+    if record.response_location:
+        response.headers['Location'] = record.response_location
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for(key_hash, timeout):
+    """A double-click's second request waits briefly for the first to finish."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        # Green-aware: time.sleep would stall the unpatched eventlet hub
+        socketio.sleep(0.1)
+        db.session.expire_all()
+        record = IdempotencyKey.query.filter_by(key_hash=key_hash).first()
+        if record is None or record.status == 'done':
+            return record
+    return None
+
+
+# ---------------- Decorator ----------------
+def idempotent(scope, derive=True, ttl=None):
+    """
+    Run a mutating view at most once per key. The key is the Idempotency-Key
+    header or idempotency_key form field, else (with derive=True) one derived
+    from the request content. Duplicates get the first response replayed; a
+    duplicate of a request still running waits for it, then gets 409 if it is
+    not done yet. Failed requests (exceptions, 5xx) release their key.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in ('GET', 'HEAD', 'OPTIONS'):
+                return view(*args, **kwargs)
+            key = client_key() or (derived_key() if derive else None)
+            if key is None:
+                return view(*args, **kwargs)
+            user_id = current_user.id if current_user.is_authenticated else None
+            key_hash = _hash(scope, user_id, key)
+
+            existing = claim(scope, user_id, key, ttl)
+            if existing is not None:
+                if existing.status != 'done':
+                    existing = _wait_for(key_hash, current_app.config['IDEMPOTENCY_WAIT'])
+                if existing is None or existing.status != 'done':
+                    return "This request is already being processed.", 409
+                try:
+                    return _replay(existing)
+                except DuplicateRequest as e:
+                    return str(e), 409
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                _release(key_hash)
+                raise
+            if response.status_code >= 500:
+                _release(key_hash)
+            else:
+                _finish(key_hash, response)
+            return response
+        return wrapper
+    return decorator
+
+
+# ---------------- Expiry ----------------
+@jobs.job('idempotency.purge', max_attempts=3)
+def purge_expired(batch_size=5000):
+    """Delete expired keys in batches so the table stays bounded by traffic x TTL."""
+    total = 0
+    while True:
+        ids = [row[0] for row in db.session.query(IdempotencyKey.id)
+               .filter(IdempotencyKey.expires_at < datetime.utcnow())
+               .limit(batch_size).all()]
+        if not ids:
+            break
+        IdempotencyKey.query.filter(IdempotencyKey.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        total += len(ids)
+    if total:
+        logger.info(f"Purged {total} expired idempotency key(s)")
+
+
+jobs.periodic('idempotency.purge', every=600)
+
+
+def init_app(app):
+    app.jinja_env.globals['idempotency_key'] = new_key
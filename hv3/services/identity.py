@@ -0,0 +1,193 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+
+from extensions import db
+from models.models import User, UserIdentifier
+
+logger = logging.getLogger(__name__)
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+# Kenyan mobile numbers as typed: +254712345678, 254712345678, 0712345678, 712345678
+KE_PHONE_RE = re.compile(r"^(?:\+?254|0)?([17]\d{8})$")
+
+
+def normalize_email(value):
+    return value.strip().lower()
+
+
+def normalize_phone(value):
+    """Return the +254 E.164 form of a Kenyan number, or None if it is not one."""
+    digits = re.sub(r"[\s\-().]", "", value)
+    match = KE_PHONE_RE.match(digits)
+    return f"+254{match.group(1)}" if match else None
+
+
+def classify(identifier):
+    """Return (kind, normalized_value) for a login identifier, or (None, None)."""
+    if not identifier:
+        return None, None
+    identifier = identifier.strip()
+    if '@' in identifier:
+        return ('email', normalize_email(identifier)) if EMAIL_RE.match(identifier) else (None, None)
+    phone = normalize_phone(identifier)
+    return ('phone', phone) if phone else (None, None)
+
+
+class NegativeCache:
+    """
+    Bounded TTL set of identifiers known not to belong to any user.
+
+    Each process has its own, and a signup on another worker cannot clear it,
+    so a hit only means the legacy fallback can be skipped, not that the
+    identifier is unknown.
+    """
+
+    def __init__(self, maxsize=50000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key):
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+unknown_identifiers = NegativeCache()
+
+
+def init_app(app):
+    unknown_identifiers.maxsize = app.config['IDENTITY_NEGATIVE_CACHE_SIZE']
+    unknown_identifiers.ttl = app.config['IDENTITY_NEGATIVE_CACHE_TTL']
+
+
+def resolve_user(identifier):
+    """
+    Find the user behind an email or phone login identifier.
+
+    The identifier is classified server-side so exactly one unique index is
+    probed (no OR across columns), and misses are remembered so repeated
+    attempts against unknown identifiers skip the scan of legacy columns.
+    Every account created since has an identifier row, so the index probe
+    alone still sees signups made through other workers.
+    """
+    kind, value = classify(identifier)
+    if value is None:
+        # Not an email or Kenyan mobile we can normalize (foreign numbers,
+        # landlines, loosely formatted stored values): exact match, one column
+        raw = (identifier or '').strip()
+        if not raw:
+            return None
+        column = User.email if '@' in raw else User.phone_number
+        return User.query.filter(column == raw).first()
+
+    user = (
+        User.query.join(UserIdentifier, UserIdentifier.user_id == User.id)
+        .filter(UserIdentifier.value == value)
+        .first()
+    )
+    if user is not None or value in unknown_identifiers:
+        return user
+
+    # Accounts created before user_identifier existed; still a single-column lookup
+    column = User.email if kind == 'email' else User.phone_number
+    user = User.query.filter(column.in_({identifier.strip(), value})).first()
+    if user is not None:
+        _sync_or_skip(user)
+        db.session.commit()
+    else:
+        unknown_identifiers.add(value)
+    return user
+
+
+def sync_identifiers(user):
+    """Make user.identifiers match the user's current email and phone number."""
+    wanted = {}
+    if user.email:
+        wanted['email'] = normalize_email(user.email)
+    if user.phone_number:
+        phone = normalize_phone(user.phone_number)
+        if phone:
+            wanted['phone'] = phone
+
+    existing = {ident.kind: ident for ident in user.identifiers}
+    for kind, ident in existing.items():
+        if kind not in wanted:
+            user.identifiers.remove(ident)
+    for kind, value in wanted.items():
+        unknown_identifiers.discard(value)
+        if kind in existing:
+            existing[kind].value = value
+        else:
+            user.identifiers.append(UserIdentifier(kind=kind, value=value))
+
+
+def _sync_or_skip(user):
+    """
+    sync_identifiers in a savepoint. Legacy data can hold emails differing only
+    by case, or one number in two formats, on different accounts; the second
+    of such a pair keeps no identifier row (and logs in through the legacy
+    columns) instead of failing the whole transaction.
+    """
+    try:
+        with db.session.begin_nested():
+            sync_identifiers(user)
+    except IntegrityError:
+        logger.warning(f"Identifiers of user {user.id} clash with another account's; not indexed")
+        return False
+    return True
+
+
+@event.listens_for(Session, 'before_flush')
+def _sync_changed_users(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, User):
+            continue
+        if obj in session.new:
+            sync_identifiers(obj)
+            continue
+        state = inspect(obj)
+        if state.attrs.email.history.has_changes() or state.attrs.phone_number.history.has_changes():
+            sync_identifiers(obj)
+
+
+def backfill_identifiers(batch_size=1000):
+    """Create identifier rows for every existing user; returns the number processed."""
+    processed = 0
+    last_id = 0
+    while True:
+        users = (
+            User.query.options(selectinload(User.identifiers))
+            .filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+        )
+        if not users:
+            return processed
+        for user in users:
+            _sync_or_skip(user)
+        db.session.commit()
+        processed += len(users)
+        last_id = users[-1].id
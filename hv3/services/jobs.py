@@ -0,0 +1,305 @@
+import json
+import logging
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models.models import Job, JobTypeLock
+
+logger = logging.getLogger(__name__)
+
+# job_type -> JobSpec
+REGISTRY = {}
+# job_type -> seconds between runs
+PERIODIC = {}
+
+# Modules whose @job handlers must be loaded before a worker starts
+HANDLER_MODULES = ['services.messaging', 'services.announcements', 'services.idempotency',
+                   'services.ledger', 'services.mpesa']
+
+
+class JobSpec:
+    def __init__(self, func, job_type, max_attempts, concurrency, backoff):
+        self.func = func
+        self.job_type = job_type
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        self.backoff = backoff
+
+
+def job(job_type, max_attempts=5, concurrency=None, backoff=30):
+    """
+    Register a function as the handler for job_type.
+
+    The handler receives the decoded payload as keyword arguments. concurrency
+    caps how many jobs of this type run at once across all workers; backoff is
+    the base delay in seconds, doubled on each retry.
+    """
+    def decorator(func):
+        REGISTRY[job_type] = JobSpec(func, job_type, max_attempts, concurrency, backoff)
+        return func
+    return decorator
+
+
+def periodic(job_type, every):
+    """Have workers enqueue job_type once every `every` seconds."""
+    PERIODIC[job_type] = every
+
+
+def load_handlers():
+    import importlib
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+# ---------------- Enqueueing ----------------
+def enqueue(job_type, payload=None, run_at=None, delay=None, idempotency_key=None, commit=True):
+    """
+    Persist a job and return it. Request handlers call this and return immediately.
+
+    A job with the same idempotency_key is only ever stored once; the existing
+    row is returned instead. Pass commit=False to ride on the caller's
+    transaction (the job then only exists if that transaction commits).
+    """
+    if run_at is None:
+        run_at = datetime.utcnow() + timedelta(seconds=delay or 0)
+    spec = REGISTRY.get(job_type)
+    new_job = Job(
+        job_type=job_type,
+        payload=json.dumps(payload or {}, default=str),
+        run_at=run_at,
+        idempotency_key=idempotency_key,
+        max_attempts=spec.max_attempts if spec else 5,
+    )
+    if idempotency_key:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+
+    # The caller's own pending changes flush (and fail) outside the savepoint
+    db.session.flush()
+    try:
+        with db.session.begin_nested():
+            db.session.add(new_job)
+    except IntegrityError:
+        # Lost a race with another request using the same key; only the
+        # savepoint is rolled back, the caller's work stays
+        return Job.query.filter_by(idempotency_key=idempotency_key).first()
+    if commit:
+        db.session.commit()
+    return new_job
+
+
+# ---------------- Worker ----------------
+class Worker:
+    """Polls the job table, claims due jobs and runs their handlers."""
+
+    def __init__(self, app, job_types=None, poll_interval=1.0, batch_size=10, lock_timeout=600):
+        self.app = app
+        self.job_types = set(job_types) if job_types else None
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = False
+
+    def stop(self, *args):
+        self._stop = True
+
+    def run(self):
+        load_handlers()
+        logger.info(f"Job worker {self.name} started")
+        with self.app.app_context():
+            while not self._stop:
+                try:
+                    self._enqueue_periodic()
+                    self._requeue_stale()
+                    ran = self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Job worker loop error: {e}", exc_info=True)
+                    ran = 0
+                finally:
+                    db.session.remove()
+                if not ran:
+                    time.sleep(self.poll_interval)
+        logger.info(f"Job worker {self.name} stopped")
+
+    def _saturated_types(self):
+        limited = {t for t, spec in REGISTRY.items() if spec.concurrency}
+        if not limited:
+            return set()
+        running = dict(
+            db.session.query(Job.job_type, func.count(Job.id))
+            .filter(Job.status == 'running', Job.job_type.in_(limited))
+            .group_by(Job.job_type)
+            .all()
+        )
+        return {t for t in limited if running.get(t, 0) >= REGISTRY[t].concurrency}
+
+    def _claim(self):
+        """Return up to batch_size jobs this worker now owns."""
+        now = datetime.utcnow()
+        query = Job.query.filter(Job.status == 'queued', Job.run_at <= now)
+        if self.job_types:
+            query = query.filter(Job.job_type.in_(self.job_types))
+        saturated = self._saturated_types()
+        if saturated:
+            query = query.filter(Job.job_type.notin_(saturated))
+        candidates = query.order_by(Job.run_at).limit(self.batch_size).with_entities(Job.id, Job.job_type).all()
+        # End this read's snapshot: each claim below is its own transaction
+        db.session.commit()
+
+        claimed = []
+        for job_id, job_type in candidates:
+            spec = REGISTRY.get(job_type)
+            if spec and spec.concurrency and (job_type in saturated or not self._take_slot(job_type, spec)):
+                saturated.add(job_type)
+                db.session.commit()
+                continue
+            # Conditional update: only one worker can flip a given row to running
+            updated = Job.query.filter_by(id=job_id, status='queued').update(
+                {'status': 'running', 'locked_by': self.name, 'locked_at': now},
+                synchronize_session=False,
+            )
+            db.session.commit()
+            if updated:
+                claimed.append(job_id)
+        return claimed
+
+    def _take_slot(self, job_type, spec):
+        """
+        True if another job of a concurrency-limited type may start. Updating
+        the type's lock row first makes other workers' claims of that type wait
+        for this transaction, so the count below stays true until the caller
+        commits (right after its claim). An UPDATE rather than SELECT FOR UPDATE
+        so SQLite, which ignores row locks, takes its write lock here too.
+        """
+        def touch():
+            return JobTypeLock.query.filter_by(job_type=job_type).update(
+                {'claimed_at': datetime.utcnow()}, synchronize_session=False)
+
+        if not touch():
+            try:
+                with db.session.begin_nested():
+                    db.session.add(JobTypeLock(job_type=job_type))
+            except IntegrityError:
+                # Another worker created it first
+                pass
+            touch()
+        running = Job.query.filter_by(job_type=job_type, status='running').count()
+        return running < spec.concurrency
+
+    def run_once(self):
+        claimed = self._claim()
+        for job_id in claimed:
+            self._execute(db.session.get(Job, job_id))
+        return len(claimed)
+
+    def _execute(self, current):
+        job_id, spec = current.id, REGISTRY.get(current.job_type)
+        try:
+            if spec is None:
+                raise LookupError(f"No handler registered for job type '{current.job_type}'")
+            spec.func(**json.loads(current.payload or '{}'))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._fail(db.session.get(Job, job_id), spec, e)
+            return
+
+        current = db.session.get(Job, job_id)
+        current.attempts += 1
+        current.status = 'done'
+        current.finished_at = datetime.utcnow()
+        current.locked_by = None
+        current.locked_at = None
+        db.session.commit()
+
+    def _fail(self, current, spec, error):
+        current.attempts += 1
+        current.last_error = f"{type(error).__name__}: {error}"
+        current.locked_by = None
+        current.locked_at = None
+        if spec is None or current.attempts >= current.max_attempts:
+            current.status = 'dead'
+            current.finished_at = datetime.utcnow()
+            logger.error(f"Job {current.id} ({current.job_type}) failed permanently: {error}")
+        else:
+            delay = spec.backoff * (2 ** (current.attempts - 1))
+            current.run_at = datetime.utcnow() + timedelta(seconds=delay + random.uniform(0, delay / 4))
+            current.status = 'queued'
+            logger.warning(f"Job {current.id} ({current.job_type}) failed, retry in {int(delay)}s: {error}")
+        db.session.commit()
+
+    def _requeue_stale(self):
+        """Return jobs left 'running' by a crashed worker to the queue."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lock_timeout)
+        count = Job.query.filter(Job.status == 'running', Job.locked_at < cutoff).update(
+            {'status': 'queued', 'locked_by': None, 'locked_at': None},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        if count:
+            logger.warning(f"Requeued {count} stale job(s)")
+
+    def _enqueue_periodic(self):
+        now = time.time()
+        for job_type, every in PERIODIC.items():
+            if self.job_types and job_type not in self.job_types:
+                continue
+            slot = int(now // every)
+            # The slot-based key makes every worker agree on a single job per period
+            enqueue(job_type, run_at=datetime.utcfromtimestamp(slot * every),
+                    idempotency_key=f"periodic:{job_type}:{slot}")
+
+
+def queue_stats():
+    """Counts of jobs per (job_type, status), for dashboards and health checks."""
+    rows = (
+        db.session.query(Job.job_type, Job.status, func.count(Job.id))
+        .group_by(Job.job_type, Job.status)
+        .all()
+    )
+    stats = {}
+    for job_type, status, count in rows:
+        stats.setdefault(job_type, {})[status] = count
+    return stats
+
+
+# ---------------- Retention ----------------
+@job('jobs.purge', max_attempts=3)
+def purge_finished(batch_size=5000):
+    """
+    Delete finished jobs past their retention in batches: 'done' after
+    JOB_RETENTION_DAYS, 'dead' after JOB_DEAD_RETENTION_DAYS. A periodic job's
+    row is its once-per-period marker, so types whose period is longer than
+    the retention are left alone rather than enqueued twice in one period.
+    """
+    now = datetime.utcnow()
+    total = 0
+    for status, days in (('done', current_app.config['JOB_RETENTION_DAYS']),
+                         ('dead', current_app.config['JOB_DEAD_RETENTION_DAYS'])):
+        keep = [t for t, every in PERIODIC.items() if every >= days * 86400]
+        query = Job.query.filter(Job.status == status, Job.finished_at < now - timedelta(days=days))
+        if keep:
+            query = query.filter(Job.job_type.notin_(keep))
+        while True:
+            ids = [row[0] for row in query.with_entities(Job.id).limit(batch_size).all()]
+            if not ids:
+                break
+            Job.query.filter(Job.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            total += len(ids)
+    if total:
+        logger.info(f"Purged {total} finished job(s)")
+
+
+periodic('jobs.purge', every=3600)
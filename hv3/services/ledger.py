@@ -0,0 +1,249 @@
+import calendar
+import logging
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models.models import Booking, House, LedgerBalance, LedgerEntry
+from services import jobs
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+# Largest single amount accepted from a form, in shillings
+MAX_AMOUNT = Decimal('10000000')
+
+
+class InvalidAmount(ValueError):
+    """A money amount that is blank, malformed, non-positive or out of range."""
+
+
+# ---------------- Money ----------------
+def to_decimal(value):
+    """Parse a user- or database-supplied amount into Decimal shillings, rounded to the cent."""
+    if isinstance(value, float):
+        # repr() gives the shortest round-tripping form, so 0.1 stays 0.1
+        value = repr(value)
+    try:
+        amount = Decimal(str(value).strip().replace(',', ''))
+    except (InvalidOperation, TypeError):
+        raise InvalidAmount(f"{value!r} is not a valid amount.")
+    if not amount.is_finite():
+        raise InvalidAmount(f"{value!r} is not a valid amount.")
+    amount = amount.quantize(CENT, rounding=ROUND_HALF_UP)
+    if amount <= 0:
+        raise InvalidAmount("The amount must be greater than zero.")
+    if amount > MAX_AMOUNT:
+        raise InvalidAmount("The amount is too large.")
+    return amount
+
+
+def to_cents(value):
+    return int(to_decimal(value) * 100)
+
+
+def from_cents(cents):
+    return (Decimal(cents or 0) / 100).quantize(CENT)
+
+
+# ---------------- Posting ----------------
+@event.listens_for(Session, 'before_flush')
+def _append_only(session, flush_context, instances):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, LedgerEntry) and (obj in session.deleted or session.is_modified(obj)):
+            raise RuntimeError("Ledger entries are append-only; post an adjustment instead.")
+
+
+def _locked_balance(tenant_id, house_key):
+    """The account's balance row, created on first use, locked until the caller commits."""
+    query = LedgerBalance.query.filter_by(tenant_id=tenant_id, house_key=house_key).with_for_update()
+    balance = query.first()
+    if balance is not None:
+        return balance
+    try:
+        with db.session.begin_nested():
+            db.session.add(LedgerBalance(tenant_id=tenant_id, house_key=house_key, balance_cents=0))
+    except IntegrityError:
+        # Another transaction opened the account first
+        pass
+    return query.first()
+
+
+def post(tenant_id, kind, amount_cents, house_id=None, booking_id=None, payment_id=None,
+         due_date=None, description=None, reference=None):
+    """
+    Append an entry and move the account balance by amount_cents in the same
+    transaction. An entry whose reference was already posted is returned
+    unchanged, so callers may retry freely. The caller commits.
+    """
+    if reference:
+        existing = LedgerEntry.query.filter_by(reference=reference).first()
+        if existing is not None:
+            return existing
+
+    balance = _locked_balance(tenant_id, house_id or 0)
+    balance.balance_cents += amount_cents
+    entry = LedgerEntry(
+        tenant_id=tenant_id, house_id=house_id, booking_id=booking_id, payment_id=payment_id,
+        kind=kind, amount_cents=amount_cents, balance_after_cents=balance.balance_cents,
+        due_date=due_date, description=description, reference=reference,
+    )
+    db.session.add(entry)
+    db.session.flush()
+    balance.last_entry_id = entry.id
+    return entry
+
+
+def record_payment(payment):
+    """Credit a confirmed payment to the tenant's account (once per payment)."""
+    return post(payment.tenant_id, 'payment', -to_cents(payment.amount), house_id=payment.house_id,
+                payment_id=payment.id, description='Rent payment', reference=f"payment:{payment.id}")
+
+
+# ---------------- Reads ----------------
+def balance_for(tenant_id, house_id=None):
+    """Amount owed as Decimal (negative when in credit), across all houses unless one is given."""
+    query = db.session.query(LedgerBalance.balance_cents).filter(LedgerBalance.tenant_id == tenant_id)
+    if house_id is not None:
+        query = query.filter(LedgerBalance.house_key == house_id)
+    # One row per house the tenant has rented: a handful at most
+    return from_cents(sum(cents for (cents,) in query.all()))
+
+
+class DueCharge:
+    """A charge that is not fully paid, with the part still owed on it."""
+    __slots__ = ('charge', 'due_date', 'amount')
+
+    def __init__(self, charge, owed_cents):
+        self.charge = charge
+        self.due_date = charge.due_date
+        self.amount = from_cents(owed_cents)
+
+
+def next_charge(tenant_id):
+    """
+    The tenant's oldest charge not yet covered by payments, overdue or not, as
+    a DueCharge; None when nothing is owed. Payments settle the oldest charges
+    first (see reports.arrears_aging), so on each account in debit the unpaid
+    charges are the newest ones adding up to the balance: walking back from
+    the newest charge, the first to reach the balance is the oldest unpaid.
+    """
+    owing = (
+        db.session.query(LedgerBalance.house_key, LedgerBalance.balance_cents)
+        .filter(LedgerBalance.tenant_id == tenant_id, LedgerBalance.balance_cents > 0)
+        .all()
+    )
+    oldest = None
+    for house_key, balance in owing:
+        house = LedgerEntry.house_id == house_key if house_key else LedgerEntry.house_id.is_(None)
+        charges = (
+            LedgerEntry.query
+            .filter(LedgerEntry.tenant_id == tenant_id, house, LedgerEntry.kind == 'charge')
+            .order_by(LedgerEntry.due_date.desc(), LedgerEntry.id.desc())
+            .yield_per(50)
+        )
+        due, newer = None, 0
+        for charge in charges:
+            due = DueCharge(charge, min(charge.amount_cents, balance - newer))
+            newer += charge.amount_cents
+            if newer >= balance:
+                break
+        if due is not None and (oldest is None or (due.due_date or date.max) < (oldest.due_date or date.max)):
+            oldest = due
+    return oldest
+
+
+# ---------------- Rent schedule ----------------
+def _add_months(day, months, anchor):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor, calendar.monthrange(year, month)[1]))
+
+
+def rent_due_dates(lease_start, lease_end, since, until):
+    """
+    Monthly due dates in [since, until), on the lease start's day of month
+    (clamped to short months), or the 1st for leases without a start date.
+    """
+    anchor = lease_start.day if lease_start else 1
+    first = lease_start or since.replace(day=1)
+    day, n = first, 0
+    while day < until and (lease_end is None or day < lease_end):
+        if day >= since:
+            yield day
+        n += 1
+        day = _add_months(first, n, anchor)
+
+
+def _window():
+    today = date.today()
+    # The current month is included so a missed run still bills it
+    return today.replace(day=1), today + timedelta(days=current_app.config['LEDGER_HORIZON_DAYS'])
+
+
+@jobs.job('ledger.schedule_rent', max_attempts=3)
+def schedule_rent():
+    """Split active leases into batches and queue one charge job per batch."""
+    batch_size = current_app.config['LEDGER_BATCH_SIZE']
+    today = date.today().isoformat()
+    last_id, batches = 0, 0
+    while True:
+        ids = [row[0] for row in db.session.query(Booking.id)
+               .filter(Booking.status == 'active', Booking.id > last_id)
+               .order_by(Booking.id).limit(batch_size).all()]
+        if not ids:
+            break
+        # Keyed by day and first booking so hourly runs queue each batch once a day
+        jobs.enqueue('ledger.rent_charges', {'booking_ids': ids},
+                     idempotency_key=f"ledger.rent_charges:{today}:{ids[0]}", commit=False)
+        last_id = ids[-1]
+        batches += 1
+    db.session.commit()
+    if batches:
+        logger.info(f"Queued {batches} rent charge batch(es)")
+
+
+@jobs.job('ledger.rent_charges', max_attempts=5)
+def rent_charges(booking_ids):
+    """Post any missing rent charges in the scheduling window for these bookings."""
+    since, until = _window()
+    rows = (
+        db.session.query(Booking, House.rent_amount, House.title)
+        .join(House, Booking.house_id == House.id)
+        .filter(Booking.id.in_(booking_ids), Booking.status == 'active')
+        .all()
+    )
+    wanted = {}
+    for booking, rent, title in rows:
+        try:
+            cents = to_cents(rent)
+        except InvalidAmount:
+            logger.warning(f"House {booking.house_id} has no usable rent amount; not billing booking {booking.id}")
+            continue
+        for due in rent_due_dates(booking.lease_start_date, booking.lease_end_date, since, until):
+            reference = f"rent:{booking.id}:{due:%Y-%m}"
+            wanted[reference] = (booking, cents, due, f"Rent for {title}, {due:%B %Y}")
+    if not wanted:
+        return
+
+    # One query tells us which charges earlier runs already posted
+    posted = {ref for (ref,) in db.session.query(LedgerEntry.reference)
+              .filter(LedgerEntry.reference.in_(list(wanted)))}
+    created = 0
+    for reference, (booking, cents, due, description) in sorted(wanted.items(), key=lambda kv: kv[1][2]):
+        if reference in posted:
+            continue
+        post(booking.tenant_id, 'charge', cents, house_id=booking.house_id, booking_id=booking.id,
+             due_date=due, description=description, reference=reference)
+        created += 1
+    db.session.commit()
+    if created:
+        logger.info(f"Posted {created} rent charge(s) for {len(rows)} booking(s)")
+
+
+jobs.periodic('ledger.schedule_rent', every=3600)
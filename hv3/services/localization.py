@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+
+from flask import g, has_request_context, request
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+# Upper bound in seconds (exclusive) -> (catalog key, divisor). Age in whole
+# units is seconds // divisor; 'now' and 'yesterday' take no count.
+DAY = 86400
+BUCKETS = [
+    (60, 'now', None),
+    (3600, 'minute', 60),
+    (DAY, 'hour', 3600),
+    (2 * DAY, 'yesterday', None),
+    (7 * DAY, 'day', DAY),
+    (30 * DAY, 'week', 7 * DAY),
+    (365 * DAY, 'month', 30 * DAY),
+    (float('inf'), 'year', 365 * DAY),
+]
+_BOUNDS = [bound for bound, _, _ in BUCKETS]
+
+
+class Catalog:
+    """One locale's messages, with plural forms split out at load time."""
+
+    def __init__(self, code, data):
+        self.code = code
+        self.name = data.get('name', code)
+        self.aliases = [a.lower() for a in data.get('aliases', [])]
+        self.datetime_format = data.get('datetime_format', '%Y-%m-%d %H:%M')
+        self.timeago = {}
+        for key, value in data.get('timeago', {}).items():
+            # "text" or ["one", "other"]
+            self.timeago[key] = (value, value) if isinstance(value, str) else tuple(value)
+
+
+_catalogs = {}
+_lookup = {}  # code or alias -> code
+_default = 'en'
+
+
+def load_catalogs(folder):
+    catalogs = {}
+    for filename in sorted(os.listdir(folder)):
+        code, ext = os.path.splitext(filename)
+        if ext != '.json':
+            continue
+        with open(os.path.join(folder, filename), encoding='utf-8') as fh:
+            catalogs[code] = Catalog(code, json.load(fh))
+    return catalogs
+
+
+def normalize(language):
+    """Map a stored or requested language ('sw', 'Swahili', 'en-GB') to a catalog code."""
+    if not language:
+        return None
+    key = language.strip().lower().replace('_', '-')
+    return _lookup.get(key) or _lookup.get(key.split('-')[0])
+
+
+def get_locale():
+    """Resolve the locale once per request: user preference, then Accept-Language."""
+    if not has_request_context():
+        return _default
+    locale = g.get('_locale')
+    if locale is None:
+        if current_user.is_authenticated:
+            locale = normalize(current_user.language)
+        if locale is None:
+            locale = request.accept_languages.best_match(list(_lookup)) or _default
+            locale = _lookup.get(locale, _default)
+        g._locale = locale
+    return locale
+
+
+def _now():
+    """utcnow() once per request so every timestamp on a page uses the same reference."""
+    if not has_request_context():
+        return datetime.utcnow()
+    now = g.get('_render_now')
+    if now is None:
+        now = g._render_now = datetime.utcnow()
+    return now
+
+
+@lru_cache(maxsize=4096)
+def _phrase(locale, key, count):
+    forms = _catalogs[locale].timeago.get(key) or _catalogs[_default].timeago[key]
+    one, other = forms
+    return (one if count == 1 else other).format(n=count)
+
+
+def timeago(value, locale=None):
+    """Format a datetime as a relative age in the current locale."""
+    if not isinstance(value, datetime):
+        return value
+    seconds = (_now() - value).total_seconds()
+    _, key, divisor = BUCKETS[bisect_right(_BOUNDS, seconds)]
+    count = int(seconds // divisor) if divisor else 0
+    return _phrase(locale or get_locale(), key, count)
+
+
+def datetimeformat(value, format=None):
+    """Format a datetime with the given strftime pattern or the locale's default."""
+    if not isinstance(value, datetime):
+        return value
+    return value.strftime(format or _catalogs[get_locale()].datetime_format)
+
+
+def init_app(app):
+    """Compile the message catalogs in LOCALE_FOLDER and register the filters."""
+    global _catalogs, _lookup, _default
+    _catalogs = load_catalogs(app.config['LOCALE_FOLDER'])
+    _default = app.config['DEFAULT_LOCALE']
+    if _default not in _catalogs:
+        raise RuntimeError(f"No catalog for DEFAULT_LOCALE {_default!r} in {app.config['LOCALE_FOLDER']}")
+    _lookup = {}
+    for code, catalog in _catalogs.items():
+        _lookup[code] = code
+        _lookup[catalog.name.lower()] = code
+        for alias in catalog.aliases:
+            _lookup.setdefault(alias, code)
+    _phrase.cache_clear()
+
+    app.jinja_env.filters['timeago'] = timeago
+    app.jinja_env.filters['datetimeformat'] = datetimeformat
+    app.jinja_env.globals['get_locale'] = get_locale
+    logger.info(f"Loaded locales: {', '.join(sorted(_catalogs))}")
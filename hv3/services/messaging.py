@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+import smtplib
+from datetime import datetime
+from email.message import EmailMessage
+
+from flask import current_app
+
+from services.jobs import job
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------- Backends ----------------
+def _outbox(name):
+    folder = current_app.config['OUTBOX_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, name)
+
+
+def deliver_email(to, subject, body):
+    """Send through SMTP, or into instance/outbox/mail.jsonl with the 'stub' backend."""
+    config = current_app.config
+    if config['MAIL_BACKEND'] == 'smtp':
+        message = EmailMessage()
+        message['From'] = config['MAIL_DEFAULT_SENDER']
+        message['To'] = to
+        message['Subject'] = subject
+        message.set_content(body)
+        with smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30) as smtp:
+            if config['MAIL_USE_TLS']:
+                smtp.starttls()
+            if config['MAIL_USERNAME']:
+                smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+            smtp.send_message(message)
+        return
+
+    with open(_outbox('mail.jsonl'), 'a', encoding='utf-8') as fh:
+        fh.write(json.dumps({
+            'sent_at': datetime.utcnow().isoformat(),
+            'to': to, 'subject': subject, 'body': body,
+        }) + '\n')
+    logger.info(f"[stub mail] to={to} subject={subject!r}")
+
+
+def deliver_sms(to, text):
+    """SMS stand-in: only the 'stub' backend exists until a provider is chosen."""
+    if current_app.config['SMS_BACKEND'] != 'stub':
+        raise RuntimeError(f"Unknown SMS_BACKEND {current_app.config['SMS_BACKEND']!r}")
+    with open(_outbox('sms.jsonl'), 'a', encoding='utf-8') as fh:
+        fh.write(json.dumps({'sent_at': datetime.utcnow().isoformat(), 'to': to, 'text': text}) + '\n')
+    logger.info(f"[stub sms] to={to}")
+
+
+# ---------------- Jobs ----------------
+@job('email.send', max_attempts=6, concurrency=8)
+def send_email(to, subject, body):
+    deliver_email(to, subject, body)
+
+
+@job('sms.send', max_attempts=6, concurrency=4)
+def send_sms(to, text):
+    deliver_sms(to, text)
+
+
+@job('auth.password_reset', max_attempts=4)
+def send_password_reset(email, phone_number, reset_url):
+    body = f"Use this link to reset your HomeHub password (valid for 1 hour):\n\n{reset_url}\n"
+    if email:
+        deliver_email(email, "Reset your HomeHub password", body)
+    if phone_number:
+        deliver_sms(phone_number, f"HomeHub password reset: {reset_url}")
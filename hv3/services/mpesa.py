@@ -0,0 +1,338 @@
+import atexit
+import base64
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from flask import abort, current_app, jsonify, request
+
+from extensions import csrf, db
+from models.models import MpesaCallback, Payment
+from services import jobs, ledger, notifications
+
+logger = logging.getLogger(__name__)
+
+# What Daraja expects back; anything else makes it retry the callback
+ACCEPTED = {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+
+
+class MpesaError(Exception):
+    """A payment request Daraja rejected or could not be reached for."""
+
+
+# ---------------- Daraja client ----------------
+class DarajaClient:
+    """STK push (Lipa Na M-Pesa Online) against MPESA_BASE_URL, which may be the local simulator."""
+
+    def __init__(self):
+        self._token = None
+        self._token_expires = 0.0
+        self._lock = threading.Lock()
+
+    def _call(self, method, path, body=None, headers=None, timeout=10):
+        config = current_app.config
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(config['MPESA_BASE_URL'].rstrip('/') + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json', **(headers or {})})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            raise MpesaError(f"M-Pesa request to {path} failed: {e}")
+
+    def token(self):
+        # Tokens last an hour; refresh a minute early
+        with self._lock:
+            if self._token is None or time.time() >= self._token_expires:
+                config = current_app.config
+                credentials = f"{config['MPESA_CONSUMER_KEY']}:{config['MPESA_CONSUMER_SECRET']}"
+                result = self._call('GET', '/oauth/v1/generate?grant_type=client_credentials', headers={
+                    'Authorization': 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii'),
+                })
+                self._token = result['access_token']
+                self._token_expires = time.time() + int(result.get('expires_in', 3599)) - 60
+            return self._token
+
+    def stk_push(self, phone, amount, account_reference, description):
+        config = current_app.config
+        shortcode = config['MPESA_SHORTCODE']
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        password = base64.b64encode(f"{shortcode}{config['MPESA_PASSKEY']}{timestamp}".encode('utf-8')).decode('ascii')
+        result = self._call('POST', '/mpesa/stkpush/v1/processrequest', {
+            'BusinessShortCode': shortcode,
+            'Password': password,
+            'Timestamp': timestamp,
+            'TransactionType': 'CustomerPayBillOnline',
+            'Amount': amount,
+            'PartyA': phone,
+            'PartyB': shortcode,
+            'PhoneNumber': phone,
+            'CallBackURL': config['MPESA_CALLBACK_URL'],
+            'AccountReference': account_reference,
+            'TransactionDesc': description,
+        }, headers={'Authorization': f"Bearer {self.token()}"})
+        if str(result.get('ResponseCode')) != '0' or not result.get('CheckoutRequestID'):
+            raise MpesaError(result.get('errorMessage') or result.get('ResponseDescription') or 'STK push rejected')
+        return result['CheckoutRequestID']
+
+
+client = DarajaClient()
+
+
+def enabled():
+    config = current_app.config
+    return bool(config['MPESA_CONSUMER_KEY'] and config['MPESA_SHORTCODE'] and config['MPESA_CALLBACK_URL'])
+
+
+def normalize_msisdn(phone):
+    """07XXXXXXXX, +2547XXXXXXXX and 2547XXXXXXXX all become 2547XXXXXXXX."""
+    digits = ''.join(ch for ch in (phone or '') if ch.isdigit())
+    if digits.startswith('0'):
+        digits = '254' + digits[1:]
+    if len(digits) != 12 or not digits.startswith('254'):
+        raise MpesaError("Enter an M-Pesa number like 0712345678.")
+    return digits
+
+
+def request_payment(payment, phone):
+    """
+    Ask Daraja to prompt the tenant's phone for `payment` and store the
+    CheckoutRequestID that its callback will carry. Call after the payment is
+    committed; the callback may even arrive before this returns.
+    """
+    if payment.amount != payment.amount.to_integral_value():
+        raise MpesaError("M-Pesa payments must be in whole shillings.")
+    reference = client.stk_push(normalize_msisdn(phone), int(payment.amount),
+                                f"RENT{payment.id}", 'Rent payment')
+    payment.reference = reference
+    db.session.commit()
+    return reference
+
+
+# ---------------- Callback inbox ----------------
+def parse_callback(payload):
+    """Fields of an STK callback that reconciliation needs; raises ValueError if it is not one."""
+    callback = payload['Body']['stkCallback']
+    items = {item.get('Name'): item.get('Value')
+             for item in (callback.get('CallbackMetadata') or {}).get('Item', [])}
+    amount = items.get('Amount')
+    try:
+        amount = Decimal(str(amount)) if amount is not None else None
+    except InvalidOperation:
+        amount = None
+    return {
+        'reference': str(callback['CheckoutRequestID'])[:64],
+        'result_code': int(callback.get('ResultCode', -1)),
+        'receipt': str(items['MpesaReceiptNumber'])[:32] if items.get('MpesaReceiptNumber') else None,
+        'amount': amount,
+    }
+
+
+class CallbackInbox:
+    """
+    Group commit for callbacks. Request threads hand a row to put(), which
+    waits until one background thread has written it together with whatever
+    else arrived meanwhile, up to MPESA_INBOX_BATCH_SIZE rows per commit. A
+    callback is only acknowledged once it is durable, yet thousands per second
+    cost a few commits rather than thousands.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self.batch_size = 500
+        self.ack_timeout = 5.0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config['MPESA_INBOX_BATCH_SIZE']
+        self.ack_timeout = app.config['MPESA_ACK_TIMEOUT']
+        self.queue = queue.Queue(maxsize=app.config['MPESA_INBOX_QUEUE_SIZE'])
+        app.extensions['mpesa_inbox'] = self
+        atexit.register(self._stopping.set)
+
+    def _ensure_thread(self):
+        # Started on first callback so CLI commands and workers never spawn it
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='mpesa-inbox', daemon=True)
+                self._thread.start()
+
+    def put(self, row):
+        """Returns True once the row is committed, False if it could not be in time."""
+        self._ensure_thread()
+        waiter = {'row': row, 'done': threading.Event(), 'ok': False}
+        try:
+            self.queue.put(waiter, timeout=self.ack_timeout)
+        except queue.Full:
+            return False
+        waiter['done'].wait(self.ack_timeout)
+        return waiter['ok']
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                db.session.bulk_insert_mappings(MpesaCallback, [waiter['row'] for waiter in batch])
+                db.session.commit()
+                ok = True
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to store {len(batch)} M-Pesa callback(s): {e}", exc_info=True)
+                ok = False
+            finally:
+                db.session.remove()
+        for waiter in batch:
+            waiter['ok'] = ok
+            waiter['done'].set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self.queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+
+inbox = CallbackInbox()
+
+
+def callback(token):
+    """
+    Daraja posts STK results here. Daraja does not sign callbacks, so the URL
+    carries a secret token. The only work done before answering is parsing
+    and a durable insert; matching to payments happens in mpesa.reconcile.
+    """
+    expected = current_app.config['MPESA_CALLBACK_TOKEN']
+    if not expected or not hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8')):
+        abort(404)
+    raw = request.get_data(as_text=True)
+    try:
+        fields = parse_callback(json.loads(raw))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        logger.warning("Ignored malformed M-Pesa callback")
+        return jsonify({'ResultCode': 1, 'ResultDesc': 'Malformed callback'}), 400
+
+    now = datetime.utcnow()
+    stored = inbox.put(dict(fields, payload=raw, received_at=now, retry_at=now, status='queued', attempts=0))
+    if not stored:
+        # Daraja retries; reconciliation drops whatever turns out to be a duplicate
+        return jsonify({'ResultCode': 1, 'ResultDesc': 'Try again'}), 503
+    return jsonify(ACCEPTED)
+
+
+# ---------------- Reconciliation ----------------
+def _retry_delay(attempts):
+    return timedelta(seconds=min(300, 5 * 2 ** attempts))
+
+
+def _apply(payment, cb, now):
+    """Apply one callback to its payment; returns the callback's outcome."""
+    if payment.status == 'Paid':
+        if cb.result_code != 0:
+            # A failure report overtaken by the success it preceded
+            return 'stale'
+        if cb.receipt == payment.receipt:
+            return 'duplicate'
+        # Paid twice for one request: keep the first, leave this for a human
+        logger.error(f"Payment {payment.id} already paid by {payment.receipt}; callback {cb.id} "
+                     f"reports another receipt {cb.receipt}")
+        return 'conflict'
+
+    if cb.result_code != 0:
+        if payment.status == 'Failed':
+            return 'duplicate'
+        payment.status = 'Failed'
+        notifications.notify(payment.tenant_id, f"Your rent payment of KES {payment.amount} was not completed.",
+                             commit=False)
+        return 'applied'
+
+    if cb.amount is not None and cb.amount != payment.amount:
+        logger.error(f"Callback {cb.id} paid {cb.amount} for payment {payment.id} of {payment.amount}")
+        return 'mismatch'
+    # Success wins over an earlier failure: M-Pesa only reports success for money that moved
+    payment.status = 'Paid'
+    payment.receipt = cb.receipt
+    payment.confirmed_at = now
+    ledger.record_payment(payment)
+    notifications.notify(payment.tenant_id, f"Your rent payment of KES {payment.amount} was received.",
+                         commit=False)
+    return 'applied'
+
+
+def reconcile_batch(callbacks, now):
+    """Match callbacks to payments with one indexed lookup for the whole batch."""
+    references = {cb.reference for cb in callbacks if cb.reference}
+    payments = {p.reference: p for p in Payment.query.filter(Payment.reference.in_(references))} if references else {}
+    orphan_cutoff = now - timedelta(seconds=current_app.config['MPESA_ORPHAN_TTL'])
+    outcomes = {}
+    # Arrival order; a repeat later in the batch sees the state the first one left
+    for cb in callbacks:
+        cb.attempts += 1
+        payment = payments.get(cb.reference)
+        if payment is not None:
+            cb.status = _apply(payment, cb, now)
+            cb.processed_at = now
+            outcome = cb.status
+        elif cb.received_at < orphan_cutoff:
+            cb.status = 'orphaned'
+            cb.processed_at = now
+            outcome = cb.status
+            logger.warning(f"M-Pesa callback {cb.id} ({cb.reference}) matches no payment")
+        else:
+            # Probably faster than the commit that stores the payment's reference
+            cb.retry_at = now + _retry_delay(cb.attempts)
+            outcome = 'waiting'
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes
+
+
+@jobs.job('mpesa.reconcile', max_attempts=3, concurrency=1)
+def reconcile(batch_size=None):
+    """Drain due callbacks in id order, one commit per batch."""
+    batch_size = batch_size or current_app.config['MPESA_RECONCILE_BATCH_SIZE']
+    now = datetime.utcnow()
+    totals = {}
+    while True:
+        callbacks = (
+            MpesaCallback.query
+            .filter(MpesaCallback.status == 'queued', MpesaCallback.retry_at <= now)
+            .order_by(MpesaCallback.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not callbacks:
+            break
+        for outcome, count in reconcile_batch(callbacks, now).items():
+            totals[outcome] = totals.get(outcome, 0) + count
+        db.session.commit()
+        if len(callbacks) < batch_size:
+            break
+    if totals:
+        logger.info(f"Reconciled M-Pesa callbacks: {totals}")
+    return totals
+
+
+jobs.periodic('mpesa.reconcile', every=5)
+
+
+def init_app(app):
+    inbox.init_app(app)
+    app.add_url_rule('/payments/mpesa/callback/<token>', 'mpesa_callback', callback, methods=['POST'])
+    csrf.exempt(callback)
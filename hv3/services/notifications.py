@@ -0,0 +1,113 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import case, event
+from sqlalchemy.orm import Session
+
+from extensions import db, socketio
+from models.models import Notification, User
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------- Post-commit push ----------------
+# Pushes are held on the session and sent only once the rows they describe are
+# committed, so a client never sees a notification that was rolled back.
+def queue_push(room, event_name, data):
+    db.session.info.setdefault('pending_pushes', []).append((room, event_name, data))
+
+
+@event.listens_for(Session, 'after_commit')
+def _send_pushes(session):
+    pushes = session.info.pop('pending_pushes', None)
+    for room, event_name, data in pushes or ():
+        try:
+            socketio.emit(event_name, data, room=room)
+        except Exception as e:
+            logger.warning(f"Could not push {event_name} to {room}: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pushes(session):
+    session.info.pop('pending_pushes', None)
+
+
+# ---------------- Counters ----------------
+def increment_unread(user_ids, by=1):
+    """Bump the unread counter for many users in one UPDATE."""
+    if not user_ids:
+        return
+    User.query.filter(User.id.in_(list(user_ids))).update(
+        {User.unread_notification_count: User.unread_notification_count + by},
+        synchronize_session=False,
+    )
+
+
+def _decrement_unread(user_id, by):
+    User.query.filter(User.id == user_id).update(
+        {User.unread_notification_count: case(
+            (User.unread_notification_count > by, User.unread_notification_count - by),
+            else_=0,
+        )},
+        synchronize_session=False,
+    )
+
+
+def unread_count(user):
+    return user.unread_notification_count or 0
+
+
+# ---------------- API ----------------
+def to_dict(notification):
+    return {
+        'id': notification.id,
+        'message': notification.message,
+        'date': notification.date.isoformat() if notification.date else None,
+        'is_read': notification.is_read,
+    }
+
+
+def notify(user_id, message, commit=True):
+    """
+    Create a notification, bump the recipient's unread counter and push both
+    to the user's Socket.IO room after commit.
+    """
+    if not user_id:
+        return None
+    notification = Notification(tenant_id=user_id, message=message, date=datetime.utcnow())
+    db.session.add(notification)
+    increment_unread([user_id])
+    db.session.flush()
+    unread = db.session.query(User.unread_notification_count).filter(User.id == user_id).scalar()
+    queue_push(f"user_{user_id}", 'notification', {**to_dict(notification), 'unread': unread})
+    if commit:
+        db.session.commit()
+    return notification
+
+
+def recent(user_id, limit=20, before_id=None):
+    query = Notification.query.filter(Notification.tenant_id == user_id)
+    if before_id:
+        query = query.filter(Notification.id < before_id)
+    return query.order_by(Notification.date.desc(), Notification.id.desc()).limit(limit).all()
+
+
+def mark_read(user_id, notification_ids=None):
+    """Mark the given notifications (or all of them) read; returns how many changed."""
+    query = Notification.query.filter(Notification.tenant_id == user_id, Notification.is_read.is_(False))
+    if notification_ids is not None:
+        if not notification_ids:
+            return 0
+        query = query.filter(Notification.id.in_(notification_ids))
+    changed = query.update({Notification.is_read: True}, synchronize_session=False)
+
+    if notification_ids is None:
+        User.query.filter(User.id == user_id).update(
+            {User.unread_notification_count: 0}, synchronize_session=False
+        )
+    elif changed:
+        _decrement_unread(user_id, changed)
+    unread = db.session.query(User.unread_notification_count).filter(User.id == user_id).scalar()
+    queue_push(f"user_{user_id}", 'unread_count', {'unread': unread})
+    db.session.commit()
+    return changed
@@ -0,0 +1,159 @@
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from extensions import socketio
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(RuntimeError):
+    """Raised when the hashing queue is full and the caller should back off."""
+
+
+# ---------------- Worker functions ----------------
+# Module-level so ProcessPoolExecutor can pickle them.
+def _argon2(params):
+    from argon2 import PasswordHasher as Argon2Hasher
+    return Argon2Hasher(**params)
+
+
+def _hash(algorithm, params, password):
+    if algorithm == 'argon2id':
+        return _argon2(params).hash(password)
+    return generate_password_hash(password, method=algorithm)
+
+
+def _verify(stored_hash, password):
+    if stored_hash.startswith('$argon2'):
+        from argon2.exceptions import VerificationError, InvalidHashError
+        try:
+            return _argon2({}).verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return check_password_hash(stored_hash, password)
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a process pool.
+
+    Key derivation is deliberately CPU-heavy; running it in the web process
+    stalls the eventlet hub and every socket with it. Calls run on a pool of
+    PASSWORD_HASH_WORKERS processes and at most PASSWORD_HASH_QUEUE_SIZE may
+    be in flight at once; beyond that HashingBusy is raised straight away
+    instead of piling up. The caller polls its future with socketio.sleep, so
+    under eventlet (which this app does not monkey-patch) only its own green
+    thread waits. Set PASSWORD_HASH_WORKERS = 0 to hash inline (tests,
+    one-off scripts).
+    """
+
+    def __init__(self):
+        self.algorithm = 'scrypt'
+        self.params = {}
+        self.workers = 0
+        self.timeout = 10
+        self._slots = threading.BoundedSemaphore(64)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def init_app(self, app):
+        self.algorithm = app.config['PASSWORD_HASH_ALGORITHM']
+        self.params = app.config['PASSWORD_HASH_PARAMS']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE_SIZE'])
+        app.extensions['password_hasher'] = self
+        atexit.register(self.shutdown)
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _wait(self, future):
+        # Native Future.result() would block the whole eventlet hub
+        deadline = time.monotonic() + self.timeout
+        delay = 0.002
+        while not future.done():
+            if time.monotonic() >= deadline:
+                future.cancel()
+                raise HashingBusy("Password hashing timed out")
+            if socketio.server is not None:
+                socketio.sleep(delay)
+            else:  # no app (one-off scripts)
+                time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        return future.result()
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise HashingBusy("Password hashing queue is full")
+        with self._stats_lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            if self.workers:
+                return self._wait(self._executor().submit(fn, *args))
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, self.algorithm, self.params, password)
+
+    def verify(self, stored_hash, password):
+        if not stored_hash or password is None:
+            return False
+        return self._run(_verify, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """True when stored_hash was made with a different algorithm or parameters."""
+        if self.algorithm == 'argon2id':
+            if not stored_hash.startswith('$argon2id$'):
+                return True
+            return _argon2(self.params).check_needs_rehash(stored_hash)
+        # werkzeug hashes look like "scrypt:32768:8:1$salt$hash"; the part before
+        # the first "$" is the method string generate_password_hash was given
+        method = stored_hash.split('$', 1)[0]
+        return method != self.algorithm and method.split(':', 1)[0] != self.algorithm
+
+    def metrics(self):
+        with self._stats_lock:
+            return {
+                'algorithm': self.algorithm,
+                'workers': self.workers,
+                'queue_depth': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_ms': round(1000 * self.total_seconds / self.completed, 2) if self.completed else 0,
+                'max_ms': round(1000 * self.max_seconds, 2),
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+hasher = PasswordHasher()
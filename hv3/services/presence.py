@@ -0,0 +1,254 @@
+import json
+import logging
+import threading
+import time
+import uuid
+
+from extensions import socketio
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteWorker:
+    __slots__ = ('users', 'expires')
+
+    def __init__(self, users, expires):
+        self.users = users
+        self.expires = expires
+
+
+class Presence:
+    """
+    Who is connected, across every web process.
+
+    Each process keeps its own connections (sid -> user id, and a count per
+    user) and the merged view: for every user online anywhere, the number of
+    processes reporting them, so is_online() is one dict lookup. Heartbeats
+    only overwrite a timestamp per connection; a background task flushes every
+    PRESENCE_FLUSH_INTERVAL seconds, disconnecting connections whose heartbeats
+    stopped and publishing the batch of users who came online or went
+    offline here. With a Redis SOCKETIO_MESSAGE_QUEUE the batch goes to the
+    other processes over a channel on the same server, along with a full list
+    every PRESENCE_SNAPSHOT_INTERVAL so a process that died is forgotten once
+    its list expires. Without one, presence covers this process only.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.timeout = 75
+        self.flush_interval = 2.0
+        self.snapshot_interval = 30
+        self.channel = 'presence'
+        self._sids = {}     # sid -> user_id
+        self._counts = {}   # user_id -> connections here
+        self._beats = {}    # sid -> monotonic time of its last heartbeat
+        self._online = {}   # user_id -> processes reporting them, this one included
+        self._remote = {}   # worker_id -> RemoteWorker
+        self._changed = set()
+        self._on_drop = []
+        self._lock = threading.Lock()
+        self._redis = None
+        self._started = False
+
+    def init_app(self, app):
+        self.app = app
+        self.timeout = app.config['PRESENCE_TIMEOUT']
+        self.flush_interval = app.config['PRESENCE_FLUSH_INTERVAL']
+        self.snapshot_interval = app.config['PRESENCE_SNAPSHOT_INTERVAL']
+        self.channel = app.config['PRESENCE_CHANNEL']
+        url = app.config.get('SOCKETIO_MESSAGE_QUEUE') or ''
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            import redis
+            self._redis = redis.Redis.from_url(url)
+        elif url:
+            logger.warning("Presence is only shared through a Redis message queue; tracking this process only")
+        app.extensions['presence'] = self
+
+    def on_drop(self, callback):
+        """Call callback(user_id, sid) whenever a connection goes, by disconnect or timeout."""
+        self._on_drop.append(callback)
+        return callback
+
+    # ---- queries ----
+    def is_online(self, user_id):
+        return user_id in self._online
+
+    def online_among(self, user_ids):
+        online = self._online
+        return {user_id for user_id in user_ids if user_id in online}
+
+    def __len__(self):
+        return len(self._online)
+
+    # ---- this process's connections ----
+    def _bump(self, user_id, delta):
+        count = self._online.get(user_id, 0) + delta
+        if count > 0:
+            self._online[user_id] = count
+        else:
+            self._online.pop(user_id, None)
+
+    def connect(self, user_id, sid):
+        self._start()
+        with self._lock:
+            if sid in self._sids:
+                return
+            self._sids[sid] = user_id
+            count = self._counts.get(user_id, 0)
+            self._counts[user_id] = count + 1
+            if count == 0:
+                self._bump(user_id, 1)
+                self._changed.add(user_id)
+
+    def _remove(self, sid):
+        user_id = self._sids.pop(sid, None)
+        self._beats.pop(sid, None)
+        if user_id is None:
+            return None
+        count = self._counts[user_id] - 1
+        if count:
+            self._counts[user_id] = count
+        else:
+            del self._counts[user_id]
+            self._bump(user_id, -1)
+            self._changed.add(user_id)
+        return user_id
+
+    def disconnect(self, sid):
+        with self._lock:
+            user_id = self._remove(sid)
+        if user_id is not None:
+            self._dropped(user_id, sid)
+        return user_id
+
+    def heartbeat(self, sid):
+        # Coalesced: repeated beats between flushes only move one timestamp.
+        # Connections that never beat are left to Socket.IO's own ping timeout.
+        if sid in self._sids:
+            self._beats[sid] = time.monotonic()
+
+    def _dropped(self, user_id, sid):
+        for callback in self._on_drop:
+            try:
+                callback(user_id, sid)
+            except Exception as e:
+                logger.warning(f"Presence drop handler failed for user {user_id}: {e}")
+
+    # ---- flushing and merging ----
+    def _start(self):
+        if self._started or self.app is None:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        socketio.start_background_task(self._flush_loop)
+        if self._redis is not None:
+            socketio.start_background_task(self._listen)
+
+    def _flush_loop(self):
+        last_snapshot = 0.0
+        while True:
+            socketio.sleep(self.flush_interval)
+            try:
+                now = time.monotonic()
+                snapshot = now - last_snapshot >= self.snapshot_interval
+                self.flush(now, snapshot)
+                if snapshot:
+                    last_snapshot = now
+            except Exception as e:
+                logger.error(f"Presence flush failed: {e}", exc_info=True)
+
+    def flush(self, now=None, snapshot=False):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            stale = [sid for sid, beat in self._beats.items() if now - beat > self.timeout]
+            dropped = [(user_id, sid) for user_id, sid in ((self._remove(sid), sid) for sid in stale)
+                       if user_id is not None]
+            expired = [w for w, remote in self._remote.items() if remote.expires < now]
+            for worker_id in expired:
+                for user_id in self._remote.pop(worker_id).users:
+                    self._bump(user_id, -1)
+                    if user_id not in self._online:
+                        self._changed.add(user_id)
+            changed, self._changed = self._changed, set()
+            online = [u for u in changed if u in self._counts]
+            offline = [u for u in changed if u not in self._counts]
+            local = list(self._counts) if snapshot else None
+
+        if dropped:
+            with self.app.app_context():
+                for user_id, sid in dropped:
+                    self._dropped(user_id, sid)
+            # A silent socket may still be open; close it so the client
+            # reconnects (and registers again) instead of staying offline
+            for _, sid in dropped:
+                try:
+                    socketio.server.disconnect(sid, namespace='/')
+                except Exception as e:
+                    logger.warning(f"Could not close stale connection {sid}: {e}")
+        if self._redis is not None and (online or offline or local is not None):
+            message = {'w': self.worker_id, 'up': online, 'down': offline}
+            if local is not None:
+                message['all'] = local
+            try:
+                self._redis.publish(self.channel, json.dumps(message))
+            except Exception as e:
+                logger.warning(f"Could not publish presence: {e}")
+        # Watchers get the merged state: leaving here while connected elsewhere is still online
+        for user_id in changed:
+            state = user_id in self._online
+            socketio.emit('presence', {'user_id': user_id, 'online': state}, to=f"presence_{user_id}")
+
+    def merge(self, message, now=None):
+        """Apply another process's batch to the merged view."""
+        worker_id = message.get('w')
+        if not worker_id or worker_id == self.worker_id:
+            return
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            remote = self._remote.get(worker_id)
+            if remote is None:
+                remote = self._remote[worker_id] = RemoteWorker(set(), 0)
+            remote.expires = now + self.snapshot_interval * 3
+            if 'all' in message:
+                users = set(message['all'])
+                added, removed = users - remote.users, remote.users - users
+                remote.users = users
+            else:
+                added = {u for u in message.get('up', ()) if u not in remote.users}
+                removed = {u for u in message.get('down', ()) if u in remote.users}
+                remote.users |= added
+                remote.users -= removed
+            for user_id in added:
+                self._bump(user_id, 1)
+            for user_id in removed:
+                self._bump(user_id, -1)
+
+    def _listen(self):
+        # Polled rather than pubsub.listen(): a blocking socket read would stall
+        # the eventlet hub, which this app does not monkey-patch
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                while True:
+                    item = pubsub.get_message(timeout=0)
+                    if item is None:
+                        socketio.sleep(0.2)
+                        continue
+                    try:
+                        self.merge(json.loads(item['data']))
+                    except (ValueError, TypeError, KeyError):
+                        logger.warning("Ignored malformed presence message")
+            except Exception as e:
+                logger.warning(f"Presence channel lost ({e}); resubscribing")
+                socketio.sleep(1)
+
+
+presence = Presence()
+
+
+def init_app(app):
+    presence.init_app(app)
@@ -0,0 +1,66 @@
+import functools
+import logging
+
+from flask import request
+from flask_socketio import join_room
+
+logger = logging.getLogger(__name__)
+
+
+class SocketContext:
+    """Who is on the other end of one Socket.IO connection, resolved once at connect."""
+    __slots__ = ('sid', 'user_id', 'name', 'role', 'last_message_at')
+
+    def __init__(self, sid, user_id, name, role):
+        self.sid = sid
+        self.user_id = user_id
+        self.name = name
+        self.role = role
+        self.last_message_at = None
+
+    @property
+    def is_agent(self):
+        return self.role == 'admin'
+
+    @property
+    def chat_room(self):
+        return f"chat_{self.user_id}"
+
+
+# sid -> SocketContext for this process's connections
+_contexts = {}
+
+
+def bind(user, sid):
+    """
+    Cache the logged-in user for this connection and join its rooms: the
+    user's own (server pushes), their role's (announcements) and their support
+    chat. Clients never pick rooms themselves.
+    """
+    ctx = _contexts[sid] = SocketContext(sid, user.id, user.name, (user.role or '').lower())
+    for room in (f"user_{ctx.user_id}", f"role_{ctx.role}", ctx.chat_room):
+        join_room(room, sid=sid)
+    return ctx
+
+
+def release(sid):
+    return _contexts.pop(sid, None)
+
+
+def context(sid=None):
+    return _contexts.get(sid or request.sid)
+
+
+def authenticated(handler):
+    """
+    Socket.IO handler decorator: pass the connection's SocketContext as the
+    first argument. Events on connections that were never bound are dropped.
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        ctx = _contexts.get(request.sid)
+        if ctx is None:
+            logger.warning(f"Dropped {request.event['message']!r} from unauthenticated socket {request.sid}")
+            return None
+        return handler(ctx, *args, **kwargs)
+    return wrapper
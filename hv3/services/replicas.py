@@ -0,0 +1,149 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+STICKY_COOKIE = 'db_primary_until'
+
+
+# ---------------- Routing ----------------
+def _wants_replica(session):
+    if not has_request_context() or not g.get('_read_only'):
+        return False
+    if g.get('_db_wrote') or _sticky():
+        return False
+    # Anything about to be written, and the flush itself, stays on the primary
+    return not (session._flushing or session.new or session.dirty or session.deleted)
+
+
+class RoutingSession(FlaskSession):
+    """
+    Sends reads in @read_only views to the 'replica' bind and everything else
+    to the primary. Without a configured replica it behaves like the default
+    session.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _wants_replica(self):
+            engine = replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Mark a view as read-only so its queries may be served by the replica."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g._read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# ---------------- Read-your-writes ----------------
+# A request that commits a write pins that browser to the primary for
+# DB_REPLICA_STICKY_SECONDS, long enough for the replica to catch up.
+@event.listens_for(FlaskSession, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(FlaskSession, 'after_commit')
+def _remember_write(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        g._db_wrote = True
+
+
+@event.listens_for(FlaskSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
+
+
+def _sticky():
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def _set_sticky_cookie(response):
+    if g.get('_db_wrote') and _replica_configured:
+        seconds = current_app.config['DB_REPLICA_STICKY_SECONDS']
+        response.set_cookie(STICKY_COOKIE, f"{time.time() + seconds:.0f}", max_age=seconds,
+                            httponly=True, samesite='Lax', secure=request.is_secure)
+    return response
+
+
+# ---------------- Replica engine ----------------
+_replica_configured = False
+_sqlite_sync = None
+
+
+def replica_engine():
+    if not _replica_configured:
+        return None
+    from extensions import db
+    if _sqlite_sync is not None:
+        _sqlite_sync.maybe_sync(db.engine)
+    return db.engines[REPLICA_BIND]
+
+
+class SQLiteReplica:
+    """
+    Local stand-in for a real replica: a copy of the primary SQLite file,
+    refreshed with the backup API at most every `interval` seconds so views
+    see the same kind of lag they would in production.
+    """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._synced_at = 0.0
+
+    def maybe_sync(self, primary_engine):
+        if time.monotonic() - self._synced_at < self.interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._synced_at < self.interval:
+                return
+            source = sqlite3.connect(primary_engine.url.database)
+            target = sqlite3.connect(self.path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self._synced_at = time.monotonic()
+
+
+def configure(app):
+    """Add the replica bind before db.init_app, from DB_REPLICA_URL or SQLite mode."""
+    global _replica_configured, _sqlite_sync
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    if app.config['DB_REPLICA_MODE'] == 'sqlite':
+        if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            raise RuntimeError("DB_REPLICA_MODE=sqlite needs a SQLite primary database")
+        path = app.config['DB_REPLICA_SQLITE_PATH']
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        binds[REPLICA_BIND] = f"sqlite:///{path}"
+        _sqlite_sync = SQLiteReplica(path, app.config['DB_REPLICA_SYNC_INTERVAL'])
+    elif app.config['DB_REPLICA_URL']:
+        binds[REPLICA_BIND] = app.config['DB_REPLICA_URL']
+    _replica_configured = REPLICA_BIND in binds
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_app(app):
+    if _replica_configured:
+        app.after_request(_set_sticky_cookie)
+        logger.info(f"Read-only views use the '{REPLICA_BIND}' bind")
@@ -0,0 +1,478 @@
+import csv
+import logging
+import threading
+import time
+from collections.abc import Mapping
+from datetime import date, timedelta
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import and_, case, event, exists, extract, func, or_, select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models.models import (RESOLVED_STATUSES, Booking, House, LedgerBalance, LedgerEntry,
+                           MaintenanceRequest, Payment)
+from services.availability import BLOCKING_STATUSES
+from services.exports import FLUSH_BYTES, _LineBuffer
+from services.ledger import from_cents
+
+logger = logging.getLogger(__name__)
+
+# Leases that occupied the house while they ran, including finished ones
+OCCUPYING_STATUSES = BLOCKING_STATUSES + ('completed', 'ended', 'moved_out')
+# Arrears aging buckets: (label, oldest day overdue in the bucket)
+AGING_BUCKETS = (('current', 0), ('1-30', 1), ('31-60', 31), ('61-90', 61), ('90+', 91))
+
+
+# ---------------- Change tracking ----------------
+class PortfolioChanges:
+    """
+    When each house and landlord last had a committed write in this process,
+    so cached per-landlord figures can tell whether they are stale without a
+    query. Other processes' writes are only picked up when the cache TTL runs out.
+    """
+
+    def __init__(self):
+        self._houses = {}
+        self._landlords = {}
+
+    def touch(self, house_ids=(), landlord_ids=()):
+        now = time.monotonic()
+        for house_id in house_ids:
+            self._houses[house_id] = now
+        for landlord_id in landlord_ids:
+            self._landlords[landlord_id] = now
+
+    def changed_since(self, since, landlord_id, house_ids):
+        if self._landlords.get(landlord_id, 0) > since:
+            return True
+        return any(self._houses.get(house_id, 0) > since for house_id in house_ids)
+
+
+changes = PortfolioChanges()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_portfolio_changes(session, flush_context):
+    houses = session.info.setdefault('portfolio_houses', set())
+    landlords = session.info.setdefault('portfolio_landlords', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, House):
+            houses.add(obj.id)
+            landlords.add(obj.owner_id)
+        elif isinstance(obj, (Booking, Payment, LedgerEntry, MaintenanceRequest)) and obj.house_id:
+            houses.add(obj.house_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_portfolio_changes(session):
+    houses = session.info.pop('portfolio_houses', None)
+    landlords = session.info.pop('portfolio_landlords', None)
+    if houses or landlords:
+        changes.touch(houses or (), landlords or ())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_portfolio_changes(session):
+    session.info.pop('portfolio_houses', None)
+    session.info.pop('portfolio_landlords', None)
+
+
+class LandlordCache:
+    """Per-landlord results that expire after a TTL or as soon as one of their houses changes."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, landlord_id, ttl, compute):
+        """compute() returns (value, house_ids the value depends on)."""
+        entry = self._entries.get((key, landlord_id))
+        now = time.monotonic()
+        if entry is not None:
+            computed_at, house_ids, value = entry
+            if now - computed_at < ttl and not changes.changed_since(computed_at, landlord_id, house_ids):
+                return value
+        value, house_ids = compute()
+        with self._lock:
+            self._entries[(key, landlord_id)] = (now, frozenset(house_ids), value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = LandlordCache()
+
+
+# ---------------- Periods ----------------
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    index = day.month - 1 + months
+    return date(day.year + index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(start, count):
+    """First days of `count` consecutive months from `start`, plus the day after the last."""
+    return [add_months(start, i) for i in range(count + 1)]
+
+
+# ---------------- Occupancy ----------------
+def _lease_rows(landlord_id, start, end, statuses=OCCUPYING_STATUSES):
+    """
+    (house_id, first day, day after last) of every lease that touches
+    [start, end), clipped to it. Nothing counts beyond today.
+    """
+    cutoff = min(end, date.today() + timedelta(days=1))
+    rows = (
+        db.session.query(Booking.house_id, Booking.lease_start_date, Booking.lease_end_date)
+        .join(House, House.id == Booking.house_id)
+        .filter(House.owner_id == landlord_id, Booking.status.in_(statuses))
+        .filter((Booking.lease_start_date.is_(None)) | (Booking.lease_start_date < cutoff))
+        .filter((Booking.lease_end_date.is_(None)) | (Booking.lease_end_date > start))
+        .all()
+    )
+    return [(house_id, max(lease_start or start, start), min(lease_end or cutoff, cutoff))
+            for house_id, lease_start, lease_end in rows]
+
+
+def occupied_days(leases, bounds):
+    """
+    {house_id: [occupied days in each period]} for periods between
+    consecutive `bounds` dates. Uses NumPy when installed: the leases x
+    periods overlap matrix is a few array operations even for many years.
+    """
+    periods = len(bounds) - 1
+    if not leases:
+        return {}
+    house_ids = sorted({house_id for house_id, _, _ in leases})
+    try:
+        import numpy as np
+    except ImportError:
+        result = {house_id: [0] * periods for house_id in house_ids}
+        for house_id, lease_start, lease_end in leases:
+            row = result[house_id]
+            for i in range(periods):
+                days = (min(lease_end, bounds[i + 1]) - max(lease_start, bounds[i])).days
+                if days > 0:
+                    row[i] += days
+        return result
+
+    position = {house_id: i for i, house_id in enumerate(house_ids)}
+    edges = np.array([d.toordinal() for d in bounds])
+    starts = np.array([s.toordinal() for _, s, _ in leases])[:, None]
+    ends = np.array([e.toordinal() for _, _, e in leases])[:, None]
+    per_lease = np.clip(np.minimum(ends, edges[None, 1:]) - np.maximum(starts, edges[None, :-1]), 0, None)
+    totals = np.zeros((len(house_ids), periods), dtype=np.int64)
+    np.add.at(totals, [position[house_id] for house_id, _, _ in leases], per_lease)
+    return {house_id: totals[position[house_id]].tolist() for house_id in house_ids}
+
+
+# ---------------- Money ----------------
+def _monthly(model, amount, date_column, filters, group_by=()):
+    year, month = extract('year', date_column), extract('month', date_column)
+    return (
+        db.session.query(*group_by, year.label('year'), month.label('month'), func.sum(amount).label('total'),
+                         # Running total per group, in the same pass as the monthly sums
+                         func.sum(func.sum(amount)).over(partition_by=list(group_by) or None,
+                                                         order_by=(year, month)).label('running'))
+        .select_from(model)
+        .join(House, House.id == model.house_id)
+        .filter(*filters)
+        .group_by(*group_by, year, month)
+        .all()
+    )
+
+
+def _charges(landlord_id, start, end, by_house=False):
+    """Rent due per month from ledger charges (cents)."""
+    return _monthly(LedgerEntry, LedgerEntry.amount_cents, LedgerEntry.due_date, [
+        House.owner_id == landlord_id, LedgerEntry.kind == 'charge',
+        LedgerEntry.due_date >= start, LedgerEntry.due_date < end,
+    ], group_by=(LedgerEntry.house_id,) if by_house else ())
+
+
+def _collections(landlord_id, start, end, by_house=False):
+    """
+    Rent collected per month from paid payments (shillings), in the month the
+    money arrived: a request made on the 31st and confirmed on the 1st counts
+    for the new month. Payments marked paid before confirmed_at existed fall
+    back to their request date.
+    """
+    paid_on = func.coalesce(Payment.confirmed_at, Payment.date)
+    return _monthly(Payment, Payment.amount, paid_on, [
+        House.owner_id == landlord_id, Payment.status == 'Paid',
+        paid_on >= start, paid_on < end,
+    ], group_by=(Payment.house_id,) if by_house else ())
+
+
+def _key(row):
+    return f"{int(row.year):04d}-{int(row.month):02d}"
+
+
+def _money(value):
+    return Decimal(value or 0).quantize(Decimal('0.01'))
+
+
+def arrears_aging(landlord_id, today=None):
+    """
+    Outstanding balances by how long they have been due. Payments settle the
+    oldest charges first, so what is unpaid is the newest charges adding up to
+    the balance; a running sum from the newest charge backwards finds them.
+    """
+    today = today or date.today()
+    newer_total = func.sum(LedgerEntry.amount_cents).over(
+        partition_by=(LedgerEntry.tenant_id, LedgerEntry.house_id),
+        order_by=(LedgerEntry.due_date.desc(), LedgerEntry.id.desc()),
+    )
+    rows = (
+        db.session.query(LedgerEntry.due_date, LedgerEntry.amount_cents, newer_total.label('newer_total'),
+                         LedgerBalance.balance_cents)
+        .join(LedgerBalance, and_(LedgerBalance.tenant_id == LedgerEntry.tenant_id,
+                                  LedgerBalance.house_key == LedgerEntry.house_id))
+        .join(House, House.id == LedgerEntry.house_id)
+        .filter(House.owner_id == landlord_id, LedgerEntry.kind == 'charge', LedgerBalance.balance_cents > 0)
+        .all()
+    )
+    buckets = {label: 0 for label, _ in AGING_BUCKETS}
+    for due_date, amount, newer, balance in rows:
+        unpaid = min(amount, balance - (newer - amount))
+        if unpaid <= 0:
+            continue
+        overdue = (today - due_date).days if due_date else 0
+        label = [label for label, first_day in AGING_BUCKETS if overdue >= first_day][-1]
+        buckets[label] += unpaid
+    return {label: from_cents(cents) for label, cents in buckets.items()}
+
+
+# ---------------- Maintenance ----------------
+def maintenance_turnaround(landlord_id, start, end):
+    """{house_id: (open requests, resolved in window, mean hours to resolve)}."""
+    rows = (
+        db.session.query(MaintenanceRequest.house_id, MaintenanceRequest.date_submitted,
+                         MaintenanceRequest.resolved_at, MaintenanceRequest.status)
+        .join(House, House.id == MaintenanceRequest.house_id)
+        .filter(House.owner_id == landlord_id)
+        .filter((MaintenanceRequest.resolved_at.is_(None)) | (MaintenanceRequest.resolved_at >= start))
+        .all()
+    )
+    stats = {}
+    for house_id, submitted, resolved, status in rows:
+        open_count, resolved_count, hours = stats.get(house_id, (0, 0, 0.0))
+        if resolved is None:
+            if (status or '').lower() not in RESOLVED_STATUSES:
+                open_count += 1
+        elif submitted and resolved.date() < end:
+            resolved_count += 1
+            hours += (resolved - submitted).total_seconds() / 3600
+        stats[house_id] = (open_count, resolved_count, hours)
+    return {house_id: (o, r, round(h / r, 1) if r else None) for house_id, (o, r, h) in stats.items()}
+
+
+# ---------------- Report ----------------
+def build_report(landlord_id, months=None, today=None):
+    """Everything landlord.reports shows, for the `months` months up to and including this one."""
+    today = today or date.today()
+    months = months or current_app.config['REPORTS_WINDOW_MONTHS']
+    bounds = month_bounds(add_months(month_start(today), 1 - months), months)
+    start, end = bounds[0], bounds[-1]
+
+    houses = (
+        db.session.query(House.id, House.title, House.rent_amount)
+        .filter(House.owner_id == landlord_id)
+        .order_by(House.id)
+        .all()
+    )
+    house_ids = [house.id for house in houses]
+
+    occupied = occupied_days(_lease_rows(landlord_id, start, end), bounds)
+    window_days = (min(end, today + timedelta(days=1)) - start).days
+    occupied_now = {house_id for house_id, _, _ in
+                    _lease_rows(landlord_id, today, today + timedelta(days=1), BLOCKING_STATUSES)}
+
+    due = {_key(row): (from_cents(row.total), from_cents(row.running))
+           for row in _charges(landlord_id, start, end)}
+    collected = {_key(row): (_money(row.total), _money(row.running))
+                 for row in _collections(landlord_id, start, end)}
+    due_by_house = {}
+    for row in _charges(landlord_id, start, end, by_house=True):
+        due_by_house[row.house_id] = due_by_house.get(row.house_id, 0) + from_cents(row.total)
+    collected_by_house = {}
+    for row in _collections(landlord_id, start, end, by_house=True):
+        collected_by_house[row.house_id] = collected_by_house.get(row.house_id, 0) + _money(row.total)
+    maintenance = maintenance_turnaround(landlord_id, start, end)
+
+    monthly = []
+    running_due = running_collected = Decimal('0.00')
+    for month in bounds[:-1]:
+        key = f"{month:%Y-%m}"
+        # Months without rows carry the previous running total forward
+        month_due, running_due = due.get(key, (Decimal('0.00'), running_due))
+        month_collected, running_collected = collected.get(key, (Decimal('0.00'), running_collected))
+        monthly.append({
+            'month': key,
+            'due': month_due,
+            'collected': month_collected,
+            'cumulative_due': running_due,
+            'cumulative_collected': running_collected,
+        })
+
+    properties = []
+    for house in houses:
+        open_requests, resolved, turnaround = maintenance.get(house.id, (0, 0, None))
+        days = sum(occupied.get(house.id, []))
+        properties.append({
+            'id': house.id,
+            'title': house.title,
+            'rent': _money(house.rent_amount),
+            'occupied': house.id in occupied_now,
+            'occupancy_rate': round(100 * min(days, window_days) / window_days, 1) if window_days else 0,
+            'due': due_by_house.get(house.id, Decimal('0.00')),
+            'collected': collected_by_house.get(house.id, Decimal('0.00')),
+            'open_requests': open_requests,
+            'resolved_requests': resolved,
+            'turnaround_hours': turnaround,
+        })
+    properties.sort(key=lambda p: p['collected'], reverse=True)
+
+    resolved_total = sum(p['resolved_requests'] for p in properties)
+    total_due, total_collected = running_due, running_collected
+    aging = arrears_aging(landlord_id, today)
+    summary = {
+        'properties': len(houses),
+        'occupied_now': len(occupied_now),
+        'occupancy_rate': round(100 * len(occupied_now) / len(houses), 1) if houses else 0,
+        'due': total_due,
+        'collected': total_collected,
+        'collection_rate': round(100 * total_collected / total_due, 1) if total_due else None,
+        'arrears': sum(aging.values(), Decimal('0.00')),
+        'open_requests': sum(p['open_requests'] for p in properties),
+        'turnaround_hours': round(sum((p['turnaround_hours'] or 0) * p['resolved_requests'] for p in properties)
+                                  / resolved_total, 1) if resolved_total else None,
+    }
+    return {
+        'start': start, 'end': end, 'months': months, 'summary': summary,
+        'monthly': monthly, 'properties': properties, 'aging': aging,
+    }, house_ids
+
+
+def landlord_report(landlord_id, months=None):
+    """
+    build_report() through the per-landlord cache. M-Pesa confirmations are
+    committed by `flask worker`, whose writes this process never sees in
+    PortfolioChanges, so a confirmed payment shows up only once
+    REPORTS_CACHE_TTL has passed.
+    """
+    months = months or current_app.config['REPORTS_WINDOW_MONTHS']
+    return cache.get(('report', months), landlord_id, current_app.config['REPORTS_CACHE_TTL'],
+                     lambda: build_report(landlord_id, months))
+
+
+# ---------------- Export ----------------
+EXPORT_HEADER = ['month', 'house_id', 'title', 'due', 'collected', 'occupied_days', 'days_in_month']
+
+
+def monthly_export(landlord_id, years):
+    """CSV bytes of per-property monthly figures over `years` years, for long-range analysis."""
+    today = date.today()
+    months = 12 * years
+    bounds = month_bounds(add_months(month_start(today), 1 - months), months)
+    start, end = bounds[0], bounds[-1]
+
+    titles = dict(db.session.query(House.id, House.title).filter(House.owner_id == landlord_id).all())
+    occupied = occupied_days(_lease_rows(landlord_id, start, end), bounds)
+    due = {(row.house_id, _key(row)): from_cents(row.total)
+           for row in _charges(landlord_id, start, end, by_house=True)}
+    collected = {(row.house_id, _key(row)): _money(row.total)
+                 for row in _collections(landlord_id, start, end, by_house=True)}
+
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADER)
+    for i, month in enumerate(bounds[:-1]):
+        key, days_in_month = f"{month:%Y-%m}", (bounds[i + 1] - month).days
+        for house_id, title in sorted(titles.items()):
+            writer.writerow([key, house_id, title, due.get((house_id, key), Decimal('0.00')),
+                             collected.get((house_id, key), Decimal('0.00')),
+                             occupied.get(house_id, [0] * months)[i], days_in_month])
+            if buffer.size >= FLUSH_BYTES:
+                yield buffer.drain()
+    yield buffer.drain()
+
+
+
+# ---------------- Sidebar stats ----------------
+def compute_stats(landlord_id, today=None):
+    """
+    Headline numbers shown on every landlord page, in one statement: a row
+    per owned house whose correlated subqueries each hit a per-house index,
+    summed here. Returns the house ids too, for cache invalidation.
+    """
+    today = today or date.today()
+    occupied = exists().where(
+        Booking.house_id == House.id,
+        Booking.status.in_(BLOCKING_STATUSES),
+        or_(Booking.lease_start_date.is_(None), Booking.lease_start_date <= today),
+        or_(Booking.lease_end_date.is_(None), Booking.lease_end_date > today),
+    )
+    pending_payments = (
+        select(func.count(Payment.id))
+        .where(Payment.house_id == House.id, Payment.status == 'Pending')
+        .correlate(House).scalar_subquery()
+    )
+    open_requests = (
+        select(func.count(MaintenanceRequest.id))
+        .where(MaintenanceRequest.house_id == House.id, MaintenanceRequest.resolved_at.is_(None),
+               func.lower(MaintenanceRequest.status).notin_(RESOLVED_STATUSES))
+        .correlate(House).scalar_subquery()
+    )
+    rows = (
+        db.session.query(House.id, House.rent_amount, case((occupied, 1), else_=0),
+                         pending_payments, open_requests)
+        .filter(House.owner_id == landlord_id)
+        .all()
+    )
+    properties = len(rows)
+    occupied_count = sum(row[2] for row in rows)
+    stats = {
+        'total_properties': properties,
+        'occupied': occupied_count,
+        'vacant': properties - occupied_count,
+        'occupancy_rate': round(100 * occupied_count / properties, 1) if properties else 0,
+        'monthly_revenue': sum((_money(row[1]) for row in rows if row[2]), Decimal('0.00')),
+        'pending_payments': sum(row[3] for row in rows),
+        'open_maintenance': sum(row[4] for row in rows),
+    }
+    return stats, [row[0] for row in rows]
+
+
+class LandlordStats(Mapping):
+    """
+    The `stats` every landlord template receives. Nothing is queried until a
+    template reads a value, so pages that never show the numbers pay nothing;
+    after that the per-landlord cache answers until a write or the TTL.
+    """
+
+    def __init__(self, landlord_id):
+        self.landlord_id = landlord_id
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            self._data = cache.get('stats', self.landlord_id, current_app.config['LANDLORD_STATS_TTL'],
+                                   lambda: compute_stats(self.landlord_id))
+        return self._data
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
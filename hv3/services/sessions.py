@@ -0,0 +1,416 @@
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import session as current_session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from flask_login import user_logged_in, user_logged_out
+
+logger = logging.getLogger(__name__)
+
+serializer = TaggedJSONSerializer()
+
+SID_BYTES = 16  # 22-character cookie value
+
+
+def new_sid():
+    return secrets.token_urlsafe(SID_BYTES)
+
+
+def _valid_sid(sid):
+    return sid and len(sid) <= 64 and all(c.isalnum() or c in '-_' for c in sid)
+
+
+# ---------------- Session object ----------------
+class LazySession(dict, SessionMixin):
+    """
+    Session whose data is only fetched from the store when first touched.
+
+    Requests that never read the session (static files, public JSON) cost no
+    store round trip, no deserialization and no Set-Cookie header.
+    """
+
+    def __init__(self, sid, store, new=False):
+        super().__init__()
+        self.sid = sid
+        self.store = store
+        self.new = new
+        self.loaded = new
+        self.modified = False
+        self.accessed = False
+        self.replaced_sid = None
+
+    def _load(self):
+        self.accessed = True
+        if not self.loaded:
+            self.loaded = True
+            data = self.store.load(self.sid)
+            if data is None:
+                # Unknown or expired id: start fresh under a new id
+                self.sid = new_sid()
+                self.new = True
+            else:
+                dict.update(self, data)
+
+    def _write(self):
+        self._load()
+        self.modified = True
+
+    def regenerate(self):
+        """
+        Keep the data but move it to a fresh id, so an id planted or seen
+        before a change of privilege is worthless afterwards. The old record
+        is deleted when the response is saved.
+        """
+        self._write()
+        if not self.new and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = new_sid()
+        self.new = True
+
+    def __getitem__(self, key):
+        self._load()
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        self._load()
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self._load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._load()
+        return dict.__len__(self)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def get(self, key, default=None):
+        self._load()
+        return dict.get(self, key, default)
+
+    def keys(self):
+        self._load()
+        return dict.keys(self)
+
+    def values(self):
+        self._load()
+        return dict.values(self)
+
+    def items(self):
+        self._load()
+        return dict.items(self)
+
+    def copy(self):
+        self._load()
+        return dict.copy(self)
+
+    def __setitem__(self, key, value):
+        self._write()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._write()
+        dict.__delitem__(self, key)
+
+    def setdefault(self, key, default=None):
+        self._load()
+        if not dict.__contains__(self, key):
+            self.modified = True
+        return dict.setdefault(self, key, default)
+
+    def pop(self, key, *default):
+        self._write()
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self._write()
+        return dict.popitem(self)
+
+    def update(self, *args, **kwargs):
+        self._write()
+        dict.update(self, *args, **kwargs)
+
+    def clear(self):
+        self._write()
+        dict.clear(self)
+
+
+# ---------------- Stores ----------------
+class MemoryStore:
+    """Per-process LRU store; for development and single-process deployments."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # sid -> (payload, expires, user_id)
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                self._remove(sid)
+                return None
+            self._data.move_to_end(sid)
+            return serializer.loads(entry[0])
+
+    def save(self, sid, data, user_id, ttl):
+        with self._lock:
+            self._remove(sid)
+            self._data[sid] = (serializer.dumps(data), time.time() + ttl, user_id)
+            if user_id:
+                self._by_user.setdefault(user_id, set()).add(sid)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry:
+                self._data[sid] = (entry[0], time.time() + ttl, entry[2])
+
+    def delete(self, sid):
+        with self._lock:
+            self._remove(sid)
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            sids = self._by_user.pop(str(user_id), set())
+            for sid in list(sids):
+                self._remove(sid)
+            return len(sids)
+
+    def _remove(self, sid):
+        entry = self._data.pop(sid, None)
+        if entry and entry[2]:
+            self._by_user.get(entry[2], set()).discard(sid)
+
+
+class SQLiteStore:
+    """
+    Sessions in a local SQLite file shared by every worker on the host.
+
+    Sliding-expiry touches are buffered and written with one executemany per
+    batch instead of an UPDATE per request.
+    """
+
+    def __init__(self, path, touch_batch=100, touch_interval=30):
+        self.path = path
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " sid TEXT PRIMARY KEY, user_id TEXT, data BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_user ON sessions (user_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+        return serializer.loads(row[0]) if row else None
+
+    def save(self, sid, data, user_id, ttl):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, user_id, data, expires) VALUES (?, ?, ?, ?)",
+                (sid, user_id, serializer.dumps(data), time.time() + ttl),
+            )
+        with self._pending_lock:
+            self._pending.pop(sid, None)
+
+    def touch(self, sid, ttl):
+        with self._pending_lock:
+            self._pending[sid] = time.time() + ttl
+            due = (len(self._pending) >= self.touch_batch
+                   or time.monotonic() - self._last_flush >= self.touch_interval)
+            if not due:
+                return
+            batch = [(expires, sid) for sid, expires in self._pending.items()]
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+        with self._conn() as conn:
+            conn.executemany("UPDATE sessions SET expires = ? WHERE sid = ?", batch)
+            # Piggy-back cleanup on the batched write
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+
+    def delete(self, sid):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def revoke_user(self, user_id):
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM sessions WHERE user_id = ?", (str(user_id),)).rowcount
+
+
+class RedisStore:
+    """Redis (or any server speaking its protocol) with native key expiry."""
+
+    def __init__(self, url, prefix='session:', touch_batch=100, touch_interval=30):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def _key(self, sid):
+        return f"{self.prefix}{sid}"
+
+    def _user_key(self, user_id):
+        return f"{self.prefix}user:{user_id}"
+
+    def load(self, sid):
+        raw = self.client.get(self._key(sid))
+        return serializer.loads(raw.decode('utf-8')) if raw else None
+
+    def save(self, sid, data, user_id, ttl):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(sid), serializer.dumps(data), ex=int(ttl))
+        if user_id:
+            pipe.sadd(self._user_key(user_id), sid)
+            pipe.expire(self._user_key(user_id), int(ttl))
+        pipe.execute()
+
+    def touch(self, sid, ttl):
+        with self._pending_lock:
+            self._pending[sid] = int(ttl)
+            due = (len(self._pending) >= self.touch_batch
+                   or time.monotonic() - self._last_flush >= self.touch_interval)
+            if not due:
+                return
+            batch = list(self._pending.items())
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+        pipe = self.client.pipeline(transaction=False)
+        for pending_sid, pending_ttl in batch:
+            pipe.expire(self._key(pending_sid), pending_ttl)
+        pipe.execute()
+
+    def delete(self, sid):
+        self.client.delete(self._key(sid))
+
+    def revoke_user(self, user_id):
+        sids = self.client.smembers(self._user_key(user_id))
+        if sids:
+            self.client.delete(*[self._key(s.decode('utf-8')) for s in sids])
+        self.client.delete(self._user_key(user_id))
+        return len(sids)
+
+
+# ---------------- Interface ----------------
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Stores session data server-side and keeps only a short random id in the
+    cookie. The cookie is written when the session changes; otherwise each
+    request that reads the session just slides its expiry through store.touch.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if _valid_sid(sid):
+            return LazySession(sid, self.store)
+        return LazySession(new_sid(), self.store, new=True)
+
+    def save_session(self, app, session, response):
+        if not session.loaded:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        ttl = app.permanent_session_lifetime.total_seconds()
+
+        if session.replaced_sid:
+            self.store.delete(session.replaced_sid)
+
+        if not dict.__len__(session):
+            if session.modified and (session.replaced_sid or not session.new):
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified or session.new:
+            user_id = dict.get(session, '_user_id')
+            self.store.save(session.sid, dict(session), str(user_id) if user_id else None, ttl)
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+        else:
+            self.store.touch(session.sid, ttl)
+
+
+_interface = None
+
+
+def build_store(app):
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'memory':
+        return MemoryStore(maxsize=app.config['SESSION_MEMORY_SIZE'])
+    if backend == 'sqlite':
+        return SQLiteStore(app.config['SESSION_SQLITE_PATH'],
+                           touch_batch=app.config['SESSION_TOUCH_BATCH'],
+                           touch_interval=app.config['SESSION_TOUCH_INTERVAL'])
+    if backend == 'redis':
+        return RedisStore(app.config['SESSION_REDIS_URL'],
+                          touch_batch=app.config['SESSION_TOUCH_BATCH'],
+                          touch_interval=app.config['SESSION_TOUCH_INTERVAL'])
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
+
+
+def _rotate_sid(sender, **extra):
+    # Flask-Login fires these inside the request that logs in or out
+    if isinstance(current_session._get_current_object(), LazySession):
+        current_session.regenerate()
+
+
+def init_app(app):
+    """Replace Flask's signed-cookie sessions unless SESSION_BACKEND is 'cookie'."""
+    global _interface
+    if app.config['SESSION_BACKEND'] == 'cookie':
+        return
+    _interface = ServerSideSessionInterface(build_store(app))
+    app.session_interface = _interface
+    user_logged_in.connect(_rotate_sid, app)
+    user_logged_out.connect(_rotate_sid, app)
+
+
+def revoke_user_sessions(user_id):
+    """Sign a user out everywhere; returns the number of sessions removed."""
+    if _interface is None:
+        return 0
+    return _interface.store.revoke_user(user_id)
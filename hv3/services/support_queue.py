@@ -0,0 +1,467 @@
+import heapq
+import itertools
+import logging
+import re
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from extensions import db, socketio
+from models.models import ChatMessage, User
+from services.notifications import queue_push
+from services.presence import presence
+
+logger = logging.getLogger(__name__)
+
+NORMAL, URGENT = 0, 1
+PRIORITY_NAMES = {NORMAL: 'normal', URGENT: 'urgent'}
+URGENT_WORDS = re.compile(r"\b(urgent|emergency|fire|flood(ing)?|leak(ing)?|gas|locked out|break-?in)\b", re.I)
+
+# Recent assignment waits kept for the wait-time percentiles
+WAIT_SAMPLES = 500
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 1)
+
+
+def classify(message):
+    return URGENT if URGENT_WORDS.search(message or '') else NORMAL
+
+
+# ---------------- Queue ----------------
+class Waiting:
+    __slots__ = ('user_id', 'since', 'priority', 'key')
+
+    def __init__(self, user_id, since, priority, key):
+        self.user_id = user_id
+        self.since = since
+        self.priority = priority
+        self.key = key
+
+
+class Shard:
+    """
+    Waiting conversations for a slice of users: a heap of (key, seq, user_id)
+    plus the live entry per user. Raising a priority pushes a new heap item
+    and leaves the old one to be skipped when it surfaces.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heap = []
+        self.waiting = {}
+
+    def _clean(self):
+        while self.heap:
+            key, _, user_id = self.heap[0]
+            entry = self.waiting.get(user_id)
+            if entry is not None and entry.key == key:
+                return entry
+            heapq.heappop(self.heap)
+        return None
+
+
+class Agent:
+    __slots__ = ('user_id', 'name', 'capacity', 'sids', 'active', 'last_assigned', 'available')
+
+    def __init__(self, user_id, name, capacity):
+        self.user_id = user_id
+        self.name = name
+        self.capacity = capacity
+        self.sids = set()
+        self.active = set()
+        self.last_assigned = datetime.min
+        # Chose to take chats; kept across reloads until they go offline on purpose
+        self.available = False
+
+    @property
+    def online(self):
+        return bool(self.sids)
+
+    def to_dict(self):
+        return {'agent_id': self.user_id, 'name': self.name, 'online': self.online,
+                'available': self.available, 'load': len(self.active), 'capacity': self.capacity}
+
+
+class SupportQueue:
+    """
+    Support chats waiting for an agent, and the agents serving them.
+
+    A conversation is a user's unread ChatMessage rows; it waits while they
+    have no support_agent_id and belongs to an agent once they do, until the
+    agent resolves it (marks them read). Waiting conversations are spread
+    over SUPPORT_QUEUE_SHARDS heaps by user id, each with its own lock, and
+    ordered by age, urgent ones with a SUPPORT_URGENT_HEADSTART head start.
+    Because every entry ages at the same rate, that key never changes once
+    set and the heaps stay valid.
+
+    Agents are tracked only in the process holding their sockets, and only
+    that process assigns to them. Assignment claims the rows with a
+    conditional UPDATE, so two processes never take the same conversation,
+    and each process with agents online re-reads the open conversations
+    every SUPPORT_QUEUE_REFRESH seconds to pick up those queued elsewhere.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.capacity = 5
+        self.headstart = timedelta(seconds=600)
+        self.refresh = 10
+        self._shards = [Shard()]
+        self._agents = {}
+        self._assigned = {}  # user_id -> (agent_id, since, priority)
+        self._dispatch_lock = threading.RLock()
+        self._seq = itertools.count()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._assignments = 0
+        self._built_at = None
+        self._sweeper = None
+
+    def init_app(self, app):
+        self.app = app
+        self.capacity = app.config['SUPPORT_AGENT_CAPACITY']
+        self.headstart = timedelta(seconds=app.config['SUPPORT_URGENT_HEADSTART'])
+        self.refresh = app.config['SUPPORT_QUEUE_REFRESH']
+        self._shards = [Shard() for _ in range(max(1, app.config['SUPPORT_QUEUE_SHARDS']))]
+        app.extensions['support_queue'] = self
+        presence.on_drop(self._connection_dropped)
+
+    def _connection_dropped(self, user_id, sid):
+        # A reload or a lost connection keeps the agent's chats; no new ones until they are back
+        if user_id in self._agents:
+            self.agent_offline(user_id, sid=sid)
+
+    def _shard(self, user_id):
+        return self._shards[user_id % len(self._shards)]
+
+    def _key(self, since, priority):
+        return since - self.headstart * priority
+
+    # ---- waiting conversations ----
+    def _add(self, user_id, since, priority):
+        shard = self._shard(user_id)
+        with shard.lock:
+            entry = shard.waiting.get(user_id)
+            if entry is not None:
+                if priority <= entry.priority:
+                    return
+                since = entry.since
+            key = self._key(since, priority)
+            shard.waiting[user_id] = Waiting(user_id, since, priority, key)
+            heapq.heappush(shard.heap, (key, next(self._seq), user_id))
+
+    def _discard(self, user_id):
+        shard = self._shard(user_id)
+        with shard.lock:
+            return shard.waiting.pop(user_id, None)
+
+    def _pop_next(self):
+        """The waiting conversation with the smallest key across all shards."""
+        best = None
+        for shard in self._shards:
+            with shard.lock:
+                entry = shard._clean()
+            if entry is not None and (best is None or entry.key < best.key):
+                best = entry
+        if best is None:
+            return None
+        shard = self._shard(best.user_id)
+        with shard.lock:
+            if shard.waiting.get(best.user_id) is not best:
+                return self._pop_next()
+            del shard.waiting[best.user_id]
+        return best
+
+    def agent_for(self, user_id):
+        assigned = self._assigned.get(user_id)
+        return assigned[0] if assigned else None
+
+    def enqueue(self, user_id, message, since=None):
+        """
+        Note a new message from user_id, queueing their conversation unless an
+        agent already has it. Returns that agent, or None while it waits.
+        """
+        self.ensure_fresh()
+        agent_id = self.agent_for(user_id)
+        if agent_id is not None:
+            return agent_id
+        self._add(user_id, since or datetime.utcnow(), classify(message))
+        self.dispatch()
+        agent_id = self.agent_for(user_id)
+        if agent_id is None:
+            socketio.emit('support_queue', self.metrics(), to='role_admin')
+        return agent_id
+
+    # ---- agents ----
+    def _pick_agent(self):
+        # Fewest open conversations first, then whoever has waited longest for one
+        candidates = [a for a in self._agents.values() if a.online and len(a.active) < a.capacity]
+        return min(candidates, key=lambda a: (len(a.active), a.last_assigned), default=None)
+
+    def agent_online(self, agent_id, name, sid, capacity=None):
+        self.ensure_fresh()
+        with self._dispatch_lock:
+            agent = self._agents.get(agent_id)
+            if agent is None:
+                agent = self._agents[agent_id] = Agent(agent_id, name, self.capacity)
+                for user_id, (owner, _, _) in self._assigned.items():
+                    if owner == agent_id:
+                        agent.active.add(user_id)
+            if capacity is not None:
+                agent.capacity = max(0, min(int(capacity), self.capacity))
+            was_online = agent.online
+            agent.available = True
+            agent.sids.add(sid)
+        self._ensure_sweeper()
+        if not was_online:
+            self._announce(agent)
+        self.dispatch()
+
+    def agent_connected(self, agent_id, sid):
+        """A new connection from an agent who is still available, e.g. after a reload."""
+        agent = self._agents.get(agent_id)
+        if agent is not None and agent.available:
+            self.agent_online(agent_id, agent.name, sid)
+
+    def agent_offline(self, agent_id, sid=None, release=False):
+        """
+        Drop one of the agent's connections (all of them when sid is None).
+        With release, the agent's open conversations go back to the queue
+        with their original wait times.
+        """
+        with self._dispatch_lock:
+            agent = self._agents.get(agent_id)
+            if agent is None:
+                return
+            was_online = agent.online
+            if sid is None:
+                agent.available = False
+                agent.sids.clear()
+            else:
+                agent.sids.discard(sid)
+            released = self._release(agent) if release and not agent.online else []
+        if was_online and not agent.online:
+            self._announce(agent, released)
+        if released:
+            self.dispatch()
+
+    def _release(self, agent):
+        users = list(agent.active)
+        if not users:
+            return []
+        ChatMessage.query.filter(
+            ChatMessage.user_id.in_(users), ChatMessage.support_agent_id == agent.user_id,
+            ChatMessage.is_read.is_(False),
+        ).update({ChatMessage.support_agent_id: None}, synchronize_session=False)
+        db.session.commit()
+        for user_id in users:
+            _, since, priority = self._assigned.pop(user_id, (None, datetime.utcnow(), NORMAL))
+            self._add(user_id, since, priority)
+        agent.active.clear()
+        return users
+
+    def _announce(self, agent, released=()):
+        # Only the admins and the users this agent is serving care about their status
+        status = agent.to_dict()
+        socketio.emit('agent_status', status, to='role_admin')
+        for user_id in agent.active:
+            socketio.emit('agent_status', {'agent_id': agent.user_id, 'online': agent.online}, to=f"chat_{user_id}")
+        for user_id in released:
+            socketio.emit('support_waiting', {'user_id': user_id}, to=f"chat_{user_id}")
+
+    # ---- assignment ----
+    def _claim(self, user_id, agent_id):
+        # Zero rows means the conversation was resolved, or another process took it
+        return ChatMessage.query.filter(
+            ChatMessage.user_id == user_id, ChatMessage.support_agent_id.is_(None),
+            ChatMessage.is_read.is_(False),
+        ).update({ChatMessage.support_agent_id: agent_id}, synchronize_session=False)
+
+    def dispatch(self):
+        """Hand waiting conversations to the least-loaded online agents here."""
+        assigned = []
+        with self._dispatch_lock:
+            while True:
+                agent = self._pick_agent()
+                if agent is None:
+                    break
+                entry = self._pop_next()
+                if entry is None:
+                    break
+                if not self._claim(entry.user_id, agent.user_id):
+                    continue
+                now = datetime.utcnow()
+                agent.active.add(entry.user_id)
+                agent.last_assigned = now
+                self._assigned[entry.user_id] = (agent.user_id, entry.since, entry.priority)
+                waited = (now - entry.since).total_seconds()
+                self._waits.append(waited)
+                self._assignments += 1
+                assigned.append((entry, agent, waited))
+
+            for entry, agent, waited in assigned:
+                user = db.session.get(User, entry.user_id)
+                queue_push(f"user_{agent.user_id}", 'support_assigned', {
+                    'user_id': entry.user_id, 'name': user.name if user else None,
+                    'priority': PRIORITY_NAMES[entry.priority], 'waited': round(waited, 1),
+                })
+                queue_push(f"chat_{entry.user_id}", 'support_agent', {
+                    'agent_id': agent.user_id, 'name': agent.name, 'online': True,
+                })
+            if assigned:
+                queue_push('role_admin', 'support_queue', self.metrics())
+            db.session.commit()
+        return [(entry.user_id, agent.user_id) for entry, agent, _ in assigned]
+
+    def resolve(self, user_id, agent_id=None):
+        """Close the user's conversation (by its agent, or any admin when agent_id is None)."""
+        query = ChatMessage.query.filter(ChatMessage.user_id == user_id, ChatMessage.is_read.is_(False))
+        if agent_id is not None:
+            query = query.filter(ChatMessage.support_agent_id == agent_id)
+        closed = query.update({ChatMessage.is_read: True}, synchronize_session=False)
+        if agent_id is not None and not closed:
+            db.session.rollback()
+            return 0
+        with self._dispatch_lock:
+            self._discard(user_id)
+            owner = self._assigned.pop(user_id, (None,))[0]
+            if owner in self._agents:
+                self._agents[owner].active.discard(user_id)
+            queue_push(f"chat_{user_id}", 'support_resolved', {'user_id': user_id})
+            queue_push('role_admin', 'support_queue', self.metrics())
+            db.session.commit()
+        self.dispatch()
+        return closed
+
+    # ---- state from the database ----
+    def rebuild(self):
+        """Reload open conversations; agents' connections are kept."""
+        rows = (
+            db.session.query(ChatMessage.user_id, ChatMessage.support_agent_id, func.min(ChatMessage.timestamp))
+            .filter(ChatMessage.is_read.is_(False))
+            .group_by(ChatMessage.user_id, ChatMessage.support_agent_id)
+            .all()
+        )
+        # Priorities only live in memory; keep the ones this process has seen
+        priorities = {user_id: priority for user_id, (_, _, priority) in self._assigned.items()}
+        for shard in self._shards:
+            with shard.lock:
+                priorities.update((user_id, entry.priority) for user_id, entry in shard.waiting.items())
+
+        waiting, assigned = {}, {}
+        for user_id, agent_id, since in rows:
+            since = since or datetime.utcnow()
+            if agent_id is None:
+                waiting[user_id] = min(since, waiting.get(user_id, since))
+            else:
+                assigned[user_id] = (agent_id, since, priorities.get(user_id, NORMAL))
+
+        shards = [Shard() for _ in self._shards]
+        for user_id, since in waiting.items():
+            if user_id in assigned:
+                continue  # new messages of a claimed conversation; the agent already has it
+            priority = priorities.get(user_id, NORMAL)
+            shard = shards[user_id % len(shards)]
+            key = self._key(since, priority)
+            shard.waiting[user_id] = Waiting(user_id, since, priority, key)
+            shard.heap.append((key, next(self._seq), user_id))
+        for shard in shards:
+            heapq.heapify(shard.heap)
+
+        with self._dispatch_lock:
+            for agent in self._agents.values():
+                agent.active = {u for u, (owner, _, _) in assigned.items() if owner == agent.user_id}
+            self._shards, self._assigned = shards, assigned
+            self._built_at = datetime.utcnow()
+        logger.debug(f"Support queue rebuilt: {len(self)} waiting, {len(assigned)} assigned")
+
+    def ensure_fresh(self):
+        if self._built_at is None or (datetime.utcnow() - self._built_at).total_seconds() > self.refresh:
+            self.rebuild()
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None or self.app is None:
+            return
+        with self._dispatch_lock:
+            if self._sweeper is None:
+                self._sweeper = socketio.start_background_task(self._sweep)
+
+    def _sweep(self):
+        # Conversations queued by other processes reach this one's agents here
+        while True:
+            socketio.sleep(self.refresh)
+            if not any(agent.online for agent in self._agents.values()):
+                continue
+            with self.app.app_context():
+                try:
+                    self.rebuild()
+                    self.dispatch()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Support queue sweep failed: {e}", exc_info=True)
+                finally:
+                    db.session.remove()
+
+    # ---- reporting ----
+    def __len__(self):
+        return sum(len(shard.waiting) for shard in self._shards)
+
+    def waiting(self, limit=50):
+        """Waiting conversations in the order they will be assigned."""
+        entries = []
+        for shard in self._shards:
+            with shard.lock:
+                entries.extend(shard.waiting.values())
+        now = datetime.utcnow()
+        return [{'user_id': e.user_id, 'priority': PRIORITY_NAMES[e.priority],
+                 'since': e.since, 'waiting': (now - e.since).total_seconds()}
+                for e in heapq.nsmallest(limit, entries, key=lambda e: e.key)]
+
+    def agent(self, agent_id):
+        agent = self._agents.get(agent_id)
+        return agent.to_dict() if agent is not None else None
+
+    def agents(self):
+        return sorted((agent.to_dict() for agent in self._agents.values()),
+                      key=lambda a: (not a['online'], a['name'] or ''))
+
+    def assigned(self):
+        return {user_id: agent_id for user_id, (agent_id, _, _) in self._assigned.items()}
+
+    def metrics(self):
+        now = datetime.utcnow()
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        oldest = None
+        for shard in self._shards:
+            with shard.lock:
+                for entry in shard.waiting.values():
+                    depth[PRIORITY_NAMES[entry.priority]] += 1
+                    if oldest is None or entry.since < oldest:
+                        oldest = entry.since
+        waits = sorted(self._waits)
+        online = [agent for agent in self._agents.values() if agent.online]
+        return {
+            'depth': sum(depth.values()),
+            'depth_by_priority': depth,
+            'oldest_wait': round((now - oldest).total_seconds(), 1) if oldest else 0,
+            'wait_avg': round(sum(waits) / len(waits), 1) if waits else None,
+            'wait_p50': _percentile(waits, 0.5),
+            'wait_p90': _percentile(waits, 0.9),
+            'assignments': self._assignments,
+            'open': len(self._assigned),
+            'agents_online': len(online),
+            'capacity': sum(agent.capacity for agent in online),
+            'load': sum(len(agent.active) for agent in online),
+        }
+
+
+support_queue = SupportQueue()
+
+
+def init_app(app):
+    support_queue.init_app(app)
@@ -0,0 +1,60 @@
+import logging
+import os
+import time
+
+import click
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+from jinja2.utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_EXTENSIONS = ('.html',)
+
+
+def template_names(app):
+    """Every page template from the app and its blueprints."""
+    return sorted(name for name in app.jinja_env.list_templates()
+                  if name.endswith(TEMPLATE_EXTENSIONS))
+
+
+def compile_templates(app):
+    """
+    Load every template so it is compiled into the environment's in-memory
+    cache and, when a bytecode cache is configured, written to disk for other
+    workers. Returns (compiled_count, {name: error}).
+    """
+    errors = {}
+    compiled = 0
+    for name in template_names(app):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateSyntaxError as e:
+            errors[name] = f"line {e.lineno}: {e.message}"
+    return compiled, errors
+
+
+def init_app(app):
+    """
+    Production template mode: a filesystem bytecode cache shared by every
+    worker on the host and no per-render mtime checks. Auto-reload still
+    follows debug unless TEMPLATES_AUTO_RELOAD is set explicitly.
+    """
+    env = app.jinja_env
+    cache_dir = app.config['TEMPLATE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(cache_dir, '__homehub_%s.cache')
+    if app.config.get('TEMPLATES_AUTO_RELOAD') is None:
+        env.auto_reload = app.debug
+    # Room for every template, so warmed ones are never evicted (Jinja's default keeps 400)
+    env.cache = LRUCache(max(400, len(template_names(app)) + 50))
+
+    # CLI commands (flask db upgrade, flask worker) build the app too but
+    # render nothing, so only servers pay for the warmup
+    if app.config['TEMPLATE_WARMUP'] and not app.debug and click.get_current_context(silent=True) is None:
+        start = time.perf_counter()
+        compiled, errors = compile_templates(app)
+        for name, error in errors.items():
+            logger.error(f"Template {name} failed to compile: {error}")
+        logger.info(f"Warmed {compiled} template(s) in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,92 @@
+"""
+Measure cold start.
+
+    python startup_profile.py importtime [--top 25]   # python -X importtime, summarized
+    python startup_profile.py bench [--runs 5]        # import vs create_app() timings
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BUILD = "from app import create_app; create_app()"
+BENCH = (
+    "import time; t0 = time.perf_counter(); import app; t1 = time.perf_counter(); "
+    "app.create_app(); t2 = time.perf_counter(); print(t1 - t0, t2 - t1)"
+)
+
+
+def _run(args):
+    return subprocess.run([sys.executable, *args], cwd=HERE, capture_output=True, text=True)
+
+
+def parse_importtime(stderr):
+    """Rows of (self_us, cumulative_us, module) from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            rows.append((int(self_us), int(cumulative_us), name.strip()))
+        except ValueError:
+            continue
+    return rows
+
+
+def importtime_report(top=25):
+    result = _run(['-X', 'importtime', '-c', BUILD])
+    if result.returncode != 0:
+        sys.exit(result.stderr[-2000:])
+    rows = parse_importtime(result.stderr)
+
+    by_package = defaultdict(int)
+    for self_us, _, name in rows:
+        by_package[name.split('.')[0]] += self_us
+
+    total = sum(self_us for self_us, _, _ in rows)
+    print(f"{len(rows)} modules imported, {total / 1000:.0f} ms self time\n")
+    print(f"{'package':<32}{'self ms':>10}{'share':>8}")
+    for package, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"{package:<32}{us / 1000:>10.1f}{us / total:>8.1%}")
+
+    print(f"\n{'slowest modules (cumulative)':<48}{'ms':>8}")
+    for _, cumulative_us, name in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"{name:<48}{cumulative_us / 1000:>8.1f}")
+
+
+def bench(runs=5):
+    imports, builds = [], []
+    for _ in range(runs):
+        result = _run(['-c', BENCH])
+        if result.returncode != 0:
+            sys.exit(result.stderr[-2000:])
+        import_s, build_s = map(float, result.stdout.strip().splitlines()[-1].split())
+        imports.append(import_s)
+        builds.append(build_s)
+
+    for label, samples in (('import app', imports), ('create_app()', builds),
+                           ('total', [a + b for a, b in zip(imports, builds)])):
+        print(f"{label:<14} median {statistics.median(samples) * 1000:7.1f} ms"
+              f"   min {min(samples) * 1000:7.1f} ms   max {max(samples) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('importtime')
+    p_import.add_argument('--top', type=int, default=25)
+    p_bench = sub.add_parser('bench')
+    p_bench.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'importtime':
+        importtime_report(args.top)
+    else:
+        bench(args.runs)
@@ -0,0 +1,310 @@
+// Landing page: chat widget, FAQ, animations and the property map.
+// Per-user values come from window.HOMEHUB_USER, set inline by index.html.
+
+// Property view function
+function viewProperty(id) {
+  window.location.href = "/houses/view/" + id;
+}
+
+// Chat toggle function
+function toggleChat() {
+  var chatWindow = document.getElementById("chat-window");
+  chatWindow.classList.toggle("active");
+}
+
+// Send quick reply
+function sendQuickReply(message) {
+  document.getElementById("message_input").value = message;
+  document.getElementById("chat-form").dispatchEvent(new Event('submit'));
+}
+
+// FAQ Accordion
+document.addEventListener('DOMContentLoaded', function() {
+  const faqQuestions = document.querySelectorAll('.faq-question');
+
+  faqQuestions.forEach(question => {
+    question.addEventListener('click', () => {
+      const answer = question.nextElementSibling;
+      const icon = question.querySelector('i');
+
+      // Toggle active class
+      question.classList.toggle('active');
+      answer.classList.toggle('active');
+
+      // Rotate icon
+      if (question.classList.contains('active')) {
+        icon.style.transform = 'rotate(180deg)';
+      } else {
+        icon.style.transform = 'rotate(0)';
+      }
+
+      // Close other answers in the same category
+      const category = question.closest('.faq-category');
+      const otherQuestions = category.querySelectorAll('.faq-question');
+
+      otherQuestions.forEach(otherQuestion => {
+        if (otherQuestion !== question) {
+          const otherAnswer = otherQuestion.nextElementSibling;
+          const otherIcon = otherQuestion.querySelector('i');
+
+          otherQuestion.classList.remove('active');
+          otherAnswer.classList.remove('active');
+          otherIcon.style.transform = 'rotate(0)';
+        }
+      });
+    });
+  });
+
+  // Property filters
+  const filterBtns = document.querySelectorAll('.filter-btn');
+  const propertyCards = document.querySelectorAll('.property-card');
+
+  filterBtns.forEach(btn => {
+    btn.addEventListener('click', () => {
+      // Update active button
+      filterBtns.forEach(b => b.classList.remove('active'));
+      btn.classList.add('active');
+
+      const filter = btn.getAttribute('data-filter');
+
+      // Filter properties
+      propertyCards.forEach(card => {
+        if (filter === 'all') {
+          card.style.display = 'block';
+        } else if (filter === 'featured') {
+          if (card.querySelector('.featured')) {
+            card.style.display = 'block';
+          } else {
+            card.style.display = 'none';
+          }
+        } else {
+          const propertyType = card.getAttribute('data-property-type');
+          if (propertyType === filter) {
+            card.style.display = 'block';
+          } else {
+            card.style.display = 'none';
+          }
+        }
+      });
+    });
+  });
+
+  // Animated counter for stats
+  const statNumbers = document.querySelectorAll('.stat-number');
+
+  const animateValue = (element, start, end, duration) => {
+    let startTimestamp = null;
+    const step = (timestamp) => {
+      if (!startTimestamp) startTimestamp = timestamp;
+      const progress = Math.min((timestamp - startTimestamp) / duration, 1);
+      const value = Math.floor(progress * (end - start) + start);
+      element.textContent = value.toLocaleString();
+      if (progress < 1) {
+        window.requestAnimationFrame(step);
+      }
+    };
+    window.requestAnimationFrame(step);
+  };
+
+  // Intersection Observer for triggering animations
+  const observerOptions = {
+    threshold: 0.5,
+    rootMargin: '0px 0px -100px 0px'
+  };
+
+  const observer = new IntersectionObserver((entries) => {
+    entries.forEach(entry => {
+      if (entry.isIntersecting) {
+        const target = entry.target;
+        const endValue = parseInt(target.getAttribute('data-target'));
+        animateValue(target, 0, endValue, 2000);
+        observer.unobserve(target);
+      }
+    });
+  }, observerOptions);
+
+  statNumbers.forEach(stat => {
+    observer.observe(stat);
+  });
+
+  // Testimonial slider
+  const testimonialSlider = document.querySelector('.testimonials-slider');
+  const testimonialCards = document.querySelectorAll('.testimonial-card');
+  const prevBtn = document.querySelector('.testimonial-prev');
+  const nextBtn = document.querySelector('.testimonial-next');
+
+  let currentIndex = 0;
+  const cardWidth = testimonialCards[0].offsetWidth + 20; // width + margin
+
+  const updateSliderPosition = () => {
+    testimonialSlider.style.transform = `translateX(-${currentIndex * cardWidth}px)`;
+  };
+
+  prevBtn.addEventListener('click', () => {
+    if (currentIndex > 0) {
+      currentIndex--;
+      updateSliderPosition();
+    }
+  });
+
+  nextBtn.addEventListener('click', () => {
+    if (currentIndex < testimonialCards.length - 1) {
+      currentIndex++;
+      updateSliderPosition();
+    }
+  });
+
+  // Enhanced Chat Functionality
+  const socket = io();
+  const form = document.getElementById('chat-form');
+  const input = document.getElementById('message_input');
+  const messages = document.getElementById('messages');
+  const statusIndicator = document.getElementById('status-indicator');
+  const agentStatus = document.getElementById('agent-status');
+
+  // Connection status
+  socket.on('connect', function() {
+    console.log('Connected to Socket.IO');
+    statusIndicator.textContent = 'Online';
+    statusIndicator.style.color = '#4CAF50';
+    agentStatus.textContent = '(Online)';
+  });
+
+  socket.on('disconnect', function() {
+    statusIndicator.textContent = 'Offline';
+    statusIndicator.style.color = '#F44336';
+    agentStatus.textContent = '(Offline)';
+  });
+
+  // Agent status update
+  socket.on('agent_status', function(data) {
+    if (data.online) {
+      statusIndicator.textContent = 'Online';
+      statusIndicator.style.color = '#4CAF50';
+      agentStatus.textContent = '(Online)';
+    } else {
+      statusIndicator.textContent = 'Offline';
+      statusIndicator.style.color = '#F44336';
+      agentStatus.textContent = '(Offline)';
+    }
+  });
+
+  // Receive message
+  socket.on('message', function(data) {
+    const item = document.createElement('li');
+    item.classList.add('chat-message');
+
+    if (data.name === HOMEHUB_USER.name) {
+      item.classList.add('sent');
+      item.innerHTML = `
+        <div class="message-content">
+          <p>${data.message}</p>
+          <span class="message-time">${new Date(data.timestamp).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'})}</span>
+        </div>
+      `;
+    } else {
+      item.classList.add('received');
+      item.innerHTML = `
+        <div class="message-avatar">
+          <i class="fas fa-user-circle"></i>
+        </div>
+        <div class="message-content">
+          <div class="message-sender">${data.name}</div>
+          <p>${data.message}</p>
+          <span class="message-time">${new Date(data.timestamp).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'})}</span>
+        </div>
+      `;
+    }
+
+    messages.appendChild(item);
+    messages.scrollTop = messages.scrollHeight;
+
+    // Notification
+    if (!document.hasFocus()) {
+      new Notification('New message from support', { body: data.message.substring(0, 50) + '...' });
+    }
+  });
+
+  // Send message
+  form.addEventListener('submit', function(e) {
+    e.preventDefault();
+    if (input.value.trim() !== '') {
+      const messageData = {
+        client_id: (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : Date.now() + '-' + Math.random(),
+        message: input.value,
+        name: HOMEHUB_USER.name,
+        role: HOMEHUB_USER.role,
+        timestamp: new Date().toISOString()
+      };
+      socket.emit('message', messageData);
+      input.value = '';
+    }
+  });
+
+  // Request permission for notifications
+  if (Notification.permission === 'default') {
+    Notification.requestPermission();
+  }
+
+  // Load chat history on open
+  socket.emit('load_history', { user_id: HOMEHUB_USER.id });
+
+  // Error handling
+  socket.on('error', function(data) {
+    console.error('Chat error:', data);
+    alert('An error occurred: ' + data.message);
+  });
+
+  // Rate limiting feedback
+  socket.on('rate_limit', function() {
+    alert('Please wait before sending another message.');
+  });
+});
+
+// Initialize map
+var map = L.map("map").setView([-1.2921, 36.8219], 6); // Centered on Kenya
+
+L.tileLayer("https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png", {
+  attribution:
+    '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors',
+}).addTo(map);
+
+// Add markers for major cities
+const cities = {
+  nairobi: { coords: [-1.2921, 36.8219], name: "Nairobi", properties: 1250 },
+  mombasa: { coords: [-4.0435, 39.6682], name: "Mombasa", properties: 850 },
+  kisumu: { coords: [-0.0917, 34.768], name: "Kisumu", properties: 420 },
+  nakuru: { coords: [-0.3031, 36.0699], name: "Nakuru", properties: 380 },
+  eldoret: { coords: [0.5143, 35.2698], name: "Eldoret", properties: 290 },
+};
+
+// Add city markers
+Object.keys(cities).forEach((cityKey) => {
+  const city = cities[cityKey];
+  const marker = L.marker(city.coords).addTo(map);
+  marker.bindPopup(
+    `<b>${city.name}</b><br>${city.properties} properties available`
+  );
+});
+
+// Map control buttons
+document.querySelectorAll(".map-control-btn").forEach((btn) => {
+  btn.addEventListener("click", () => {
+    const location = btn.getAttribute("data-location");
+    if (cities[location]) {
+      map.setView(cities[location].coords, 12);
+      // Open popup for selected city
+      map.eachLayer((layer) => {
+        if (layer instanceof L.Marker) {
+          const latLng = layer.getLatLng();
+          if (
+            latLng.lat === cities[location].coords[0] &&
+            latLng.lng === cities[location].coords[1]
+          ) {
+            layer.openPopup();
+          }
+        }
+      });
+    }
+  });
+});